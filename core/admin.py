@@ -191,8 +191,8 @@ def delete_model(self, request, obj):
 
 @admin.register(AnalyticsExport)
 class AnalyticsExportAdmin(admin.ModelAdmin):
-    list_display = ('name', 'format', 'date_range', 'file_path', 'created_at', 'download_link', 'is_active')
-    list_filter = ('format', 'created_at', 'is_active')
+    list_display = ('name', 'format', 'data_type', 'status', 'date_range', 'file_path', 'created_at', 'download_link', 'is_active')
+    list_filter = ('format', 'data_type', 'status', 'created_at', 'is_active')
     search_fields = ('name', 'file_path')
     date_hierarchy = 'created_at'
     list_editable = ('is_active',)
@@ -208,7 +208,7 @@ def get_queryset(self, request):
 
     def date_range(self, obj):
         try:
-            return f"{obj.date_range_start} to {obj.date_range_end}"
+            return f"{obj.date_range_start or '-'} to {obj.date_range_end or '-'}"
         except Exception:
             return '-'
     date_range.short_description = 'Date Range'
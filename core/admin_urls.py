@@ -17,8 +17,11 @@
     # Export URLs
     path('export/cookies/', staff_member_required(admin_views.export_cookies), name='export_cookies'),
     path('export/sessions/', staff_member_required(admin_views.export_sessions), name='export_sessions'),
+    path('export/pageviews/', staff_member_required(admin_views.export_pageviews), name='export_pageviews'),
     path('export/seo/', staff_member_required(admin_views.export_seo), name='export_seo'),
     path('export/', staff_member_required(admin_views.export_data), name='export_data'),
+    path('export/request/', staff_member_required(admin_views.request_export), name='request_export'),
+    path('exports/<int:pk>/download/', staff_member_required(admin_views.download_export), name='download_export'),
     
     # Auth debug URL
     path('auth-debug/', staff_member_required(auth_views.auth_debug_view), name='auth_debug'),
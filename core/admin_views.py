@@ -1,29 +1,46 @@
 from django.contrib.admin.views.decorators import staff_member_required
-from django.shortcuts import render
+from django.shortcuts import render, redirect, get_object_or_404
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404
+from django.views.decorators.http import require_POST
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import DatabaseError, connection
-import csv
 import json
 import logging
-from io import BytesIO
+import os
 import traceback
 
 # Configurar logger específico para admin
 logger = logging.getLogger('core.admin')
 
-# Importações condicionais para evitar erros em produção
-try:
-    import xlsxwriter
-    XLSXWRITER_AVAILABLE = True
-except ImportError:
-    XLSXWRITER_AVAILABLE = False
-    logger.warning("XlsxWriter não está disponível. Exportação Excel será desabilitada.")
-
 from .models import Cookie, Session, PageView, SEOMetrics, AnalyticsExport
+from .export_service import (
+    COOKIES_DATASET, SESSIONS_DATASET, PAGEVIEWS_DATASET, SEO_DATASET, PYARROW_AVAILABLE, XLSX_HEADER_FORMAT,
+    XLSXWRITER_AVAILABLE, ExportRange, dataset_parquet_response, dataset_sheet, datasets_parquet_response,
+    enqueue_export, parse_date_param, stream_dataset_csv, xlsx_file_response
+)
+
+from .rollup_service import (
+    active_sessions_since, has_rollups, top_pages as rollup_top_pages, traffic_totals
+)
+
+PARQUET_UNAVAILABLE_MESSAGE = "Exportação Parquet não disponível. pyarrow não está instalado."
+
+def wants_parquet(request):
+    """Verificar se o formulário pediu o formato colunar"""
+    params = request.POST if request.method == 'POST' else request.GET
+    return params.get('format') == 'parquet'
+
+def dataset_export_response(request, dataset):
+    """CSV em streaming ou Parquet, conforme o parâmetro format"""
+    export_range = ExportRange.from_request(request)
+    if wants_parquet(request):
+        if not PYARROW_AVAILABLE:
+            return HttpResponse(PARQUET_UNAVAILABLE_MESSAGE, status=503)
+        return dataset_parquet_response(dataset, export_range)
+    return stream_dataset_csv(dataset, export_range)
 
 def safe_count(queryset):
     """Conta segura de objetos com tratamento de erro"""
@@ -47,29 +64,39 @@ def safe_queryset(queryset, limit=None):
 def admin_dashboard(request):
     """Dashboard principal do admin com tratamento robusto de erros"""
     try:
-        # Estatísticas gerais com tratamento de erro
-        total_sessions = safe_count(Session.objects.filter(is_active=True))
-        total_pageviews = safe_count(PageView.objects.filter(is_active=True))
-        total_cookies = safe_count(Cookie.objects.filter(is_active=True))
+        last_24h = timezone.now() - timedelta(hours=24)
         total_seo_metrics = safe_count(SEOMetrics.objects.filter(is_active=True))
 
-        # Sessões ativas nas últimas 24 horas
-        last_24h = timezone.now() - timedelta(hours=24)
-        active_sessions = safe_count(
-            Session.objects.filter(
-                last_activity__gte=last_24h,
-                is_active=True
+        if has_rollups():
+            # Resumos pré-agregados (python manage.py aggregate_analytics)
+            totals = traffic_totals()
+            total_sessions = totals['sessions']
+            total_pageviews = totals['pageviews']
+            total_cookies = totals['cookies']
+            active_sessions = active_sessions_since(last_24h)
+            top_pages = rollup_top_pages(limit=5)
+        else:
+            # Estatísticas gerais com tratamento de erro
+            total_sessions = safe_count(Session.objects.filter(is_active=True))
+            total_pageviews = safe_count(PageView.objects.filter(is_active=True))
+            total_cookies = safe_count(Cookie.objects.filter(is_active=True))
+
+            # Sessões ativas nas últimas 24 horas
+            active_sessions = safe_count(
+                Session.objects.filter(
+                    last_activity__gte=last_24h,
+                    is_active=True
+                )
             )
-        )
 
-        # Top páginas visitadas (limitado para performance)
-        top_pages = safe_queryset(
-            PageView.objects.filter(is_active=True).values(
-                'url', 'title'
-            ).annotate(
-                total=Count('id')
-            ).order_by('-total')[:5]
-        )
+            # Top páginas visitadas (limitado para performance)
+            top_pages = safe_queryset(
+                PageView.objects.filter(is_active=True).values(
+                    'url', 'title'
+                ).annotate(
+                    total=Count('id')
+                ).order_by('-total')[:5]
+            )
 
         # Métricas SEO (limitado para performance)
         seo_metrics = safe_queryset(
@@ -191,12 +218,14 @@ def analyticsexport_list(request):
     """Lista de exports com tratamento de erro"""
     try:
         exports = safe_queryset(
-            AnalyticsExport.objects.filter(is_active=True).order_by('-created_at')[:50]
+            AnalyticsExport.objects.filter(is_active=True).select_related('user').order_by('-created_at')[:50]
         )
         return render(request, 'admin/analyticsexport_list_simple.html', {
             'exports': exports, 
             'title': 'Analytics Export',
-            'total_count': len(exports)
+            'total_count': len(exports),
+            'has_running': any(export.status in ('pending', 'processing') for export in exports),
+            'parquet_available': PYARROW_AVAILABLE,
         })
     except Exception as e:
         logger.error(f"Erro na lista de exports: {e}")
@@ -210,232 +239,136 @@ def analyticsexport_list(request):
 # Funções de Export com tratamento robusto de erros
 @staff_member_required
 def export_cookies(request):
-    """Export cookies data to CSV with error handling"""
+    """Export cookies data to CSV (streaming) or Parquet with error handling"""
     try:
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="cookies_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Name', 'Domain', 'Path', 'Secure', 'HttpOnly', 'SameSite', 'Created At', 'Session IP'])
-        
-        cookies = safe_queryset(
-            Cookie.objects.filter(is_active=True).select_related('session')
-        )
-        
-        for cookie in cookies:
-            try:
-                writer.writerow([
-                    cookie.name or '',
-                    cookie.domain or '',
-                    cookie.path or '',
-                    'Yes' if cookie.secure else 'No',
-                    'Yes' if cookie.httponly else 'No',
-                    cookie.samesite or 'N/A',
-                    cookie.created_at.strftime('%Y-%m-%d %H:%M:%S') if cookie.created_at else 'N/A',
-                    cookie.session.ip_address if cookie.session else 'N/A'
-                ])
-            except Exception as e:
-                logger.warning(f"Erro ao processar cookie {cookie.id}: {e}")
-                continue
-        
-        return response
-        
+        return dataset_export_response(request, COOKIES_DATASET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     except Exception as e:
         logger.error(f"Erro no export de cookies: {e}")
         return HttpResponse("Erro ao exportar cookies", status=500)
 
 @staff_member_required
 def export_sessions(request):
-    """Export sessions data to CSV with error handling"""
+    """Export sessions data to CSV (streaming) or Parquet with error handling"""
     try:
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="sessions_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Session Key', 'IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'User'])
-        
-        sessions = safe_queryset(
-            Session.objects.filter(is_active=True).select_related('user')
-        )
-        
-        for session in sessions:
-            try:
-                writer.writerow([
-                    session.session_key or '',
-                    session.ip_address or '',
-                    (session.user_agent[:100] if session.user_agent else '') or '',
-                    session.referrer or 'N/A',
-                    session.created_at.strftime('%Y-%m-%d %H:%M:%S') if session.created_at else 'N/A',
-                    session.last_activity.strftime('%Y-%m-%d %H:%M:%S') if session.last_activity else 'N/A',
-                    session.user.username if session.user else 'Anonymous'
-                ])
-            except Exception as e:
-                logger.warning(f"Erro ao processar sessão {session.id}: {e}")
-                continue
-        
-        return response
-        
+        return dataset_export_response(request, SESSIONS_DATASET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     except Exception as e:
         logger.error(f"Erro no export de sessões: {e}")
         return HttpResponse("Erro ao exportar sessões", status=500)
 
+@staff_member_required
+def export_pageviews(request):
+    """Export page views data to CSV (streaming) or Parquet with error handling"""
+    try:
+        return dataset_export_response(request, PAGEVIEWS_DATASET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+    except Exception as e:
+        logger.error(f"Erro no export de page views: {e}")
+        return HttpResponse("Erro ao exportar page views", status=500)
+
 @staff_member_required
 def export_seo(request):
-    """Export SEO metrics data to CSV with error handling"""
+    """Export SEO metrics data to CSV (streaming) or Parquet with error handling"""
     try:
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="seo_metrics_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'URL', 'Title', 'H1 Count', 'H2 Count', 'H3 Count', 'Image Count', 
-            'Word Count', 'Internal Links', 'External Links', 'Page Speed Score', 
-            'Mobile Friendly Score', 'Last Checked'
-        ])
-        
-        metrics = safe_queryset(SEOMetrics.objects.filter(is_active=True))
-        
-        for metric in metrics:
-            try:
-                writer.writerow([
-                    metric.url or '',
-                    metric.title or '',
-                    metric.h1_count or 0,
-                    metric.h2_count or 0,
-                    metric.h3_count or 0,
-                    metric.image_count or 0,
-                    metric.word_count or 0,
-                    metric.internal_links or 0,
-                    metric.external_links or 0,
-                    metric.page_speed_score or 'N/A',
-                    metric.mobile_friendly_score or 'N/A',
-                    metric.last_checked.strftime('%Y-%m-%d %H:%M:%S') if metric.last_checked else 'N/A'
-                ])
-            except Exception as e:
-                logger.warning(f"Erro ao processar métrica SEO {metric.id}: {e}")
-                continue
-        
-        return response
-        
+        return dataset_export_response(request, SEO_DATASET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     except Exception as e:
         logger.error(f"Erro no export de métricas SEO: {e}")
         return HttpResponse("Erro ao exportar métricas SEO", status=500)
 
 @staff_member_required
 def export_data(request):
-    """Export all data to Excel file with error handling"""
+    """Export all data to Excel file (constant memory) or Parquet zip with error handling"""
+    if wants_parquet(request):
+        if not PYARROW_AVAILABLE:
+            return HttpResponse(PARQUET_UNAVAILABLE_MESSAGE, status=503)
+        try:
+            return datasets_parquet_response(
+                'analytics_export.zip',
+                [COOKIES_DATASET, SESSIONS_DATASET, PAGEVIEWS_DATASET, SEO_DATASET],
+                ExportRange.from_request(request)
+            )
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        except Exception as e:
+            logger.error(f"Erro no export Parquet: {e}")
+            logger.error(traceback.format_exc())
+            return HttpResponse("Erro ao gerar arquivos Parquet", status=500)
+
     if not XLSXWRITER_AVAILABLE:
         return HttpResponse("Exportação Excel não disponível. XlsxWriter não está instalado.", status=503)
     
     try:
-        # Create Excel file in memory
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        
-        # Add formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#4F81BD',
-            'font_color': 'white',
-            'border': 1
-        })
-        
-        # Cookies sheet
-        cookies_worksheet = workbook.add_worksheet('Cookies')
-        cookies_headers = ['Name', 'Domain', 'Path', 'Secure', 'HttpOnly', 'SameSite', 'Created At', 'Session IP']
-        
-        for col, header in enumerate(cookies_headers):
-            cookies_worksheet.write(0, col, header, header_format)
-        
-        cookies = safe_queryset(
-            Cookie.objects.filter(is_active=True).select_related('session')
+        export_range = ExportRange.from_request(request)
+        
+        # Planilhas escritas linha a linha em arquivo temporário (constant_memory)
+        response = xlsx_file_response(
+            'analytics_export.xlsx',
+            [
+                dataset_sheet('Cookies', COOKIES_DATASET, export_range),
+                dataset_sheet('Sessions', SESSIONS_DATASET, export_range),
+                dataset_sheet('Page Views', PAGEVIEWS_DATASET, export_range),
+                dataset_sheet('SEO Metrics', SEO_DATASET, export_range),
+            ],
+            header_format=XLSX_HEADER_FORMAT
         )
-        
-        for row, cookie in enumerate(cookies, 1):
-            try:
-                cookies_worksheet.write(row, 0, cookie.name or '')
-                cookies_worksheet.write(row, 1, cookie.domain or '')
-                cookies_worksheet.write(row, 2, cookie.path or '')
-                cookies_worksheet.write(row, 3, 'Yes' if cookie.secure else 'No')
-                cookies_worksheet.write(row, 4, 'Yes' if cookie.httponly else 'No')
-                cookies_worksheet.write(row, 5, cookie.samesite or 'N/A')
-                cookies_worksheet.write(row, 6, cookie.created_at.strftime('%Y-%m-%d %H:%M:%S') if cookie.created_at else 'N/A')
-                cookies_worksheet.write(row, 7, cookie.session.ip_address if cookie.session else 'N/A')
-            except Exception as e:
-                logger.warning(f"Erro ao processar cookie {cookie.id} no Excel: {e}")
-                continue
-        
-        # Sessions sheet
-        sessions_worksheet = workbook.add_worksheet('Sessions')
-        sessions_headers = ['Session Key', 'IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'User']
-        
-        for col, header in enumerate(sessions_headers):
-            sessions_worksheet.write(0, col, header, header_format)
-        
-        sessions = safe_queryset(
-            Session.objects.filter(is_active=True).select_related('user')
-        )
-        
-        for row, session in enumerate(sessions, 1):
-            try:
-                sessions_worksheet.write(row, 0, session.session_key or '')
-                sessions_worksheet.write(row, 1, session.ip_address or '')
-                sessions_worksheet.write(row, 2, session.user_agent[:100] if session.user_agent else '')
-                sessions_worksheet.write(row, 3, session.referrer or 'N/A')
-                sessions_worksheet.write(row, 4, session.created_at.strftime('%Y-%m-%d %H:%M:%S') if session.created_at else 'N/A')
-                sessions_worksheet.write(row, 5, session.last_activity.strftime('%Y-%m-%d %H:%M:%S') if session.last_activity else 'N/A')
-                sessions_worksheet.write(row, 6, session.user.username if session.user else 'Anonymous')
-            except Exception as e:
-                logger.warning(f"Erro ao processar sessão {session.id} no Excel: {e}")
-                continue
-        
-        # SEO Metrics sheet
-        seo_worksheet = workbook.add_worksheet('SEO Metrics')
-        seo_headers = [
-            'URL', 'Title', 'H1 Count', 'H2 Count', 'H3 Count', 'Image Count', 
-            'Word Count', 'Internal Links', 'External Links', 'Page Speed Score', 
-            'Mobile Friendly Score', 'Last Checked'
-        ]
-        
-        for col, header in enumerate(seo_headers):
-            seo_worksheet.write(0, col, header, header_format)
-        
-        metrics = safe_queryset(SEOMetrics.objects.filter(is_active=True))
-        
-        for row, metric in enumerate(metrics, 1):
-            try:
-                seo_worksheet.write(row, 0, metric.url or '')
-                seo_worksheet.write(row, 1, metric.title or '')
-                seo_worksheet.write(row, 2, metric.h1_count or 0)
-                seo_worksheet.write(row, 3, metric.h2_count or 0)
-                seo_worksheet.write(row, 4, metric.h3_count or 0)
-                seo_worksheet.write(row, 5, metric.image_count or 0)
-                seo_worksheet.write(row, 6, metric.word_count or 0)
-                seo_worksheet.write(row, 7, metric.internal_links or 0)
-                seo_worksheet.write(row, 8, metric.external_links or 0)
-                seo_worksheet.write(row, 9, metric.page_speed_score or 'N/A')
-                seo_worksheet.write(row, 10, metric.mobile_friendly_score or 'N/A')
-                seo_worksheet.write(row, 11, metric.last_checked.strftime('%Y-%m-%d %H:%M:%S') if metric.last_checked else 'N/A')
-            except Exception as e:
-                logger.warning(f"Erro ao processar métrica SEO {metric.id} no Excel: {e}")
-                continue
-        
-        workbook.close()
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename="analytics_export.xlsx"'
-        
+        export_range.commit([COOKIES_DATASET, SESSIONS_DATASET, PAGEVIEWS_DATASET, SEO_DATASET])
         return response
         
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     except Exception as e:
         logger.error(f"Erro no export Excel: {e}")
         logger.error(traceback.format_exc())
         return HttpResponse("Erro ao gerar arquivo Excel", status=500)
 
+@staff_member_required
+@require_POST
+def request_export(request):
+    """Enfileirar export para o worker (python manage.py process_exports)"""
+    try:
+        # Datas malformadas são recusadas antes de criar o AnalyticsExport
+        enqueue_export(
+            request.user,
+            data_type=request.POST.get('type', 'all'),
+            export_format=request.POST.get('format', 'csv'),
+            date_range_start=parse_date_param(request.POST.get('date_from')),
+            date_range_end=parse_date_param(request.POST.get('date_to')),
+            incremental=request.POST.get('since_last', '').lower() in ('1', 'true', 'on'),
+        )
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar export: {e}")
+        return HttpResponse("Erro ao enfileirar export", status=500)
+
+    return redirect('core_admin:analyticsexport_list')
+
+@staff_member_required
+def download_export(request, pk):
+    """Download do arquivo gerado por um export em segundo plano (só o dono ou superusuário)"""
+    exports = AnalyticsExport.objects.filter(is_active=True)
+    if not request.user.is_superuser:
+        exports = exports.filter(user=request.user)
+    export = get_object_or_404(exports, pk=pk)
+    if export.status != 'completed' or not export.file_path:
+        raise Http404("Export ainda não disponível")
+
+    try:
+        return FileResponse(
+            export.file_path.open('rb'),
+            as_attachment=True,
+            filename=os.path.basename(export.file_path.name)
+        )
+    except FileNotFoundError:
+        logger.error(f"Arquivo do export {pk} não encontrado: {export.file_path.name}")
+        raise Http404("Arquivo não encontrado")
+
 @staff_member_required
 def test_view(request):
     """View de teste simples com tratamento de erro"""
@@ -0,0 +1,126 @@
+"""
+Buffer de gravação em lote por processo
+Os itens ficam em memória e uma thread de fundo os entrega ao `writer` quando o
+buffer atinge `flush_size`, a cada `flush_interval` segundos e ao encerrar
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Callable, List
+
+from django.db import connection
+
+logger = logging.getLogger('core')
+
+
+class BatchBuffer:
+    """
+    `record` só adiciona à fila (sem acesso ao banco); se o banco ficar
+    indisponível a fila é limitada a `max_buffer` e os itens mais antigos
+    são descartados. Um lote que falha ao gravar (ex.: "database is locked")
+    volta para a fila e é tentado de novo nos próximos flushes, até
+    `max_retries` falhas seguidas; o `writer` deve ser atômico.
+    """
+
+    def __init__(self, writer: Callable[[List[Any]], Any], name: str,
+                 flush_size: int = 200, flush_interval: float = 5.0, max_buffer: int = 10000,
+                 max_retries: int = 5):
+        self.writer = writer
+        self.name = name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+        self._failures = 0
+        self._items = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+        atexit.register(self._flush_on_exit)
+
+    def record(self, item: Any) -> None:
+        with self._lock:
+            if len(self._items) == self.max_buffer:
+                self.dropped += 1
+            self._items.append(item)
+            full = len(self._items) >= self.flush_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self) -> None:
+        # Após o fork do gunicorn cada worker inicia a própria thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def drain(self) -> List[Any]:
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+    def requeue(self, items: List[Any]) -> None:
+        """Devolver itens ao início da fila, mantendo o limite de `max_buffer`"""
+        with self._lock:
+            combined = items + list(self._items)
+            overflow = len(combined) - self.max_buffer
+            if overflow > 0:
+                self.dropped += overflow
+                combined = combined[overflow:]
+            self._items.clear()
+            self._items.extend(combined)
+
+    def flush(self) -> int:
+        """Gravar os itens pendentes; devolve quantos foram gravados"""
+        items = self.drain()
+        if not items:
+            return 0
+        try:
+            self.writer(items)
+        except Exception as e:
+            self._failures += 1
+            if self._failures > self.max_retries:
+                logger.error(
+                    f"Erro ao gravar {len(items)} itens ({self.name}), descartados após "
+                    f"{self._failures} tentativas: {e}"
+                )
+                self.dropped += len(items)
+                self._failures = 0
+            else:
+                logger.warning(
+                    f"Erro ao gravar {len(items)} itens ({self.name}), "
+                    f"nova tentativa {self._failures}/{self.max_retries}: {e}"
+                )
+                self.requeue(items)
+            return 0
+        self._failures = 0
+        return len(items)
+
+    def _flush_on_exit(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._items)
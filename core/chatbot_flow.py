@@ -0,0 +1,76 @@
+"""
+Fluxo de conversa do chatbot compilado em memória
+Os templates ativos viram um grafo de passos: cada passo sabe o passo seguinte
+(next_step ou step_number + 1) e os desvios por palavra-chave da resposta do
+contato (transitions). Avançar uma sessão custa apenas consultas a dicionários
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+
+from .template_renderer import compile_template
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem acentos e sem pontuação ('Orçamento!' -> 'orcamento')"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+@dataclass(frozen=True)
+class FlowStep:
+    step: int
+    template: object  # WhatsAppTemplate
+    next_step: int
+    transitions: Dict[str, int] = field(default_factory=dict)
+
+    def route(self, text: str) -> Optional[int]:
+        """Passo escolhido pela resposta: frase exata primeiro, depois a primeira palavra conhecida"""
+        if not self.transitions:
+            return None
+        normalized = normalize(text)
+        if normalized in self.transitions:
+            return self.transitions[normalized]
+        for word in normalized.split():
+            if word in self.transitions:
+                return self.transitions[word]
+        return None
+
+
+def build_flow(templates: Iterable) -> Dict[int, FlowStep]:
+    """Grafo passo -> FlowStep (primeiro template ativo de cada passo); templates já compilados"""
+    flow = {}
+    for template in templates:
+        if template.step_number in flow:
+            continue
+        compile_template(template)
+        transitions = {}
+        for keyword, step in (template.transitions or {}).items():
+            try:
+                transitions[normalize(keyword)] = int(step)
+            except (TypeError, ValueError):
+                continue
+        flow[template.step_number] = FlowStep(
+            step=template.step_number,
+            template=template,
+            next_step=template.next_step if template.next_step is not None else template.step_number + 1,
+            transitions=transitions,
+        )
+    return flow
+
+
+def next_step_for(flow: Dict[int, FlowStep], current_step: int, last_step: Optional[int], text: str) -> int:
+    """
+    Passo a responder: um desvio do último passo enviado (a pergunta que o
+    contato está respondendo) ou, sem correspondência, o passo atual.
+    """
+    if last_step is not None and last_step in flow:
+        routed = flow[last_step].route(text)
+        if routed is not None:
+            return routed
+    return current_step
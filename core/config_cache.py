@@ -0,0 +1,91 @@
+"""
+Cache por processo de configurações chave/valor
+Todas as chaves são carregadas em uma consulta e mantidas em memória por um TTL.
+A invalidação entre workers usa um marcador de versão no cache compartilhado
+(alias 'shared'); com o LocMemCache padrão ela só vale para o processo que
+salvou e os demais recarregam quando o TTL vence.
+"""
+
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Alias do cache visto por todos os workers e comandos (Redis via REDIS_URL);
+# sem ele usa-se o default, que no LocMemCache vale só para o processo
+SHARED_CACHE_ALIAS = 'shared'
+
+# Backends cujo conteúdo não é visto pelos outros processos
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_alias() -> str:
+    return SHARED_CACHE_ALIAS if SHARED_CACHE_ALIAS in settings.CACHES else 'default'
+
+
+def shared_cache():
+    """Cache compartilhado entre processos, se configurado; senão o default"""
+    return caches[shared_cache_alias()]
+
+
+def is_process_local(alias: str = None) -> bool:
+    """Indica se o cache só é visto pelo processo atual"""
+    return settings.CACHES[alias or shared_cache_alias()]['BACKEND'] in LOCAL_CACHE_BACKENDS
+
+
+class ConfigCache:
+    """
+    Snapshot local das configurações.
+    - `ttl`: tempo máximo (s) até recarregar do banco
+    - `check_interval`: frequência (s) de conferência da versão compartilhada;
+      quando outro processo salva uma configuração a versão muda e o snapshot
+      é recarregado na próxima conferência
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[str, str]]], version_key: str,
+                 ttl: float = 60, check_interval: float = 5):
+        self.loader = loader
+        self.version_key = version_key
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._values: Optional[Dict[str, str]] = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        return self.get_all().get(key, default)
+
+    def get_all(self) -> Dict[str, str]:
+        now = time.monotonic()
+        values = self._values
+        if values is None or now - self._loaded_at > self.ttl:
+            return self.load()
+        if now - self._checked_at > self.check_interval:
+            self._checked_at = now
+            if shared_cache().get(self.version_key) != self._version:
+                return self.load()
+        return values
+
+    def load(self) -> Dict[str, str]:
+        """Carregar todas as chaves em uma consulta"""
+        with self._lock:
+            # A versão é lida antes do banco: um save concorrente força nova carga depois
+            version = shared_cache().get(self.version_key)
+            values = dict(self.loader())
+            now = time.monotonic()
+            self._values, self._version = values, version
+            self._loaded_at = self._checked_at = now
+            return values
+
+    def invalidate(self) -> None:
+        """Descartar o snapshot local e sinalizar os demais processos"""
+        shared_cache().set(self.version_key, uuid.uuid4().hex, None)
+        self._values = None
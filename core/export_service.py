@@ -0,0 +1,981 @@
+"""
+Serviço de exportação de dados analíticos
+Geração em streaming com leitura em blocos do banco de dados
+"""
+
+import csv
+import io
+import json
+import logging
+import queue
+import shutil
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Cookie, Session, PageView, SEOMetrics, AnalyticsExport, ExportCheckpoint
+
+logger = logging.getLogger('core.admin')
+
+# Importações condicionais para evitar erros em produção
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+    logger.warning("XlsxWriter não está disponível. Exportação Excel será desabilitada.")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Linhas lidas por ida ao banco e bytes acumulados antes de enviar ao cliente
+EXPORT_CHUNK_SIZE = getattr(settings, 'ANALYTICS_EXPORT_CHUNK_SIZE', 2000)
+EXPORT_BUFFER_BYTES = getattr(settings, 'ANALYTICS_EXPORT_BUFFER_BYTES', 64 * 1024)
+
+# Diretório dos arquivos temporários do Excel (None = padrão do sistema)
+EXPORT_TMPDIR = getattr(settings, 'ANALYTICS_EXPORT_TMPDIR', None)
+
+# Exports em segundo plano: frequência de atualização do progresso e período padrão
+EXPORT_PROGRESS_EVERY = getattr(settings, 'ANALYTICS_EXPORT_PROGRESS_EVERY', 5000)
+EXPORT_DEFAULT_RANGE_DAYS = getattr(settings, 'ANALYTICS_EXPORT_DEFAULT_RANGE_DAYS', 30)
+# Margem do checkpoint incremental: linhas gravadas em lote (page views, logs) chegam ao
+# banco com created_at no passado; o export só avança até now - margem
+EXPORT_CHECKPOINT_MARGIN = getattr(settings, 'ANALYTICS_EXPORT_CHECKPOINT_MARGIN', 300)  # segundos
+
+# Exports em 'processing' sem heartbeat por mais que isso voltam para a fila (worker encerrado)
+EXPORT_LOCK_TIMEOUT = getattr(settings, 'ANALYTICS_EXPORT_LOCK_TIMEOUT', 900)  # segundos
+JOB_FORMATS = ('csv', 'xlsx', 'json', 'parquet')
+
+# Parquet: compressão das colunas (snappy, zstd, gzip...)
+PARQUET_COMPRESSION = getattr(settings, 'ANALYTICS_EXPORT_PARQUET_COMPRESSION', 'zstd')
+
+# Leitura paralela das tabelas no zip: blocos de linhas mantidos em fila por tabela
+EXPORT_PARALLEL_READS = getattr(settings, 'ANALYTICS_EXPORT_PARALLEL_READS', False)
+EXPORT_PREFETCH_CHUNKS = getattr(settings, 'ANALYTICS_EXPORT_PREFETCH_CHUNKS', 2)
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+XLSX_HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#4F81BD',
+    'font_color': 'white',
+    'border': 1
+}
+
+
+class Echo:
+    """Pseudo-buffer para o csv.writer: devolve a linha em vez de armazená-la"""
+
+    def write(self, value):
+        return value
+
+
+def format_datetime(value) -> str:
+    """Formatar data/hora para exportação"""
+    return value.strftime(DATETIME_FORMAT) if value else 'N/A'
+
+
+def format_bool(value) -> str:
+    """Formatar booleano como Yes/No"""
+    return 'Yes' if value else 'No'
+
+
+def start_of_day(value) -> datetime:
+    """Converter uma data para 00:00 no fuso horário atual"""
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    """Definição de uma tabela exportável: campos lidos e formatação da linha"""
+    name: str
+    model: Any
+    headers: Tuple[str, ...]
+    fields: Tuple[str, ...]
+    format_row: Callable[[tuple], List[Any]]
+    filename: str
+    date_field: str = 'created_at'
+
+    def get_queryset(self):
+        return self.model.objects.filter(is_active=True)
+
+    def filter_date_range(self, queryset, start=None, end=None):
+        """Filtrar por intervalo de datas (inclusivo) usando limites do índice de data"""
+        if start:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start_of_day(start)})
+        if end:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': start_of_day(end + timedelta(days=1))})
+        return queryset
+
+    def iter_values(self, queryset=None, chunk_size: int = None) -> Iterator[tuple]:
+        """Ler tuplas via values_list().iterator(), sem cache de modelos"""
+        queryset = self.get_queryset() if queryset is None else queryset
+        return queryset.values_list(*self.fields).iterator(
+            chunk_size=chunk_size or EXPORT_CHUNK_SIZE
+        )
+
+    def iter_record_batches(self, queryset=None, chunk_size: int = None):
+        """Ler valores brutos (sem formatação) como record batches do Arrow"""
+        queryset = self.get_queryset() if queryset is None else queryset
+        return iter_record_batches(queryset, self.fields, chunk_size)
+
+    def iter_rows(self, queryset=None, chunk_size: int = None) -> Iterator[List[Any]]:
+        """Ler e formatar linhas, ignorando as que falharem"""
+        for values in self.iter_values(queryset, chunk_size):
+            try:
+                yield self.format_row(values)
+            except Exception as e:
+                logger.warning(f"Erro ao processar linha de {self.name}: {e}")
+                continue
+
+
+def _cookie_row(values):
+    name, domain, path, secure, httponly, samesite, created_at, session_ip = values
+    return [
+        name or '',
+        domain or '',
+        path or '',
+        format_bool(secure),
+        format_bool(httponly),
+        samesite or 'N/A',
+        format_datetime(created_at),
+        session_ip or 'N/A',
+    ]
+
+
+def _session_row(values):
+    session_key, ip_address, user_agent, referrer, created_at, last_activity, username = values
+    return [
+        session_key or '',
+        ip_address or '',
+        (user_agent[:100] if user_agent else '') or '',
+        referrer or 'N/A',
+        format_datetime(created_at),
+        format_datetime(last_activity),
+        username or 'Anonymous',
+    ]
+
+
+def _pageview_row(values):
+    url, title, time_spent, created_at, session_key, ip_address = values
+    return [
+        url or '',
+        title or '',
+        int(time_spent.total_seconds()) if time_spent else 'N/A',
+        format_datetime(created_at),
+        session_key or '',
+        ip_address or 'N/A',
+    ]
+
+
+def _seo_row(values):
+    (url, title, h1_count, h2_count, h3_count, image_count, word_count,
+     internal_links, external_links, page_speed_score, mobile_friendly_score,
+     last_checked) = values
+    return [
+        url or '',
+        title or '',
+        h1_count or 0,
+        h2_count or 0,
+        h3_count or 0,
+        image_count or 0,
+        word_count or 0,
+        internal_links or 0,
+        external_links or 0,
+        page_speed_score or 'N/A',
+        mobile_friendly_score or 'N/A',
+        format_datetime(last_checked),
+    ]
+
+
+COOKIES_DATASET = ExportDataset(
+    name='cookies',
+    model=Cookie,
+    headers=('Name', 'Domain', 'Path', 'Secure', 'HttpOnly', 'SameSite', 'Created At', 'Session IP'),
+    fields=('name', 'domain', 'path', 'secure', 'httponly', 'samesite', 'created_at', 'session__ip_address'),
+    format_row=_cookie_row,
+    filename='cookies_export.csv',
+)
+
+SESSIONS_DATASET = ExportDataset(
+    name='sessions',
+    model=Session,
+    headers=('Session Key', 'IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'User'),
+    fields=('session_key', 'ip_address', 'user_agent', 'referrer', 'created_at', 'last_activity', 'user__username'),
+    format_row=_session_row,
+    filename='sessions_export.csv',
+)
+
+PAGEVIEWS_DATASET = ExportDataset(
+    name='pageviews',
+    model=PageView,
+    headers=('URL', 'Title', 'Time Spent (s)', 'Created At', 'Session Key', 'Session IP'),
+    fields=('url', 'title', 'time_spent', 'created_at', 'session__session_key', 'session__ip_address'),
+    format_row=_pageview_row,
+    filename='pageviews_export.csv',
+)
+
+SEO_DATASET = ExportDataset(
+    name='seo',
+    model=SEOMetrics,
+    headers=(
+        'URL', 'Title', 'H1 Count', 'H2 Count', 'H3 Count', 'Image Count',
+        'Word Count', 'Internal Links', 'External Links', 'Page Speed Score',
+        'Mobile Friendly Score', 'Last Checked'
+    ),
+    fields=(
+        'url', 'title', 'h1_count', 'h2_count', 'h3_count', 'image_count',
+        'word_count', 'internal_links', 'external_links', 'page_speed_score',
+        'mobile_friendly_score', 'last_checked'
+    ),
+    format_row=_seo_row,
+    filename='seo_metrics_export.csv',
+    date_field='last_checked',
+)
+
+EXPORT_DATASETS = {
+    dataset.name: dataset
+    for dataset in (COOKIES_DATASET, SESSIONS_DATASET, PAGEVIEWS_DATASET, SEO_DATASET)
+}
+
+
+def parse_date_param(value: str) -> Optional[date]:
+    """Data AAAA-MM-DD de um parâmetro (None se vazio); ValueError se inválida"""
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f'Data inválida: {value}')
+    return parsed
+
+
+def checkpoint_limit() -> datetime:
+    """Fim da janela incremental: linhas mais novas ficam para o próximo export"""
+    return timezone.now() - timedelta(seconds=EXPORT_CHECKPOINT_MARGIN)
+
+
+@dataclass
+class ExportRange:
+    """
+    Janela de um export: intervalo de datas e/ou modo incremental.
+    No modo incremental apenas linhas após o checkpoint do usuário são lidas,
+    limitadas por `until` (fixado no início, EXPORT_CHECKPOINT_MARGIN no
+    passado para incluir inserções ainda em buffer) e pelo fim de `end`;
+    esse limite vira o novo checkpoint. Com checkpoint salvo, `start` só é
+    aceito se não for posterior a ele (as linhas entre os dois seriam puladas).
+    """
+    start: Optional[date] = None
+    end: Optional[date] = None
+    since_last: bool = False
+    user: Any = None
+    until: datetime = field(default_factory=checkpoint_limit)
+
+    @classmethod
+    def from_request(cls, request) -> 'ExportRange':
+        """Ler date_from, date_to e since_last de GET ou POST"""
+        params = request.POST if request.method == 'POST' else request.GET
+        return cls(
+            start=parse_date_param(params.get('date_from')),
+            end=parse_date_param(params.get('date_to')),
+            since_last=params.get('since_last', '').lower() in ('1', 'true', 'on'),
+            user=request.user,
+        )
+
+    @property
+    def limit(self) -> datetime:
+        """Fim da janela incremental: `until` ou o fim do dia `end`, o que vier antes"""
+        if self.end:
+            return min(self.until, start_of_day(self.end + timedelta(days=1)))
+        return self.until
+
+    def filter(self, dataset: ExportDataset, queryset=None):
+        """Aplicar a janela à consulta da tabela (faixa do índice de data)"""
+        queryset = dataset.get_queryset() if queryset is None else queryset
+        if not self.since_last:
+            return dataset.filter_date_range(queryset, self.start, self.end)
+
+        since = get_checkpoint(self.user, dataset.name)
+        if since:
+            if self.start and start_of_day(self.start) > since:
+                raise ValueError(
+                    f'Data inicial posterior ao último export incremental de {dataset.name} '
+                    f'({timezone.localtime(since):%d/%m/%Y %H:%M})'
+                )
+            queryset = queryset.filter(**{f'{dataset.date_field}__gt': since})
+        elif self.start:
+            queryset = queryset.filter(**{f'{dataset.date_field}__gte': start_of_day(self.start)})
+        return queryset.filter(**{f'{dataset.date_field}__lte': self.limit})
+
+    def commit(self, datasets: Iterable[ExportDataset]) -> None:
+        """Avançar os checkpoints após um export incremental concluído"""
+        if not self.since_last or not self.user:
+            return
+        for dataset in datasets:
+            save_checkpoint(self.user, dataset.name, self.limit)
+
+
+def get_checkpoint(user, data_type: str) -> Optional[datetime]:
+    """Data/hora do último export incremental da tabela para o usuário"""
+    if not user:
+        return None
+    return ExportCheckpoint.objects.filter(
+        user=user,
+        data_type=data_type
+    ).values_list('last_exported_at', flat=True).first()
+
+
+def save_checkpoint(user, data_type: str, value: datetime) -> None:
+    """
+    Avançar o checkpoint até `value`; nunca retrocede (um export com date_to
+    anterior ao checkpoint não faz o próximo repetir linhas já enviadas)
+    """
+    advanced = ExportCheckpoint.objects.filter(
+        user=user,
+        data_type=data_type,
+        last_exported_at__lt=value
+    ).update(last_exported_at=value)
+    if not advanced:
+        ExportCheckpoint.objects.get_or_create(
+            user=user,
+            data_type=data_type,
+            defaults={'last_exported_at': value}
+        )
+
+
+def on_complete(rows: Iterable[Any], callback: Callable[[], None]) -> Iterator[Any]:
+    """Repassar as linhas e chamar callback apenas se a iteração terminar sem erro"""
+    yield from rows
+    callback()
+
+
+def iter_csv(headers: Sequence[str], rows: Iterable[Sequence[Any]],
+             buffer_bytes: int = None) -> Iterator[str]:
+    """Gerar o CSV em blocos de tamanho limitado"""
+    buffer_bytes = buffer_bytes or EXPORT_BUFFER_BYTES
+    writer = csv.writer(Echo())
+    # Cabeçalho enviado de imediato, antes da primeira leitura no banco
+    yield writer.writerow(headers)
+
+    buffer = []
+    size = 0
+    try:
+        for row in rows:
+            line = writer.writerow(row)
+            buffer.append(line)
+            size += len(line)
+            if size >= buffer_bytes:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+    except Exception as e:
+        # Os headers (200) já foram enviados: propagar o erro interrompe a conexão,
+        # para o cliente não receber um CSV truncado como se estivesse completo
+        logger.error(f"Erro durante export em streaming: {e}")
+        raise
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_csv_response(filename: str, headers: Sequence[str],
+                        rows: Iterable[Sequence[Any]]) -> StreamingHttpResponse:
+    """Criar resposta CSV em streaming: o primeiro byte sai antes do fim da consulta"""
+    response = StreamingHttpResponse(
+        iter_csv(headers, rows),
+        content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Destino não pesquisável do ZipFile: guarda apenas os bytes ainda não enviados"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_PREFETCH_DONE = object()
+
+
+def _put_until_stopped(items: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class PrefetchedRows:
+    """
+    Ler as linhas em uma thread separada desde a criação, com no máximo
+    `max_chunks` blocos em memória. A consulta roda na conexão própria da thread.
+    """
+
+    def __init__(self, rows: Iterable[Any], chunk_size: int = None, max_chunks: int = None):
+        self._chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+        self._items = queue.Queue(maxsize=max_chunks or EXPORT_PREFETCH_CHUNKS)
+        self._stop = threading.Event()
+        threading.Thread(target=self._produce, args=(rows,), daemon=True).start()
+
+    def _produce(self, rows):
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self._chunk_size:
+                    if not _put_until_stopped(self._items, batch, self._stop):
+                        return
+                    batch = []
+            if batch:
+                _put_until_stopped(self._items, batch, self._stop)
+        except Exception as e:
+            _put_until_stopped(self._items, e, self._stop)
+        finally:
+            _put_until_stopped(self._items, _PREFETCH_DONE, self._stop)
+            connection.close()
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self._items.get()
+            if item is _PREFETCH_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    def close(self):
+        """Liberar a thread produtora (cliente desconectou ou export terminou)"""
+        self._stop.set()
+
+
+def iter_zip(members: Iterable[Tuple[str, Sequence[str], Iterable[Sequence[Any]]]],
+             parallel: bool = None) -> Iterator[bytes]:
+    """
+    Gerar um zip de CSVs em streaming: cada bloco comprimido é enviado assim
+    que produzido, então a memória fica limitada a um bloco por vez.
+    """
+    parallel = EXPORT_PARALLEL_READS if parallel is None else parallel
+    members = list(members)
+    if parallel:
+        members = [(arcname, headers, PrefetchedRows(rows)) for arcname, headers, rows in members]
+
+    buffer = ZipStreamBuffer()
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for arcname, headers, rows in members:
+                with zip_file.open(arcname, 'w', force_zip64=True) as member:
+                    for chunk in iter_csv(headers, rows):
+                        member.write(chunk.encode('utf-8'))
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                data = buffer.drain()
+                if data:
+                    yield data
+    finally:
+        for _, _, rows in members:
+            if hasattr(rows, 'close'):
+                rows.close()
+
+    # Diretório central do zip
+    yield buffer.drain()
+
+
+def stream_zip_response(filename: str, members, parallel: bool = None) -> StreamingHttpResponse:
+    """Criar resposta zip em streaming com um CSV por tabela"""
+    response = StreamingHttpResponse(iter_zip(members, parallel), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def stream_dataset_csv(dataset: ExportDataset, export_range: ExportRange = None) -> StreamingHttpResponse:
+    """Exportar uma tabela registrada em CSV via streaming"""
+    if export_range is None:
+        return stream_csv_response(dataset.filename, dataset.headers, dataset.iter_rows())
+
+    rows = on_complete(
+        dataset.iter_rows(export_range.filter(dataset)),
+        lambda: export_range.commit([dataset])
+    )
+    return stream_csv_response(dataset.filename, dataset.headers, rows)
+
+
+def write_xlsx(output, sheets: Iterable[Tuple[str, Sequence[str], Iterable[Sequence[Any]]]],
+               header_format: dict = None) -> None:
+    """
+    Escrever planilhas linha a linha no modo constant_memory do XlsxWriter.
+    Cada linha é descarregada em disco assim que a próxima começa, então o
+    consumo de memória não depende do número de linhas.
+    """
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'tmpdir': EXPORT_TMPDIR,
+    })
+    try:
+        cell_format = workbook.add_format(header_format) if header_format else None
+
+        for title, headers, rows in sheets:
+            worksheet = workbook.add_worksheet(title)
+            worksheet.write_row(0, 0, headers, cell_format)
+            for row_index, row in enumerate(rows, 1):
+                worksheet.write_row(row_index, 0, row)
+    finally:
+        workbook.close()
+
+
+def xlsx_file_response(filename: str, sheets, header_format: dict = None) -> FileResponse:
+    """Gerar o Excel em arquivo temporário e servir via FileResponse"""
+    # O arquivo é removido quando a resposta fecha o descritor
+    output = tempfile.TemporaryFile(suffix='.xlsx', dir=EXPORT_TMPDIR)
+    try:
+        write_xlsx(output, sheets, header_format)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def dataset_sheet(title: str, dataset: ExportDataset, export_range: ExportRange = None):
+    """Montar a tupla (título, headers, linhas) de uma tabela registrada"""
+    queryset = export_range.filter(dataset) if export_range else None
+    return title, dataset.headers, dataset.iter_rows(queryset)
+
+
+# ===== EXPORT COLUNAR (PARQUET) =====
+
+def _resolve_field(model, lookup: str):
+    """Campo do modelo correspondente a um lookup de values_list (ex: session__ip_address)"""
+    *path, name = lookup.split('__')
+    for part in path:
+        model = model._meta.get_field(part).related_model
+    field = model._meta.get_field(name)
+    return field.target_field if field.is_relation else field
+
+
+def _arrow_type(field):
+    """Tipo Arrow equivalente ao tipo do campo Django"""
+    internal_type = field.get_internal_type()
+    if internal_type == 'BooleanField':
+        return pa.bool_()
+    if internal_type.endswith('IntegerField') or internal_type.endswith('AutoField'):
+        return pa.int64()
+    if internal_type in ('FloatField', 'DecimalField'):
+        return pa.float64()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+    if internal_type == 'DateField':
+        return pa.date32()
+    if internal_type == 'DurationField':
+        return pa.duration('us')
+    return pa.string()
+
+
+def arrow_schema(model, fields: Sequence[str]):
+    """Schema Arrow das colunas lidas; `__` dos lookups vira `_` no nome da coluna"""
+    return pa.schema([
+        pa.field(lookup.replace('__', '_'), _arrow_type(_resolve_field(model, lookup)))
+        for lookup in fields
+    ])
+
+
+def _arrow_column(values: Sequence[Any], arrow_type):
+    if arrow_type == pa.string():
+        values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+    elif arrow_type == pa.float64():
+        values = [None if value is None else float(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def iter_record_batches(queryset, fields: Sequence[str], chunk_size: int = None):
+    """
+    Converter blocos de values_list() em record batches: cada bloco lido do
+    banco é transposto em colunas tipadas, sem formatar linha a linha.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    schema = arrow_schema(queryset.model, fields)
+    values = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(values, chunk_size))
+        if not chunk:
+            break
+        columns = zip(*chunk)
+        yield pa.RecordBatch.from_arrays(
+            [_arrow_column(column, schema_field.type) for column, schema_field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+def write_parquet(output, schema, batches) -> None:
+    """Escrever um arquivo Parquet batch a batch (um row group por batch)"""
+    writer = pq.ParquetWriter(output, schema, compression=PARQUET_COMPRESSION)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+    finally:
+        writer.close()
+
+
+def write_parquet_zip(output, members) -> None:
+    """
+    Várias tabelas em Parquet: um arquivo por tabela dentro do zip.
+    Cada arquivo é gerado em disco antes (o writer precisa de arquivo com tell)
+    e guardado sem recompressão, já que as colunas vêm comprimidas.
+    """
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as zip_file:
+        for arcname, schema, batches in members:
+            with tempfile.TemporaryFile(suffix='.parquet', dir=EXPORT_TMPDIR) as parquet_file:
+                write_parquet(parquet_file, schema, batches)
+                parquet_file.seek(0)
+                with zip_file.open(arcname, 'w', force_zip64=True) as member:
+                    shutil.copyfileobj(parquet_file, member, EXPORT_BUFFER_BYTES)
+
+
+def parquet_file_response(filename: str, queryset, fields: Sequence[str]) -> FileResponse:
+    """Gerar o Parquet de uma consulta em arquivo temporário e servir via FileResponse"""
+    output = tempfile.TemporaryFile(suffix='.parquet', dir=EXPORT_TMPDIR)
+    try:
+        write_parquet(output, arrow_schema(queryset.model, fields), iter_record_batches(queryset, fields))
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=PARQUET_CONTENT_TYPE
+    )
+
+
+def dataset_parquet_response(dataset: ExportDataset, export_range: ExportRange = None) -> FileResponse:
+    """Exportar uma tabela registrada em Parquet"""
+    queryset = export_range.filter(dataset) if export_range else dataset.get_queryset()
+    response = parquet_file_response(
+        dataset.filename.replace('.csv', '.parquet'),
+        queryset,
+        dataset.fields
+    )
+    if export_range:
+        export_range.commit([dataset])
+    return response
+
+
+def datasets_parquet_response(filename: str, datasets: Sequence[ExportDataset],
+                              export_range: ExportRange = None) -> FileResponse:
+    """Exportar várias tabelas registradas em um zip com um Parquet por tabela"""
+    output = tempfile.TemporaryFile(suffix='.zip', dir=EXPORT_TMPDIR)
+    try:
+        write_parquet_zip(output, [
+            (
+                f'{dataset.name}.parquet',
+                arrow_schema(dataset.model, dataset.fields),
+                dataset.iter_record_batches(export_range.filter(dataset) if export_range else None)
+            )
+            for dataset in datasets
+        ])
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    if export_range:
+        export_range.commit(datasets)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type='application/zip')
+
+
+# ===== EXPORTS EM SEGUNDO PLANO (FILA EM AnalyticsExport) =====
+
+def get_datasets(data_type: str) -> List[ExportDataset]:
+    """Tabelas incluídas em um tipo de export"""
+    if data_type == 'all':
+        return list(EXPORT_DATASETS.values())
+    if data_type not in EXPORT_DATASETS:
+        raise ValueError(f'Tipo de export inválido: {data_type}')
+    return [EXPORT_DATASETS[data_type]]
+
+
+def enqueue_export(user, data_type: str = 'all', export_format: str = 'csv',
+                   date_range_start=None, date_range_end=None, name: str = None,
+                   incremental: bool = False) -> AnalyticsExport:
+    """Registrar um export na fila; o arquivo é gerado pelo comando process_exports"""
+    if export_format not in JOB_FORMATS:
+        raise ValueError(f'Formato de export inválido: {export_format}')
+    get_datasets(data_type)
+
+    # Incremental: a janela começa no checkpoint; datas só se forem informadas
+    if not incremental:
+        date_range_end = date_range_end or timezone.localdate()
+        date_range_start = date_range_start or date_range_end - timedelta(days=EXPORT_DEFAULT_RANGE_DAYS)
+    if date_range_start and date_range_end and date_range_start > date_range_end:
+        raise ValueError('Data inicial deve ser anterior à data final')
+
+    if not name:
+        name = '_'.join([
+            data_type,
+            f'{date_range_start:%Y%m%d}' if date_range_start else 'incremental',
+            f'{date_range_end or timezone.localdate():%Y%m%d}',
+        ])
+
+    export = AnalyticsExport.objects.create(
+        name=name,
+        format=export_format,
+        data_type=data_type,
+        date_range_start=date_range_start,
+        date_range_end=date_range_end,
+        user=user,
+        status='pending',
+        incremental=incremental
+    )
+    logger.info(f"Export {export.pk} enfileirado: {data_type}/{export_format}")
+    return export
+
+
+def release_stale_exports() -> int:
+    """Devolver à fila exports presos em 'processing' (worker encerrado no meio)"""
+    cutoff = timezone.now() - timedelta(seconds=EXPORT_LOCK_TIMEOUT)
+    return AnalyticsExport.objects.filter(
+        Q(locked_at__lt=cutoff) | Q(locked_at__isnull=True, started_at__lt=cutoff),
+        status='processing',
+    ).update(status='pending', processed_rows=0)
+
+
+def claim_next_export() -> Optional[AnalyticsExport]:
+    """Reservar o export pendente mais antigo (seguro com vários workers)"""
+    candidates = AnalyticsExport.objects.filter(
+        status='pending',
+        is_active=True
+    ).order_by('created_at').values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        now = timezone.now()
+        claimed = AnalyticsExport.objects.filter(pk=pk, status='pending').update(
+            status='processing',
+            started_at=now,
+            locked_at=now
+        )
+        if claimed:
+            return AnalyticsExport.objects.get(pk=pk)
+    return None
+
+
+class ExportProgress:
+    """Contar linhas escritas e persistir o progresso a cada N linhas"""
+
+    def __init__(self, export: AnalyticsExport, every: int = None):
+        self.export = export
+        self.every = every or EXPORT_PROGRESS_EVERY
+        self.count = 0
+
+    def track(self, rows: Iterable[Any]) -> Iterator[Any]:
+        for row in rows:
+            yield row
+            self.count += 1
+            if self.count % self.every == 0:
+                self.save()
+
+    def track_batches(self, batches: Iterable[Any]) -> Iterator[Any]:
+        """Mesmo controle de progresso, contando as linhas de cada record batch"""
+        for batch in batches:
+            yield batch
+            before = self.count
+            self.count += batch.num_rows
+            if self.count // self.every > before // self.every:
+                self.save()
+
+    def save(self) -> None:
+        """Gravar o progresso e renovar o heartbeat (locked_at) do export"""
+        AnalyticsExport.objects.filter(pk=self.export.pk).update(
+            processed_rows=self.count,
+            locked_at=timezone.now()
+        )
+
+
+def write_csv(output, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+    """Escrever CSV em um arquivo binário sem acumular linhas em memória"""
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(headers)
+        writer.writerows(rows)
+        text.flush()
+    finally:
+        text.detach()
+
+
+def write_json(output, sheets, single: bool = False) -> None:
+    """Escrever JSON objeto a objeto: lista para uma tabela, dicionário para várias"""
+    text = io.TextIOWrapper(output, encoding='utf-8')
+    try:
+        if not single:
+            text.write('{')
+        for index, (title, headers, rows) in enumerate(sheets):
+            if not single:
+                text.write(('' if index == 0 else ',') + json.dumps(title) + ':')
+            text.write('[')
+            for row_index, row in enumerate(rows):
+                if row_index:
+                    text.write(',')
+                text.write(json.dumps(dict(zip(headers, row)), default=str))
+            text.write(']')
+        if not single:
+            text.write('}')
+        text.flush()
+    finally:
+        text.detach()
+
+
+def get_export_range(export: AnalyticsExport) -> ExportRange:
+    """Janela de leitura de um export enfileirado"""
+    return ExportRange(
+        start=export.date_range_start,
+        end=export.date_range_end,
+        since_last=export.incremental,
+        user=export.user,
+    )
+
+
+def write_export_file(export: AnalyticsExport, output, progress: ExportProgress,
+                      export_range: ExportRange) -> str:
+    """Gerar o arquivo do export e devolver a extensão usada"""
+    datasets = get_datasets(export.data_type)
+
+    if export.format == 'parquet':
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError('pyarrow não está instalado')
+        members = [
+            (
+                f'{dataset.name}.parquet',
+                arrow_schema(dataset.model, dataset.fields),
+                progress.track_batches(dataset.iter_record_batches(export_range.filter(dataset)))
+            )
+            for dataset in datasets
+        ]
+        if len(members) == 1:
+            _, schema, batches = members[0]
+            write_parquet(output, schema, batches)
+            return 'parquet'
+        write_parquet_zip(output, members)
+        return 'zip'
+
+    sheets = [
+        (
+            dataset.name,
+            dataset.headers,
+            progress.track(dataset.iter_rows(export_range.filter(dataset)))
+        )
+        for dataset in datasets
+    ]
+
+    if export.format == 'xlsx':
+        if not XLSXWRITER_AVAILABLE:
+            raise RuntimeError('XlsxWriter não está instalado')
+        write_xlsx(output, sheets, header_format=XLSX_HEADER_FORMAT)
+        return 'xlsx'
+
+    if export.format == 'json':
+        write_json(output, sheets, single=len(sheets) == 1)
+        return 'json'
+
+    if len(sheets) == 1:
+        _, headers, rows = sheets[0]
+        write_csv(output, headers, rows)
+        return 'csv'
+
+    # Várias tabelas em CSV: um arquivo por tabela dentro de um zip
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for title, headers, rows in sheets:
+            with zip_file.open(f'{title}.csv', 'w', force_zip64=True) as member:
+                write_csv(member, headers, rows)
+    return 'zip'
+
+
+def run_export_job(export: AnalyticsExport) -> AnalyticsExport:
+    """Executar um export reservado e salvar o arquivo em analytics_exports/"""
+    try:
+        datasets = get_datasets(export.data_type)
+        export_range = get_export_range(export)
+        total_rows = sum(export_range.filter(dataset).count() for dataset in datasets)
+        AnalyticsExport.objects.filter(pk=export.pk).update(total_rows=total_rows)
+        export.total_rows = total_rows
+
+        progress = ExportProgress(export)
+        with tempfile.TemporaryFile(dir=EXPORT_TMPDIR) as output:
+            extension = write_export_file(export, output, progress, export_range)
+            output.seek(0)
+            filename = f'{export.data_type}_{export.pk}_{timezone.now():%Y%m%d%H%M%S}.{extension}'
+            export.file_path.save(filename, File(output, name=filename), save=False)
+
+        export.status = 'completed'
+        export.processed_rows = progress.count
+        export.completed_at = timezone.now()
+        export.error_message = ''
+        export.save(update_fields=[
+            'file_path', 'status', 'processed_rows', 'completed_at', 'error_message'
+        ])
+        export_range.commit(datasets)
+        logger.info(f"Export {export.pk} concluído: {progress.count} linhas")
+
+    except Exception as e:
+        logger.error(f"Erro no export {export.pk}: {e}")
+        if export.file_path:
+            # Arquivo salvo antes da falha: não deixar órfão no storage
+            try:
+                export.file_path.delete(save=False)
+            except Exception as delete_error:
+                logger.error(f"Erro ao remover arquivo do export {export.pk}: {delete_error}")
+        export.status = 'failed'
+        export.error_message = str(e)
+        export.completed_at = timezone.now()
+        export.save(update_fields=['file_path', 'status', 'error_message', 'completed_at'])
+
+    return export
@@ -0,0 +1,60 @@
+"""
+Atualizar os resumos pré-agregados do analytics (dashboards)
+Uso: python manage.py aggregate_analytics [--days N] [--rebuild] [--interval 300]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.rollup_service import aggregate_rollups
+
+
+class Command(BaseCommand):
+    help = 'Atualizar DailyTrafficRollup, HourlyTrafficRollup e PageViewRollup de forma incremental'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=0,
+            help='Recalcular os últimos N dias (padrão: desde o último dia resumido)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recalcular todo o histórico'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Repetir a cada N segundos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        days = options['days']
+        rebuild = options['rebuild']
+
+        try:
+            while True:
+                close_old_connections()
+                start_day, day_count, hour_count = aggregate_rollups(days=days, rebuild=rebuild)
+
+                if start_day is None:
+                    self.stdout.write(self.style.WARNING('⚠ Nenhum dado de analytics para resumir'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Resumos atualizados desde {start_day}: {day_count} dia(s), {hour_count} hora(s)'
+                    ))
+
+                if not interval:
+                    break
+                # Recalcular todo o histórico apenas na primeira execução
+                days, rebuild = 0, False
+                time.sleep(interval)
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠ Agregação interrompida'))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from core.models import Cookie, Session, PageView, SEOMetrics, AnalyticsExport
 import json
 import os
@@ -117,8 +118,8 @@ def backup_data(self, file_path):
             export_data = {
                 'name': export.name,
                 'format': export.format,
-                'date_range_start': export.date_range_start.isoformat(),
-                'date_range_end': export.date_range_end.isoformat(),
+                'date_range_start': export.date_range_start.isoformat() if export.date_range_start else None,
+                'date_range_end': export.date_range_end.isoformat() if export.date_range_end else None,
                 'created_at': export.created_at.isoformat(),
                 'file_path': export.file_path.name if export.file_path else None,
                 'is_active': export.is_active
@@ -226,8 +227,8 @@ def restore_data(self, file_path):
                 created_at=timezone.parse_datetime(export_data['created_at']),
                 defaults={
                     'format': export_data['format'],
-                    'date_range_start': timezone.parse_datetime(export_data['date_range_start']).date(),
-                    'date_range_end': timezone.parse_datetime(export_data['date_range_end']).date(),
+                    'date_range_start': parse_date(export_data['date_range_start'] or ''),
+                    'date_range_end': parse_date(export_data['date_range_end'] or ''),
                     'file_path': export_data['file_path'],
                     'is_active': export_data['is_active']
                 }
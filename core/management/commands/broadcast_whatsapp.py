@@ -0,0 +1,118 @@
+"""
+Envio em massa de mensagens WhatsApp
+Uso: python manage.py broadcast_whatsapp (--message TEXTO | --template NOME) [--phones ...]
+     [--include-my-contacts] [--include-blocked] [--rate 20] [--workers 8] [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.whatsapp_broadcast import (
+    BROADCAST_RATE, BROADCAST_WORKERS, broadcast, broadcast_recipients
+)
+from core.whatsapp_http import rate_limiter
+
+
+class Command(BaseCommand):
+    help = 'Enviar uma mensagem ou template para vários contatos do WhatsApp'
+
+    def add_arguments(self, parser):
+        content = parser.add_mutually_exclusive_group(required=True)
+        content.add_argument('--message', type=str, help='Mensagem de texto')
+        content.add_argument('--template', type=str, help='Nome do template')
+        parser.add_argument(
+            '--parameters',
+            type=str,
+            nargs='*',
+            help='Parâmetros para o template'
+        )
+        parser.add_argument(
+            '--language',
+            type=str,
+            default='pt_BR',
+            help='Código do idioma (padrão: pt_BR)'
+        )
+        parser.add_argument(
+            '--phones',
+            type=str,
+            nargs='*',
+            help='Enviar apenas para estes números (padrão: todos os contatos atendidos pelo chatbot)'
+        )
+        parser.add_argument(
+            '--include-my-contacts',
+            action='store_true',
+            help='Incluir contatos marcados como "meus contatos"'
+        )
+        parser.add_argument(
+            '--include-blocked',
+            action='store_true',
+            help='Incluir contatos bloqueados'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=BROADCAST_RATE,
+            help=f'Máximo de mensagens por segundo, 0 = sem limite (padrão: {BROADCAST_RATE})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=BROADCAST_WORKERS,
+            help=f'Requisições simultâneas (padrão: {BROADCAST_WORKERS})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas listar quantos contatos receberiam a mensagem'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers deve ser pelo menos 1')
+        if options['rate'] < 0:
+            raise CommandError('--rate deve ser >= 0 (0 = sem limite)')
+
+        contacts = broadcast_recipients(
+            phone_numbers=options['phones'],
+            include_my_contacts=options['include_my_contacts'],
+            include_blocked=options['include_blocked'],
+        )
+        total = contacts.count()
+        if options['dry_run']:
+            self.stdout.write(f'📋 {total} contato(s) receberiam a mensagem')
+            return
+        if not total:
+            self.stdout.write(self.style.WARNING('⚠ Nenhum contato encontrado'))
+            return
+
+        self.stdout.write(f'🚀 Enviando para {total} contato(s)...')
+
+        def progress(result):
+            self.stdout.write(f'   {result.sent + result.failed}/{result.total} processados')
+
+        try:
+            result = broadcast(
+                contacts,
+                message=options['message'],
+                template_name=options['template'],
+                language_code=options['language'],
+                parameters=options['parameters'],
+                rate=options['rate'],
+                workers=options['workers'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for phone_number, error in list(result.errors.items())[:10]:
+            self.stdout.write(self.style.ERROR(f'✗ {phone_number}: {error}'))
+
+        limiter = rate_limiter.stats()
+        if limiter['waited']:
+            self.stdout.write(
+                f"⏱ Limitador ({limiter['backend']}): {limiter['waited']} espera(s), "
+                f"média {limiter['avg_wait']:.3f}s, máxima {limiter['max_wait']:.3f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Broadcast {result.broadcast_id}: {result.sent} enviada(s), {result.failed} com erro'
+        ))
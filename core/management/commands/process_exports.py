@@ -0,0 +1,80 @@
+"""
+Worker da fila de exportações analíticas
+Uso: python manage.py process_exports [--once] [--interval 5]
+"""
+
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.export_service import claim_next_export, release_stale_exports, run_export_job
+
+
+class Command(BaseCommand):
+    help = 'Processar exports pendentes (AnalyticsExport) fora dos workers web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Processar os exports pendentes e sair'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera quando a fila está vazia (padrão: 5)'
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Encerrar após processar N exports (0 = sem limite)'
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        interval = options['interval']
+        max_jobs = options['max_jobs']
+        processed = 0
+
+        self.stdout.write('🚀 Worker de exports iniciado')
+
+        try:
+            while True:
+                close_old_connections()
+                # Mesmo heartbeat verificado por core.views.check_workers
+                cache.set('worker_heartbeat', time.time(), timeout=max(60, int(interval * 3)))
+                released = release_stale_exports()
+                if released:
+                    self.stdout.write(self.style.WARNING(f'⚠ {released} export(s) devolvido(s) à fila'))
+
+                export = claim_next_export()
+                if export is None:
+                    if once:
+                        break
+                    time.sleep(interval)
+                    continue
+
+                self.stdout.write(f'📦 Processando export {export.pk} ({export.data_type}/{export.format})...')
+                export = run_export_job(export)
+                processed += 1
+
+                if export.status == 'completed':
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Export {export.pk} concluído: {export.processed_rows} linhas → {export.file_path.name}'
+                    ))
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f'✗ Export {export.pk} falhou: {export.error_message}'
+                    ))
+
+                if max_jobs and processed >= max_jobs:
+                    break
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠ Worker interrompido'))
+
+        self.stdout.write(f'✅ {processed} export(s) processado(s)')
@@ -0,0 +1,73 @@
+"""
+Worker da fila de webhooks do WhatsApp
+Uso: python manage.py process_whatsapp_webhooks [--once] [--interval 1] [--batch-size 50]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.whatsapp_service import (
+    WEBHOOK_BATCH_SIZE, claim_webhook_events, process_webhook_event, release_stale_webhooks
+)
+
+
+class Command(BaseCommand):
+    help = 'Processar webhooks do WhatsApp enfileirados (WHATSAPP_WEBHOOK_ASYNC)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Processar os webhooks pendentes e sair'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera quando a fila está vazia (padrão: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=WEBHOOK_BATCH_SIZE,
+            help=f'Eventos reservados por vez (padrão: {WEBHOOK_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        interval = options['interval']
+        batch_size = options['batch_size']
+        processed = failed = 0
+
+        self.stdout.write('🚀 Worker de webhooks do WhatsApp iniciado')
+
+        try:
+            while True:
+                close_old_connections()
+                released = release_stale_webhooks()
+                if released:
+                    self.stdout.write(self.style.WARNING(f'⚠ {released} webhook(s) devolvido(s) à fila'))
+
+                events = claim_webhook_events(batch_size)
+                if not events:
+                    if once:
+                        break
+                    time.sleep(interval)
+                    continue
+
+                for event in events:
+                    event = process_webhook_event(event)
+                    if event.status == 'done':
+                        processed += 1
+                    else:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(
+                            f'✗ Webhook {event.pk} ({event.status}, tentativa {event.attempts}): {event.error_message}'
+                        ))
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠ Worker interrompido'))
+
+        self.stdout.write(f'✅ {processed} webhook(s) processado(s), {failed} com erro')
@@ -0,0 +1,69 @@
+"""
+Worker da fila de envios agendados do WhatsApp
+Uso: python manage.py send_scheduled_whatsapp [--once] [--interval 1] [--batch-size 50]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.whatsapp_service import (
+    OUTBOUND_BATCH_SIZE, claim_due_outbound, dispatch_outbound, release_stale_outbound
+)
+
+
+class Command(BaseCommand):
+    help = 'Enviar as mensagens WhatsApp agendadas cujo horário já chegou'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Enviar os agendamentos vencidos e sair'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera quando não há envios vencidos (padrão: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOUND_BATCH_SIZE,
+            help=f'Envios reservados por vez (padrão: {OUTBOUND_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        interval = options['interval']
+        batch_size = options['batch_size']
+        total_sent = total_failed = 0
+
+        self.stdout.write('🚀 Agendador de envios do WhatsApp iniciado')
+
+        try:
+            while True:
+                close_old_connections()
+                released = release_stale_outbound()
+                if released:
+                    self.stdout.write(self.style.WARNING(f'⚠ {released} envio(s) devolvido(s) à fila'))
+
+                deliveries = claim_due_outbound(batch_size)
+                if not deliveries:
+                    if once:
+                        break
+                    time.sleep(interval)
+                    continue
+
+                sent, failed = dispatch_outbound(deliveries)
+                total_sent += sent
+                total_failed += failed
+                if failed:
+                    self.stdout.write(self.style.ERROR(f'✗ {failed} envio(s) falharam definitivamente'))
+
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠ Agendador interrompido'))
+
+        self.stdout.write(f'✅ {total_sent} mensagem(ns) enviada(s), {total_failed} com erro')
@@ -9,6 +9,7 @@
     WhatsAppContact, WhatsAppSession, WhatsAppMessage, 
     WhatsAppTemplate, WhatsAppConfig, WhatsAppLog
 )
+from core.whatsapp_retention import RETENTION_POLICIES, count_expired
 from core.whatsapp_service import whatsapp_service
 
 
@@ -28,7 +29,14 @@ def add_arguments(self, parser):
         # Argumentos opcionais
         parser.add_argument('--phone', type=str, help='Número de telefone')
         parser.add_argument('--name', type=str, help='Nome do contato')
-        parser.add_argument('--days', type=int, default=7, help='Dias para limpeza')
+        parser.add_argument('--days', type=int, help='Dias sem atividade para inativar sessões (cleanup)')
+        parser.add_argument(
+            '--only', nargs='*', choices=[policy.name for policy in RETENTION_POLICIES],
+            help='Políticas de retenção a aplicar (cleanup; padrão: inativar sessões, mais arquivo '
+                 'e exclusões se habilitados em WHATSAPP_ARCHIVE_ENABLED/WHATSAPP_RETENTION_DELETE_ENABLED)'
+        )
+        parser.add_argument('--chunk-size', type=int, help='Linhas por lote na limpeza')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas contar o que seria limpo')
         parser.add_argument('--step', type=int, help='Número do passo do template')
         parser.add_argument('--content', type=str, help='Conteúdo do template')
         parser.add_argument('--delay', type=int, default=5, help='Delay em segundos')
@@ -48,7 +56,7 @@ def handle(self, *args, **options):
             elif action == 'stats':
                 self.show_stats()
             elif action == 'cleanup':
-                self.cleanup_data(options['days'])
+                self.cleanup_data(options['days'], options['only'], options['chunk_size'], options['dry_run'])
             elif action == 'add_contact':
                 self.add_contact(options['phone'], options['name'])
             elif action == 'block_contact':
@@ -114,11 +122,35 @@ def show_stats(self):
         self.stdout.write(f'  Mensagens hoje: {stats.get("messages_today", 0)}')
         self.stdout.write(f'  Mensagens automáticas hoje: {stats.get("automated_messages_today", 0)}')
 
-    def cleanup_data(self, days):
-        """Limpar dados antigos"""
-        count = whatsapp_service.cleanup_old_sessions(days)
+    def cleanup_data(self, days, only, chunk_size, dry_run):
+        """Aplicar as políticas de retenção (em lotes, com progresso)"""
+        overrides = {'sessions': days} if days is not None else {}
+        policies = [
+            policy for policy in RETENTION_POLICIES
+            if (policy.name in only if only else policy.enabled)
+        ]
+        
+        if dry_run:
+            for policy in policies:
+                policy_days = overrides.get(policy.name, policy.retention_days)
+                count = count_expired(policy, policy_days)
+                self.stdout.write(f'  {policy.label} (> {policy_days} dias): {count}')
+            return
+        
+        def progress(policy, total):
+            self.stdout.write(f'  {policy.label}: {total}...', ending='\r')
+            self.stdout.flush()
+        
+        try:
+            results = whatsapp_service.apply_retention(
+                [policy.name for policy in policies], days=overrides, chunk_size=chunk_size, progress=progress
+            )
+        except Exception as e:
+            raise CommandError(f'Erro na limpeza ({e}); os lotes já concluídos foram mantidos')
+        for policy in policies:
+            self.stdout.write(f'  {policy.label}: {results.get(policy.name, 0)}      ')
         self.stdout.write(
-            self.style.SUCCESS(f'✓ Limpeza concluída: {count} sessões antigas removidas')
+            self.style.SUCCESS(f'✓ Limpeza concluída: {sum(results.values())} registros processados')
         )
 
     def add_contact(self, phone, name):
@@ -1,10 +1,18 @@
 import logging
+import time
 import traceback
 from django.http import HttpResponseServerError, HttpResponseRedirect
 from django.template.response import TemplateResponse
 from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .tracking_service import (
+    TRACKING_COOKIE_NAME, TRACKING_ENABLED, TRACKING_SESSION_TIMEOUT, build_hit,
+    new_visit_key, pageview_buffer, parse_visit_cookie, should_track, visit_cookie_expiring,
+    visit_cookie_value
+)
 
 logger = logging.getLogger('core.admin')
 
@@ -45,4 +53,46 @@ def process_exception(self, request, exception):
                 )
         
         # Para outras exceções, deixar o Django lidar normalmente
-        return None
\ No newline at end of file
+        return None
+
+
+class AnalyticsTrackingMiddleware:
+    """
+    Registrar acessos às páginas em Session/PageView/Cookie.
+    O acesso vai para o buffer do processo; a gravação no banco é feita em
+    lote pela thread de fundo do tracking_service.
+    """
+
+    def __init__(self, get_response):
+        if not TRACKING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        try:
+            if should_track(request, response):
+                session_key, issued_at = parse_visit_cookie(request.COOKIES.get(TRACKING_COOKIE_NAME, ''))
+                new_session = session_key is None
+                if new_session:
+                    session_key = new_visit_key()
+
+                pageview_buffer.record(build_hit(request, response, session_key, new_session))
+
+                # Janela deslizante: a visita termina após TRACKING_SESSION_TIMEOUT sem acessos.
+                # O Set-Cookie só vai quando o cookie falta ou está perto de expirar
+                now = int(time.time())
+                if new_session or visit_cookie_expiring(issued_at, now):
+                    response.set_cookie(
+                        TRACKING_COOKIE_NAME,
+                        visit_cookie_value(session_key, now),
+                        max_age=TRACKING_SESSION_TIMEOUT,
+                        secure=request.is_secure(),
+                        httponly=True,
+                        samesite='Lax'
+                    )
+        except Exception as e:
+            logger.warning(f"Erro ao registrar acesso {request.path}: {e}")
+
+        return response
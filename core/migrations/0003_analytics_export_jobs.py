@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_exports_completed(apps, schema_editor):
+    """Exports criados antes da fila já possuem arquivo; não devem ser reprocessados"""
+    AnalyticsExport = apps.get_model("core", "AnalyticsExport")
+    AnalyticsExport.objects.update(status="completed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_whatsapp_chatbot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="completed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="data_type",
+            field=models.CharField(
+                choices=[
+                    ("all", "Todos"),
+                    ("cookies", "Cookies"),
+                    ("sessions", "Sessões"),
+                    ("seo", "Métricas SEO"),
+                ],
+                default="all",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="error_message",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="processed_rows",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Na fila"),
+                    ("processing", "Processando"),
+                    ("completed", "Concluído"),
+                    ("failed", "Falhou"),
+                ],
+                db_index=True,
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="total_rows",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="analyticsexport",
+            name="file_path",
+            field=models.FileField(blank=True, upload_to="analytics_exports/"),
+        ),
+        migrations.AddIndex(
+            model_name="analyticsexport",
+            index=models.Index(
+                fields=["status", "created_at"], name="core_analyt_status_5ea75f_idx"
+            ),
+        ),
+        migrations.RunPython(
+            mark_existing_exports_completed, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_analytics_export_jobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="incremental",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="ExportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data_type", models.CharField(max_length=20)),
+                ("last_exported_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="export_checkpoints",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Export Checkpoint",
+                "verbose_name_plural": "Export Checkpoints",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "data_type"), name="unique_export_checkpoint"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_export_checkpoints"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="analyticsexport",
+            name="data_type",
+            field=models.CharField(
+                choices=[
+                    ("all", "Todos"),
+                    ("cookies", "Cookies"),
+                    ("sessions", "Sessões"),
+                    ("pageviews", "Page Views"),
+                    ("seo", "Métricas SEO"),
+                ],
+                default="all",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="analyticsexport",
+            name="format",
+            field=models.CharField(
+                choices=[
+                    ("csv", "CSV"),
+                    ("xlsx", "Excel"),
+                    ("json", "JSON"),
+                    ("parquet", "Parquet"),
+                    ("pdf", "PDF"),
+                ],
+                max_length=10,
+            ),
+        ),
+    ]
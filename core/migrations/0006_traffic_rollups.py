@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_analytics_export_parquet"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sessions", models.PositiveIntegerField(default=0)),
+                ("pageviews", models.PositiveIntegerField(default=0)),
+                ("cookies", models.PositiveIntegerField(default=0)),
+                ("active_sessions", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("day", models.DateField(unique=True)),
+            ],
+            options={
+                "verbose_name": "Daily Traffic Rollup",
+                "verbose_name_plural": "Daily Traffic Rollups",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyTrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sessions", models.PositiveIntegerField(default=0)),
+                ("pageviews", models.PositiveIntegerField(default=0)),
+                ("cookies", models.PositiveIntegerField(default=0)),
+                ("active_sessions", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("hour", models.DateTimeField(unique=True)),
+            ],
+            options={
+                "verbose_name": "Hourly Traffic Rollup",
+                "verbose_name_plural": "Hourly Traffic Rollups",
+                "ordering": ["-hour"],
+            },
+        ),
+        migrations.CreateModel(
+            name="PageViewRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(db_index=True)),
+                ("url", models.URLField()),
+                ("title", models.CharField(max_length=255)),
+                ("views", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Page View Rollup",
+                "verbose_name_plural": "Page View Rollups",
+                "ordering": ["-day", "-views"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "url", "title"), name="unique_pageview_rollup"
+                    )
+                ],
+            },
+        ),
+    ]
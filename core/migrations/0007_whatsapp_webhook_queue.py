@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_traffic_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WhatsAppWebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Na fila"),
+                            ("processing", "Processando"),
+                            ("done", "Processado"),
+                            ("failed", "Falhou"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "claim_token",
+                    models.CharField(blank=True, db_index=True, max_length=32),
+                ),
+                ("error_message", models.TextField(blank=True)),
+                ("received_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "WhatsApp Webhook Event",
+                "verbose_name_plural": "WhatsApp Webhook Events",
+                "ordering": ["received_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "received_at"],
+                        name="core_whatsa_status_74d555_idx",
+                    )
+                ],
+            },
+        ),
+    ]
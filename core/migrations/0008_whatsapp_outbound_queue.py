@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_whatsapp_webhook_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WhatsAppOutboundMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("phone_number", models.CharField(max_length=20)),
+                ("payload", models.JSONField()),
+                ("due_at", models.DateTimeField(db_index=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Agendado"),
+                            ("sending", "Enviando"),
+                            ("sent", "Enviado"),
+                            ("failed", "Falhou"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "claim_token",
+                    models.CharField(blank=True, db_index=True, max_length=32),
+                ),
+                ("error_message", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="core.whatsappmessage",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "WhatsApp Outbound Message",
+                "verbose_name_plural": "WhatsApp Outbound Messages",
+                "ordering": ["due_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "due_at"],
+                        name="core_whatsa_status_281c6f_idx",
+                    )
+                ],
+            },
+        ),
+    ]
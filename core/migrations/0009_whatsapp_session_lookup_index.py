@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_whatsapp_outbound_queue"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="whatsappsession",
+            index=models.Index(
+                fields=["contact", "status", "is_active", "last_activity"],
+                name="core_whatsa_contact_243030_idx",
+            ),
+        ),
+    ]
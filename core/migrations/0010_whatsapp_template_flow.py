@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_whatsapp_session_lookup_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whatsapptemplate",
+            name="next_step",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="whatsapptemplate",
+            name="transitions",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_whatsapp_template_flow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WhatsAppArchiveSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("messages", "Mensagens"), ("logs", "Logs")],
+                        max_length=20,
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("path", models.CharField(max_length=255, unique=True)),
+                ("record_count", models.PositiveIntegerField(default=0)),
+                ("first_pk", models.BigIntegerField()),
+                ("last_pk", models.BigIntegerField()),
+                ("size_bytes", models.PositiveBigIntegerField(default=0)),
+                ("session_ids", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "WhatsApp Archive Segment",
+                "verbose_name_plural": "WhatsApp Archive Segments",
+                "ordering": ["kind", "day", "first_pk"],
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "day"], name="core_whatsa_kind_4a6429_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_phone_digits(apps, schema_editor):
+    """Normalizar os telefones existentes (sem alterar updated_at)"""
+    WhatsAppContact = apps.get_model("core", "WhatsAppContact")
+    batch = []
+    for contact in WhatsAppContact.objects.only("id", "phone_number").iterator():
+        contact.phone_digits = re.sub(r"\D", "", contact.phone_number or "")
+        batch.append(contact)
+        if len(batch) >= 500:
+            WhatsAppContact.objects.bulk_update(batch, ["phone_digits"])
+            batch = []
+    if batch:
+        WhatsAppContact.objects.bulk_update(batch, ["phone_digits"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_whatsapp_archive_segments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whatsappcontact",
+            name="phone_digits",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=20
+            ),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="whatsappcontact",
+            index=models.Index(
+                fields=["updated_at", "id"], name="core_whatsa_updated_583306_idx"
+            ),
+        ),
+    ]
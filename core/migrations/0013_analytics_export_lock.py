@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_whatsapp_contact_keyset"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="analyticsexport",
+            name="locked_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
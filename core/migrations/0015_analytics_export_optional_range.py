@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_analytics_export_lock"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="analyticsexport",
+            name="date_range_start",
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="analyticsexport",
+            name="date_range_end",
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -2,7 +2,12 @@
 from django.utils import timezone
 from django.contrib.auth.models import User
 import json
+import re
 from django.core.exceptions import ValidationError
+from django.conf import settings
+
+from .config_cache import ConfigCache
+from .template_renderer import compile_template
 
 class Cookie(models.Model):
     name = models.CharField(max_length=255, db_index=True)
@@ -13,7 +18,7 @@ class Cookie(models.Model):
     secure = models.BooleanField(default=False)
     httponly = models.BooleanField(default=False)
     samesite = models.CharField(max_length=50, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     session = models.ForeignKey('Session', on_delete=models.CASCADE, related_name='cookies')
     is_active = models.BooleanField(default=True, db_index=True)
@@ -39,7 +44,7 @@ class Session(models.Model):
     ip_address = models.GenericIPAddressField(db_index=True)
     user_agent = models.TextField()
     referrer = models.URLField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     last_activity = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     is_active = models.BooleanField(default=True, db_index=True)
@@ -66,7 +71,7 @@ class PageView(models.Model):
     url = models.URLField(db_index=True)
     title = models.CharField(max_length=255, db_index=True)
     time_spent = models.DurationField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     is_active = models.BooleanField(default=True, db_index=True)
 
     class Meta:
@@ -125,16 +130,41 @@ class AnalyticsExport(models.Model):
         ('csv', 'CSV'),
         ('xlsx', 'Excel'),
         ('json', 'JSON'),
+        ('parquet', 'Parquet'),
         ('pdf', 'PDF'),
     ]
 
+    DATA_TYPE_CHOICES = [
+        ('all', 'Todos'),
+        ('cookies', 'Cookies'),
+        ('sessions', 'Sessões'),
+        ('pageviews', 'Page Views'),
+        ('seo', 'Métricas SEO'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Na fila'),
+        ('processing', 'Processando'),
+        ('completed', 'Concluído'),
+        ('failed', 'Falhou'),
+    ]
+
     name = models.CharField(max_length=255, db_index=True)
     format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
-    date_range_start = models.DateField(db_index=True)
-    date_range_end = models.DateField(db_index=True)
+    data_type = models.CharField(max_length=20, choices=DATA_TYPE_CHOICES, default='all')
+    date_range_start = models.DateField(null=True, blank=True, db_index=True)  # Vazio no incremental sem datas
+    date_range_end = models.DateField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
-    file_path = models.FileField(upload_to='analytics_exports/')
+    file_path = models.FileField(upload_to='analytics_exports/', blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    incremental = models.BooleanField(default=False)  # Apenas registros novos desde o último export
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)  # Heartbeat do worker durante o processamento
+    completed_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True, db_index=True)
 
     class Meta:
@@ -145,21 +175,113 @@ class Meta:
             models.Index(fields=['date_range_start', 'date_range_end']),
             models.Index(fields=['created_at', 'is_active']),
             models.Index(fields=['user', 'is_active']),
+            models.Index(fields=['status', 'created_at']),
         ]
 
     def delete(self, *args, **kwargs):
         self.is_active = False
         self.save()
 
+    @property
+    def progress(self):
+        """Percentual de linhas já escritas no arquivo"""
+        if self.status == 'completed':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
     def __str__(self):
         return f"{self.name} - {self.format}"
 
 
+class ExportCheckpoint(models.Model):
+    """Último ponto exportado por usuário e tabela (exports incrementais)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_checkpoints')
+    data_type = models.CharField(max_length=20)
+    last_exported_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Export Checkpoint'
+        verbose_name_plural = 'Export Checkpoints'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'data_type'], name='unique_export_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.data_type}: {self.last_exported_at}"
+
+
+# ===== RESUMOS PRÉ-AGREGADOS (python manage.py aggregate_analytics) =====
+
+class TrafficRollup(models.Model):
+    """Contagens de um período: sessões/cookies/page views criados e sessões ativas"""
+    sessions = models.PositiveIntegerField(default=0)
+    pageviews = models.PositiveIntegerField(default=0)
+    cookies = models.PositiveIntegerField(default=0)
+    active_sessions = models.PositiveIntegerField(default=0)  # Sessões com última atividade no período
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class DailyTrafficRollup(TrafficRollup):
+    day = models.DateField(unique=True)
+
+    class Meta:
+        verbose_name = 'Daily Traffic Rollup'
+        verbose_name_plural = 'Daily Traffic Rollups'
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.day}: {self.pageviews} page views"
+
+
+class HourlyTrafficRollup(TrafficRollup):
+    hour = models.DateTimeField(unique=True)
+
+    class Meta:
+        verbose_name = 'Hourly Traffic Rollup'
+        verbose_name_plural = 'Hourly Traffic Rollups'
+        ordering = ['-hour']
+
+    def __str__(self):
+        return f"{self.hour}: {self.pageviews} page views"
+
+
+class PageViewRollup(models.Model):
+    """Page views por URL e dia"""
+    day = models.DateField(db_index=True)
+    url = models.URLField()
+    title = models.CharField(max_length=255)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Page View Rollup'
+        verbose_name_plural = 'Page View Rollups'
+        ordering = ['-day', '-views']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'url', 'title'], name='unique_pageview_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.url}: {self.views}"
+
+
 # ===== MODELOS DO CHATBOT WHATSAPP =====
 
+def digits_only(value: str) -> str:
+    """Apenas os dígitos de um telefone ('+55 (11) 99999-0000' -> '5511999990000')"""
+    return re.sub(r'\D', '', value or '')
+
+
 class WhatsAppContact(models.Model):
     """Modelo para gerenciar contatos do WhatsApp"""
     phone_number = models.CharField(max_length=20, unique=True, db_index=True)
+    # Telefone normalizado para a busca por prefixo (preenchido no save)
+    phone_digits = models.CharField(max_length=20, blank=True, editable=False, db_index=True)
     name = models.CharField(max_length=255, blank=True)
     is_blocked = models.BooleanField(default=False, db_index=True)
     is_my_contact = models.BooleanField(default=False, db_index=True)  # Para filtrar sua lista de contatos
@@ -176,8 +298,17 @@ class Meta:
             models.Index(fields=['phone_number', 'is_active']),
             models.Index(fields=['is_my_contact', 'is_blocked']),
             models.Index(fields=['created_at', 'is_active']),
+            # Paginação por cursor da listagem de contatos (updated_at, id)
+            models.Index(fields=['updated_at', 'id']),
         ]
 
+    def save(self, *args, **kwargs):
+        self.phone_digits = digits_only(self.phone_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+
     def clean(self):
         # Validar formato do número de telefone
         if not self.phone_number.replace('+', '').replace('-', '').replace(' ', '').isdigit():
@@ -220,6 +351,8 @@ class Meta:
             models.Index(fields=['status', 'is_active']),
             models.Index(fields=['started_at', 'status']),
             models.Index(fields=['last_activity', 'is_active']),
+            # Busca da sessão ativa de um contato
+            models.Index(fields=['contact', 'status', 'is_active', 'last_activity']),
         ]
 
     def delete(self, *args, **kwargs):
@@ -286,6 +419,9 @@ class WhatsAppTemplate(models.Model):
     variables = models.JSONField(default=list, blank=True)  # Lista de variáveis no template
     step_number = models.IntegerField(default=0, db_index=True)  # Para sequência de mensagens
     delay_seconds = models.IntegerField(default=0)  # Delay antes de enviar
+    # Fluxo: passo seguinte (vazio = step_number + 1) e desvios por palavra-chave da resposta
+    next_step = models.IntegerField(null=True, blank=True)
+    transitions = models.JSONField(default=dict, blank=True)  # {"palavra": passo}
     is_active = models.BooleanField(default=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -306,14 +442,8 @@ def delete(self, *args, **kwargs):
         self.save()
 
     def render_content(self, context_data=None):
-        """Renderiza o template com os dados do contexto"""
-        if not context_data:
-            return self.content
-        
-        content = self.content
-        for key, value in context_data.items():
-            content = content.replace(f"{{{key}}}", str(value))
-        return content
+        """Renderiza o template com os dados do contexto (compilado uma vez por versão)"""
+        return compile_template(self).render(context_data)
 
     def __str__(self):
         return f"{self.name} - Passo {self.step_number}"
@@ -340,17 +470,36 @@ def delete(self, *args, **kwargs):
 
     @classmethod
     def get_value(cls, key, default=None):
-        """Método helper para obter valores de configuração"""
-        try:
-            config = cls.objects.get(key=key, is_active=True)
-            return config.value
-        except cls.DoesNotExist:
-            return default
+        """
+        Método helper para obter valores de configuração (via cache do processo).
+        Salvar no admin recarrega os outros workers pelo cache 'shared'
+        (REDIS_URL); sem ele a mudança leva até WHATSAPP_CONFIG_CACHE_TTL s
+        para chegar aos demais processos
+        """
+        return whatsapp_config_cache.get(key, default)
+
+    @classmethod
+    def preload(cls):
+        """Carregar todas as configurações ativas no cache em uma consulta"""
+        return whatsapp_config_cache.load()
+
+    @classmethod
+    def invalidate_cache(cls):
+        whatsapp_config_cache.invalidate()
 
     def __str__(self):
         return f"{self.key}: {self.value[:50]}..."
 
 
+# Configurações lidas por WhatsAppConfig.get_value; invalidado por core.signals ao salvar
+whatsapp_config_cache = ConfigCache(
+    lambda: WhatsAppConfig.objects.filter(is_active=True).values_list('key', 'value'),
+    version_key='whatsapp:config_version',
+    ttl=getattr(settings, 'WHATSAPP_CONFIG_CACHE_TTL', 60),
+    check_interval=getattr(settings, 'WHATSAPP_CONFIG_CACHE_CHECK_INTERVAL', 5),
+)
+
+
 class WhatsAppLog(models.Model):
     """Log de atividades do chatbot"""
     LOG_LEVEL_CHOICES = [
@@ -384,4 +533,97 @@ def delete(self, *args, **kwargs):
         self.save()
 
     def __str__(self):
-        return f"[{self.level.upper()}] {self.message[:100]}..."
\ No newline at end of file
+        return f"[{self.level.upper()}] {self.message[:100]}..."
+
+class WhatsAppWebhookEvent(models.Model):
+    """Fila de webhooks recebidos (processados pelo comando process_whatsapp_webhooks)"""
+    STATUS_CHOICES = [
+        ('pending', 'Na fila'),
+        ('processing', 'Processando'),
+        ('done', 'Processado'),
+        ('failed', 'Falhou'),
+    ]
+
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    error_message = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'WhatsApp Webhook Event'
+        verbose_name_plural = 'WhatsApp Webhook Events'
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.pk} [{self.status}] - {self.received_at}"
+
+
+class WhatsAppOutboundMessage(models.Model):
+    """Fila de envios agendados (respostas com delay; enviados pelo comando send_scheduled_whatsapp)"""
+    STATUS_CHOICES = [
+        ('pending', 'Agendado'),
+        ('sending', 'Enviando'),
+        ('sent', 'Enviado'),
+        ('failed', 'Falhou'),
+    ]
+
+    message = models.ForeignKey(
+        WhatsAppMessage, on_delete=models.CASCADE, null=True, blank=True, related_name='deliveries'
+    )
+    phone_number = models.CharField(max_length=20)
+    payload = models.JSONField()
+    due_at = models.DateTimeField(db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'WhatsApp Outbound Message'
+        verbose_name_plural = 'WhatsApp Outbound Messages'
+        ordering = ['due_at']
+        indexes = [
+            models.Index(fields=['status', 'due_at']),
+        ]
+
+    def __str__(self):
+        return f"Envio {self.pk} para {self.phone_number} [{self.status}] - {self.due_at}"
+
+
+class WhatsAppArchiveSegment(models.Model):
+    """Índice dos segmentos do arquivo frio de mensagens e logs (core.whatsapp_archive)"""
+    KIND_CHOICES = [
+        ('messages', 'Mensagens'),
+        ('logs', 'Logs'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    day = models.DateField()
+    path = models.CharField(max_length=255, unique=True)  # relativo a WHATSAPP_ARCHIVE_ROOT
+    record_count = models.PositiveIntegerField(default=0)
+    first_pk = models.BigIntegerField()
+    last_pk = models.BigIntegerField()
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    session_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'WhatsApp Archive Segment'
+        verbose_name_plural = 'WhatsApp Archive Segments'
+        ordering = ['kind', 'day', 'first_pk']
+        indexes = [
+            models.Index(fields=['kind', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.day} ({self.record_count} registros)"
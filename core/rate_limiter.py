@@ -0,0 +1,132 @@
+"""
+Limitador de taxa compartilhado entre processos
+Com um cache compartilhado (alias 'shared', Redis via REDIS_URL) todos os
+workers dividem o mesmo orçamento por segundo; com cache local, ou se o cache
+falhar, cada processo usa um token bucket próprio com rate / processes
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from .config_cache import is_process_local, shared_cache
+
+logger = logging.getLogger('core')
+
+
+class TokenBucket:
+    """
+    Token bucket do processo: `rate` fichas por segundo, até `capacity`
+    acumuladas. Quem chega com o balde vazio reserva a ficha futura e espera
+    a sua vez (ordem de chegada).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Reservar uma ficha; devolve a espera (s) ou None se passar de `max_wait`"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class RateLimiter:
+    """
+    `acquire()` bloqueia até haver vaga e devolve quanto esperou.
+    No modo compartilhado o tempo é dividido em janelas com ceil(`rate`)
+    vagas (1 s para taxas inteiras, 2 s para 0.5/s...), contadas com
+    cache.add/cache.incr, atômicos nos backends compartilhados. As `burst`
+    primeiras vagas da janela saem na hora e as demais a cada 1/rate s, o que
+    espalha os envios ao longo da janela.
+    No modo local cada um dos `processes` processos recebe rate / processes.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float = None, max_wait: float = 30,
+                 shared: bool = None, processes: int = 1):
+        if rate < 0:
+            raise ValueError(f'Limitador {name}: rate deve ser >= 0 (0 = sem limite)')
+        if burst is not None and burst < 1:
+            raise ValueError(f'Limitador {name}: burst deve ser >= 1')
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.max_wait = max_wait
+        if shared is None:
+            shared = not is_process_local()
+        self.shared = shared
+        self.cache = shared_cache()
+        # Sem cache compartilhado cada processo fica com a sua fração da taxa
+        self.processes = max(1, processes)
+        self.local = TokenBucket(rate / self.processes, max(1.0, self.burst / self.processes)) if rate else None
+        # Janela com um número inteiro de vagas: taxas < 1 ou fracionárias não perdem vagas
+        self.window_slots = math.ceil(rate) if rate else 0
+        self.window = self.window_slots / rate if rate else 0
+        self._lock = threading.Lock()
+        self._metrics = {'acquired': 0, 'waited': 0, 'rejected': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+
+    def _shared_reserve(self, max_wait: float) -> Optional[float]:
+        now = time.time()
+        window = int(now // self.window)
+        timeout = int(max_wait + self.window) + 5
+        for offset in range(int(max_wait // self.window) + 1):
+            key = f'ratelimit:{self.name}:{window + offset}'
+            self.cache.add(key, 0, timeout)
+            slot = self.cache.incr(key)
+            if slot <= self.window_slots:
+                start = (window + offset) * self.window
+                wait = max(0.0, start + max(0, slot - self.burst) / self.rate - now)
+                return wait if wait <= max_wait else None
+        return None
+
+    def _reserve(self, max_wait: float) -> Optional[float]:
+        if self.shared:
+            try:
+                return self._shared_reserve(max_wait)
+            except Exception as e:
+                # Cache indisponível: seguir com o limite local do processo
+                logger.warning(f"Limitador {self.name} sem cache compartilhado: {e}")
+                self.shared = False
+        return self.local.reserve(max_wait)
+
+    def acquire(self, max_wait: float = None) -> Optional[float]:
+        """
+        Aguardar a vez; devolve a espera (s) ou None se ela passaria de
+        `max_wait` (padrão: o do limitador; use um valor curto em requisições web)
+        """
+        if not self.rate:
+            return 0.0
+        wait = self._reserve(self.max_wait if max_wait is None else max_wait)
+        with self._lock:
+            if wait is None:
+                self._metrics['rejected'] += 1
+                return None
+            self._metrics['acquired'] += 1
+            if wait > 0:
+                self._metrics['waited'] += 1
+                self._metrics['total_wait'] += wait
+                self._metrics['max_wait'] = max(self._metrics['max_wait'], wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, object]:
+        """Métricas de espera deste processo"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['avg_wait'] = metrics['total_wait'] / metrics['acquired'] if metrics['acquired'] else 0.0
+        metrics.update(name=self.name, rate=self.rate, processes=self.processes,
+                       backend='shared' if self.shared else 'local')
+        return metrics
@@ -0,0 +1,161 @@
+"""
+Serviço de resumos pré-agregados do analytics
+Os dashboards leem DailyTrafficRollup/HourlyTrafficRollup/PageViewRollup em vez
+de contar as tabelas brutas; o comando aggregate_analytics mantém os resumos
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .export_service import start_of_day
+from .models import (
+    Cookie, Session, PageView, DailyTrafficRollup, HourlyTrafficRollup, PageViewRollup
+)
+
+logger = logging.getLogger('core')
+
+# (campo do resumo, queryset, campo de data usado para agrupar)
+ROLLUP_SOURCES = (
+    ('sessions', lambda: Session.objects.filter(is_active=True), 'created_at'),
+    ('pageviews', lambda: PageView.objects.filter(is_active=True), 'created_at'),
+    ('cookies', lambda: Cookie.objects.filter(is_active=True), 'created_at'),
+    ('active_sessions', lambda: Session.objects.filter(is_active=True), 'last_activity'),
+)
+
+ROLLUP_FIELDS = tuple(name for name, _, _ in ROLLUP_SOURCES)
+
+
+def _counts_by(queryset, date_field: str, trunc, start, end) -> Dict:
+    """Contagem por período (dia ou hora) dentro de [start, end) em uma consulta"""
+    return dict(
+        queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end})
+        .annotate(bucket=trunc(date_field, tzinfo=timezone.get_current_timezone()))
+        .order_by()
+        .values('bucket')
+        .annotate(total=Count('id'))
+        .values_list('bucket', 'total')
+    )
+
+
+def first_data_day() -> Optional[date]:
+    """Dia do registro mais antigo (início de uma reconstrução completa)"""
+    firsts = [
+        Session.objects.aggregate(first=Min('created_at'))['first'],
+        PageView.objects.aggregate(first=Min('created_at'))['first'],
+        Cookie.objects.aggregate(first=Min('created_at'))['first'],
+    ]
+    firsts = [value for value in firsts if value]
+    return timezone.localtime(min(firsts)).date() if firsts else None
+
+
+def rollup_window(start_day: date, end_day: date) -> Tuple[int, int]:
+    """
+    Recalcular os resumos dos dias [start_day, end_day].
+    O custo depende apenas do volume desses dias; os resumos dos dias são
+    substituídos em uma transação.
+    """
+    start = start_of_day(start_day)
+    end = start_of_day(end_day + timedelta(days=1))
+
+    daily: Dict[date, Dict[str, int]] = {}
+    hourly: Dict = {}
+    for name, queryset, date_field in ROLLUP_SOURCES:
+        for day, total in _counts_by(queryset(), date_field, TruncDate, start, end).items():
+            daily.setdefault(day, {})[name] = total
+        for hour, total in _counts_by(queryset(), date_field, TruncHour, start, end).items():
+            hourly.setdefault(hour, {})[name] = total
+
+    pages = (
+        PageView.objects.filter(is_active=True, created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .order_by()
+        .values_list('day', 'url', 'title')
+        .annotate(views=Count('id'))
+    )
+
+    with transaction.atomic():
+        DailyTrafficRollup.objects.filter(day__gte=start_day, day__lte=end_day).delete()
+        HourlyTrafficRollup.objects.filter(hour__gte=start, hour__lt=end).delete()
+        PageViewRollup.objects.filter(day__gte=start_day, day__lte=end_day).delete()
+
+        DailyTrafficRollup.objects.bulk_create(
+            DailyTrafficRollup(day=day, **counts) for day, counts in daily.items()
+        )
+        HourlyTrafficRollup.objects.bulk_create(
+            HourlyTrafficRollup(hour=hour, **counts) for hour, counts in hourly.items()
+        )
+        PageViewRollup.objects.bulk_create(
+            PageViewRollup(day=day, url=url, title=title, views=views)
+            for day, url, title, views in pages
+        )
+
+    return len(daily), len(hourly)
+
+
+def aggregate_rollups(days: int = None, rebuild: bool = False) -> Tuple[Optional[date], int, int]:
+    """
+    Atualizar os resumos de forma incremental: do último dia resumido até hoje.
+    `days` recalcula os últimos N dias; `rebuild` recalcula todo o histórico.
+    """
+    today = timezone.localdate()
+    if rebuild:
+        start_day = first_data_day()
+    elif days:
+        start_day = today - timedelta(days=days - 1)
+    else:
+        # Ontem é sempre recalculado: last_activity muda e a janela de 24h cobre os dois dias
+        last = DailyTrafficRollup.objects.order_by('-day').values_list('day', flat=True).first()
+        start_day = min(last, today - timedelta(days=1)) if last else first_data_day()
+
+    if start_day is None:
+        return None, 0, 0
+
+    start_day = min(start_day, today)
+    day_count, hour_count = rollup_window(start_day, today)
+    logger.info(f"Resumos de analytics atualizados desde {start_day}: {day_count} dias, {hour_count} horas")
+    return start_day, day_count, hour_count
+
+
+# ===== LEITURA PELOS DASHBOARDS =====
+
+def has_rollups() -> bool:
+    return DailyTrafficRollup.objects.exists()
+
+
+def traffic_totals(since: date = None) -> Dict[str, int]:
+    """Soma dos resumos diários (todo o histórico ou a partir de `since`)"""
+    queryset = DailyTrafficRollup.objects.all()
+    if since:
+        queryset = queryset.filter(day__gte=since)
+    totals = queryset.aggregate(**{name: Sum(name) for name in ROLLUP_FIELDS})
+    return {name: totals[name] or 0 for name in ROLLUP_FIELDS}
+
+
+def active_sessions_since(start) -> int:
+    """
+    Sessões ativas a partir de `start` pelos resumos horários.
+    Cada sessão conta apenas na hora da sua última atividade, então a soma não
+    tem duplicidades.
+    """
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    return HourlyTrafficRollup.objects.filter(hour__gte=hour).aggregate(
+        total=Sum('active_sessions')
+    )['total'] or 0
+
+
+def top_pages(limit: int = 5, since: date = None) -> List[dict]:
+    """Páginas mais vistas a partir dos resumos por URL"""
+    queryset = PageViewRollup.objects.all()
+    if since:
+        queryset = queryset.filter(day__gte=since)
+    return list(
+        queryset.values('url', 'title')
+        .annotate(total=Sum('views'))
+        .order_by('-total')[:limit]
+    )
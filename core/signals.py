@@ -0,0 +1,57 @@
+"""
+Sinais do app core
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import WhatsAppConfig, WhatsAppContact, WhatsAppMessage, WhatsAppSession, WhatsAppTemplate
+from .whatsapp_service import (
+    contact_resolver, invalidate_session_stats, invalidate_session_stats_on_commit, template_cache
+)
+
+
+@receiver([post_save, post_delete], sender=WhatsAppSession)
+@receiver([post_save, post_delete], sender=WhatsAppContact)
+def whatsapp_stats_changed(sender, created=None, update_fields=None, **kwargs):
+    """
+    Invalidar as estatísticas só quando as contagens mudam de fato: sessões
+    criadas, excluídas ou com status alterado e contatos salvos pelo painel.
+    A última atividade das sessões depende apenas do TTL do cache
+    (WHATSAPP_STATS_CACHE_TIMEOUT)
+    """
+    if sender is WhatsAppSession and created is False and update_fields is not None \
+            and not {'status', 'is_active'} & set(update_fields):
+        return
+    invalidate_session_stats()
+
+
+@receiver(post_save, sender=WhatsAppMessage)
+def whatsapp_message_created(sender, created=False, **kwargs):
+    """
+    Mensagens novas mudam as contagens do dia: invalidar após o commit, uma vez
+    por transação. Os lotes gravados com bulk_create invalidam no próprio
+    serviço e a exclusão fica com a retenção (sem post_delete aqui, para o
+    delete em lote não carregar cada mensagem)
+    """
+    if created:
+        invalidate_session_stats_on_commit()
+
+
+@receiver([post_save, post_delete], sender=WhatsAppContact)
+def whatsapp_contact_changed(sender, **kwargs):
+    """Descartar o cache de contatos (após o commit, para não ser repopulado com dados antigos)"""
+    transaction.on_commit(contact_resolver.invalidate)
+
+
+@receiver([post_save, post_delete], sender=WhatsAppConfig)
+def whatsapp_config_changed(sender, **kwargs):
+    """Recarregar as configurações em todos os processos (WhatsAppConfig.get_value)"""
+    WhatsAppConfig.invalidate_cache()
+
+
+@receiver([post_save, post_delete], sender=WhatsAppTemplate)
+def whatsapp_template_changed(sender, **kwargs):
+    """Recarregar o mapa passo -> template em todos os processos"""
+    transaction.on_commit(template_cache.invalidate)
@@ -0,0 +1,69 @@
+"""
+Renderização pré-compilada dos templates do chatbot
+O conteúdo é dividido uma vez em trechos literais e variáveis ({nome}); a
+renderização é um único join. Os templates compilados ficam em memória por
+(id, updated_at), então editar um template gera uma nova compilação
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+PLACEHOLDER_RE = re.compile(r'\{([^{}]*)\}')
+
+COMPILED_CACHE_SIZE = 512
+
+
+class CompiledTemplate:
+    """
+    `segments` alterna texto literal (índices pares) e nomes de variáveis
+    (índices ímpares). Variáveis sem valor no contexto ficam como no texto.
+    """
+
+    __slots__ = ('content', 'segments')
+
+    def __init__(self, content: str):
+        self.content = content
+        self.segments: List[str] = PLACEHOLDER_RE.split(content)
+
+    def render(self, context_data: Optional[Dict[str, Any]] = None) -> str:
+        if len(self.segments) == 1 or not context_data:
+            return self.content
+        parts = []
+        for index, segment in enumerate(self.segments):
+            if index % 2 == 0:
+                parts.append(segment)
+            elif segment in context_data:
+                parts.append(str(context_data[segment]))
+            else:
+                parts.append(f'{{{segment}}}')
+        return ''.join(parts)
+
+    @property
+    def variables(self) -> List[str]:
+        return self.segments[1::2]
+
+
+_compiled: 'OrderedDict[Tuple, CompiledTemplate]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def compile_template(template) -> CompiledTemplate:
+    """Template compilado do cache (por id e updated_at); objetos não salvos não são guardados"""
+    if template.pk is None or template.updated_at is None:
+        return CompiledTemplate(template.content)
+
+    key = (template.pk, template.updated_at)
+    with _lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    compiled = CompiledTemplate(template.content)
+    with _lock:
+        _compiled[key] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
@@ -0,0 +1,141 @@
+"""
+Buffer de gravação em lote: thread de fundo, novas tentativas e limite da fila
+"""
+
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core import batch_buffer
+from core.batch_buffer import BatchBuffer
+
+
+class Writer:
+    """Writer de teste: guarda os lotes e falha nas primeiras `failures` chamadas"""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, items):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        self.batches.append(list(items))
+        self.written.set()
+
+
+class BatchBufferTests(SimpleTestCase):
+
+    def buffer(self, writer, **kwargs):
+        buffer = BatchBuffer(writer, name='teste', **kwargs)
+        # O flush no encerramento do processo não interessa aos testes
+        batch_buffer.atexit.unregister(buffer._flush_on_exit)
+        return buffer
+
+    def sync_buffer(self, writer, **kwargs):
+        """Sem a thread de fundo: os testes chamam flush() diretamente"""
+        patcher = mock.patch.object(BatchBuffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return self.buffer(writer, flush_interval=3600, **kwargs)
+
+    def test_flusher_thread_writes_when_the_buffer_fills(self):
+        writer = Writer()
+        buffer = self.buffer(writer, flush_size=3, flush_interval=3600)
+
+        for item in range(3):
+            buffer.record(item)
+
+        self.assertTrue(writer.written.wait(5))
+        self.assertEqual(writer.batches, [[0, 1, 2]])
+        self.assertEqual(buffer._thread.name, 'teste-flusher')
+        self.assertEqual(len(buffer), 0)
+
+    def test_flusher_thread_writes_after_the_interval(self):
+        writer = Writer()
+        buffer = self.buffer(writer, flush_size=100, flush_interval=0.05)
+
+        buffer.record('a')
+
+        self.assertTrue(writer.written.wait(5))
+        self.assertEqual(writer.batches, [['a']])
+
+    def test_forked_worker_starts_its_own_thread(self):
+        buffer = self.buffer(Writer(), flush_interval=3600)
+        buffer.record('a')
+        parent_thread, parent_pid = buffer._thread, buffer._pid
+
+        buffer.record('b')
+        self.assertIs(buffer._thread, parent_thread)
+
+        # Após o fork o PID muda e a thread herdada não existe no filho
+        with mock.patch.object(batch_buffer.os, 'getpid', return_value=parent_pid + 1):
+            buffer.record('c')
+
+        self.assertIsNot(buffer._thread, parent_thread)
+        self.assertEqual(buffer._pid, parent_pid + 1)
+        self.assertTrue(buffer._thread.is_alive())
+        self.assertEqual(buffer.drain(), ['a', 'b', 'c'])
+
+    def test_failed_batch_is_requeued_until_it_is_written(self):
+        writer = Writer(failures=2)
+        buffer = self.sync_buffer(writer, max_retries=3)
+        buffer.record('a')
+
+        with self.assertLogs('core', 'WARNING') as logs:
+            self.assertEqual(buffer.flush(), 0)
+            buffer.record('b')
+            self.assertEqual(buffer.flush(), 0)
+
+        self.assertIn('nova tentativa 2/3', logs.output[-1])
+        self.assertEqual(buffer.flush(), 2)
+        # A ordem de chegada é mantida após as novas tentativas
+        self.assertEqual(writer.batches, [['a', 'b']])
+        self.assertEqual((buffer.dropped, buffer._failures), (0, 0))
+
+    def test_batch_is_dropped_after_max_retries(self):
+        writer = Writer(failures=3)
+        buffer = self.sync_buffer(writer, max_retries=2)
+        buffer.record('a')
+
+        with self.assertLogs('core', 'WARNING') as logs:
+            for _ in range(3):
+                buffer.flush()
+
+        self.assertIn('descartados após 3 tentativas', logs.output[-1])
+        self.assertEqual((len(buffer), buffer.dropped, buffer._failures), (0, 1, 0))
+        # O contador recomeça: o próximo lote tem suas próprias tentativas
+        buffer.record('b')
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(writer.batches, [['b']])
+
+    def test_full_buffer_drops_the_oldest_items(self):
+        buffer = self.sync_buffer(Writer(), max_buffer=3)
+
+        for item in range(5):
+            buffer.record(item)
+
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(buffer.drain(), [2, 3, 4])
+
+    def test_requeue_keeps_the_limit(self):
+        writer = Writer(failures=1)
+        buffer = self.sync_buffer(writer, max_buffer=3)
+        buffer.record('a')
+        buffer.record('b')
+
+        # Enquanto o lote falha, novos acessos chegam
+        def failing_writer(items):
+            buffer.record('c')
+            buffer.record('d')
+            writer(items)
+
+        buffer.writer = failing_writer
+        with self.assertLogs('core', 'WARNING'):
+            buffer.flush()
+
+        self.assertEqual(buffer.dropped, 1)
+        self.assertEqual(buffer.drain(), ['b', 'c', 'd'])
@@ -0,0 +1,75 @@
+"""
+Fluxo compilado do chatbot: sem desvios, segue a sequência original de passos
+"""
+
+from django.test import TestCase
+
+from core.chatbot_flow import build_flow, next_step_for, normalize
+from core.models import WhatsAppTemplate
+
+
+def baseline_walk(replies):
+    """Sequência original: template do passo atual (.filter().first()) e passo + 1"""
+    step, sent = 0, []
+    for _ in replies:
+        template = WhatsAppTemplate.objects.filter(step_number=step, is_active=True).first()
+        if template is None:
+            break
+        sent.append(template.name)
+        step += 1
+    return sent
+
+
+def flow_walk(flow, replies):
+    step, last_step, sent = 0, None, []
+    for reply in replies:
+        step = next_step_for(flow, step, last_step, reply)
+        if step not in flow:
+            break
+        sent.append(flow[step].template.name)
+        last_step, step = step, flow[step].next_step
+    return sent
+
+
+class ChatbotFlowTests(TestCase):
+
+    def active_flow(self):
+        return build_flow(WhatsAppTemplate.objects.filter(is_active=True))
+
+    def test_linear_flow_matches_the_baseline(self):
+        WhatsAppTemplate.objects.create(name='b-boas-vindas', content='Olá', step_number=0)
+        WhatsAppTemplate.objects.create(name='a-boas-vindas', content='Oi', step_number=0)
+        WhatsAppTemplate.objects.create(name='inativo', content='-', step_number=1, is_active=False)
+        WhatsAppTemplate.objects.create(name='servicos', content='Serviços', step_number=1)
+        WhatsAppTemplate.objects.create(name='fim', content='Tchau', step_number=2)
+        replies = ['oi', 'quero saber', 'ok', 'mais alguma coisa?']
+
+        self.assertEqual(flow_walk(self.active_flow(), replies), baseline_walk(replies))
+        self.assertEqual(flow_walk(self.active_flow(), replies), ['a-boas-vindas', 'servicos', 'fim'])
+
+    def test_gap_in_steps_ends_like_the_baseline(self):
+        WhatsAppTemplate.objects.create(name='inicio', content='Olá', step_number=0)
+        WhatsAppTemplate.objects.create(name='perdido', content='-', step_number=2)
+        replies = ['oi', 'e aí', 'alô']
+
+        self.assertEqual(flow_walk(self.active_flow(), replies), baseline_walk(replies))
+
+    def test_transitions_route_the_reply_to_the_last_sent_step(self):
+        WhatsAppTemplate.objects.create(
+            name='menu', content='1 orçamento, 2 suporte', step_number=0, next_step=9,
+            transitions={'Orçamento': 10, '2': 20, 'falar com atendente': 30, 'x': 'inválido'},
+        )
+        flow = self.active_flow()
+
+        self.assertEqual(flow[0].transitions, {'orcamento': 10, '2': 20, 'falar com atendente': 30})
+        self.assertEqual(flow[0].next_step, 9)
+        self.assertEqual(next_step_for(flow, 9, 0, 'Quero um ORÇAMENTO!'), 10)
+        self.assertEqual(next_step_for(flow, 9, 0, 'opção 2, por favor'), 20)
+        self.assertEqual(next_step_for(flow, 9, 0, 'Falar com atendente.'), 30)
+        self.assertEqual(next_step_for(flow, 9, 0, 'não sei'), 9)
+        # Sem passo enviado (sessão nova) não há desvio
+        self.assertEqual(next_step_for(flow, 0, None, 'orçamento'), 0)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Orçamento,  JÁ!  '), 'orcamento ja')
+        self.assertEqual(normalize(None), '')
@@ -0,0 +1,79 @@
+"""
+Exports em segundo plano: download restrito ao dono e limpeza após falha
+"""
+
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import export_service
+from core.export_service import claim_next_export, enqueue_export, run_export_job
+from core.models import AnalyticsExport
+
+
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.owner = User.objects.create_user('dono', password='senha', is_staff=True)
+
+    def run_job(self):
+        with self.assertLogs('core.admin', 'INFO'):
+            enqueue_export(self.owner, data_type='sessions')
+            return run_export_job(claim_next_export())
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_download_is_limited_to_the_owner(self):
+        export = self.run_job()
+        url = reverse('core_admin:download_export', args=[export.pk])
+
+        self.client.force_login(User.objects.create_user('outro', password='senha', is_staff=True))
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(self.owner)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_failure_after_saving_removes_the_file(self):
+        with mock.patch.object(export_service.ExportRange, 'commit', side_effect=RuntimeError('falhou')):
+            export = self.run_job()
+
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.error_message), ('failed', 'falhou'))
+        self.assertFalse(export.file_path)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_malformed_dates_are_rejected_before_enqueue(self):
+        self.client.force_login(self.owner)
+        url = reverse('core_admin:request_export')
+
+        for dates in ({'date_from': 'ontem'}, {'date_to': '2024-13-01'}, {'date_to': '2024-02-30'}):
+            with self.subTest(dates=dates), self.assertLogs('django.request', 'WARNING'):
+                response = self.client.post(url, {'type': 'sessions', **dates})
+                self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(AnalyticsExport.objects.exists())
+
+        with self.assertLogs('core.admin', 'INFO'):
+            response = self.client.post(url, {'type': 'sessions', 'date_from': '2024-01-01', 'date_to': '2024-01-31'})
+        self.assertEqual(response.status_code, 302)
+        export = AnalyticsExport.objects.get()
+        self.assertEqual((str(export.date_range_start), str(export.date_range_end)), ('2024-01-01', '2024-01-31'))
@@ -0,0 +1,79 @@
+"""
+Limitador de taxa: reservas no token bucket local e nas janelas compartilhadas
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.rate_limiter import RateLimiter, TokenBucket
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_then_waits_one_interval_per_token(self):
+        with mock.patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            bucket = TokenBucket(rate=10, capacity=2)
+            waits = [bucket.reserve(max_wait=1) for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.1)
+        self.assertAlmostEqual(waits[3], 0.2)
+
+    def test_reservation_beyond_max_wait_is_refused(self):
+        with mock.patch('core.rate_limiter.time.monotonic', return_value=100.0):
+            bucket = TokenBucket(rate=10, capacity=1)
+            self.assertEqual(bucket.reserve(max_wait=0), 0.0)
+            self.assertIsNone(bucket.reserve(max_wait=0.05))
+            # A recusa não consome ficha
+            self.assertAlmostEqual(bucket.reserve(max_wait=1), 0.1)
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        sleep = mock.patch('core.rate_limiter.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_local_mode_splits_the_rate_between_processes(self):
+        limiter = RateLimiter('teste', rate=10, burst=4, shared=False, processes=2)
+
+        self.assertEqual((limiter.local.rate, limiter.local.capacity), (5, 2))
+        self.assertEqual(limiter.stats()['backend'], 'local')
+
+    def test_shared_windows_spread_slots_after_the_burst(self):
+        limiter = RateLimiter('teste', rate=2, burst=1, max_wait=1.2, shared=True)
+
+        with mock.patch('core.rate_limiter.time.time', return_value=1000.0):
+            waits = [limiter.acquire() for _ in range(4)]
+
+        # Janela de 1 s com 2 vagas: 1 na hora, a outra após 1/rate; depois a próxima janela
+        self.assertEqual(waits, [0.0, 0.5, 1.0, None])
+        self.assertEqual(limiter.stats()['rejected'], 1)
+        self.sleep.assert_has_calls([mock.call(0.5), mock.call(1.0)])
+
+    def test_fractional_rate_uses_a_longer_window(self):
+        limiter = RateLimiter('lento', rate=0.5, max_wait=5, shared=True)
+
+        self.assertEqual((limiter.window_slots, limiter.window), (1, 2.0))
+        with mock.patch('core.rate_limiter.time.time', return_value=1001.0):
+            self.assertEqual([limiter.acquire() for _ in range(2)], [0.0, 1.0])
+
+    def test_acquire_max_wait_overrides_the_default(self):
+        limiter = RateLimiter('web', rate=1, max_wait=30, shared=True)
+
+        with mock.patch('core.rate_limiter.time.time', return_value=1000.0):
+            self.assertEqual(limiter.acquire(max_wait=0.5), 0.0)
+            self.assertIsNone(limiter.acquire(max_wait=0.5))
+            self.assertEqual(limiter.acquire(), 1.0)
+
+    def test_cache_failure_falls_back_to_the_local_bucket(self):
+        limiter = RateLimiter('teste', rate=10, shared=True)
+
+        with mock.patch.object(limiter.cache, 'incr', side_effect=ConnectionError('redis fora')), \
+                self.assertLogs('core', 'WARNING'):
+            self.assertEqual(limiter.acquire(), 0.0)
+        self.assertFalse(limiter.shared)
@@ -0,0 +1,181 @@
+"""
+Resumos pré-agregados do analytics: mesmos números das consultas ao vivo
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.export_service import start_of_day
+from core.models import Cookie, DailyTrafficRollup, HourlyTrafficRollup, PageView, Session
+from core.rollup_service import (
+    active_sessions_since, aggregate_rollups, has_rollups, top_pages, traffic_totals
+)
+from core.views import AdminDashboardView
+
+
+class RollupTestCase(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        # Meio-dia evita que os registros mudem de dia conforme a hora do teste
+        self.noon = start_of_day(self.today) + timedelta(hours=12)
+
+    def visit(self, key, created_at, last_activity=None, pages=(), cookies=0, is_active=True):
+        session = Session.objects.create(
+            session_key=key, ip_address='127.0.0.1', user_agent='teste',
+            created_at=created_at, is_active=is_active,
+        )
+        # last_activity é auto_now: só um update grava outro horário
+        Session.objects.filter(pk=session.pk).update(last_activity=last_activity or created_at)
+        for url in pages:
+            PageView.objects.create(session=session, url=url, title=url, created_at=created_at)
+        for index in range(cookies):
+            Cookie.objects.create(session=session, name=f'c{index}', value='v', domain='', path='/',
+                                  created_at=created_at)
+        return session
+
+    def add_visits(self):
+        days_ago = lambda days: self.noon - timedelta(days=days)
+        self.visit('a' * 32, days_ago(40), pages=['/', '/servicos/'], cookies=1)
+        self.visit('b' * 32, days_ago(3), last_activity=self.noon - timedelta(hours=1), pages=['/'], cookies=2)
+        self.visit('c' * 32, days_ago(1), pages=['/', '/contato/', '/'])
+        self.visit('d' * 32, self.noon, pages=['/servicos/'])
+        # Inativos não entram em nenhuma das contagens
+        self.visit('e' * 32, self.noon, pages=['/'], cookies=1, is_active=False)
+
+    def aggregate(self, **kwargs):
+        with self.assertLogs('core', 'INFO'):
+            return aggregate_rollups(**kwargs)
+
+    def live_totals(self, since=None):
+        created = {'created_at__gte': start_of_day(since)} if since else {}
+        return {
+            'sessions': Session.objects.filter(is_active=True, **created).count(),
+            'pageviews': PageView.objects.filter(is_active=True, **created).count(),
+            'cookies': Cookie.objects.filter(is_active=True, **created).count(),
+        }
+
+
+class RollupServiceTests(RollupTestCase):
+
+    def test_totals_match_the_live_queries(self):
+        self.add_visits()
+        self.assertFalse(has_rollups())
+
+        self.aggregate(rebuild=True)
+
+        self.assertTrue(has_rollups())
+        for since in (None, self.today - timedelta(days=30), self.today):
+            with self.subTest(since=since):
+                totals = traffic_totals(since=since)
+                self.assertEqual({name: totals[name] for name in ('sessions', 'pageviews', 'cookies')},
+                                 self.live_totals(since))
+
+        live_top_pages = list(
+            PageView.objects.filter(is_active=True).values('url', 'title')
+            .annotate(total=Count('id')).order_by('-total', 'url')
+        )
+        self.assertEqual(sorted(top_pages(limit=10), key=lambda page: (-page['total'], page['url'])),
+                         live_top_pages)
+
+        last_24h = timezone.now() - timedelta(hours=24)
+        self.assertEqual(active_sessions_since(last_24h),
+                         Session.objects.filter(is_active=True, last_activity__gte=last_24h).count())
+
+    def test_active_sessions_are_bucketed_by_last_activity(self):
+        created, last_activity = self.noon - timedelta(days=3), self.noon - timedelta(hours=1)
+        self.visit('a' * 32, created, last_activity=last_activity)
+
+        self.aggregate(rebuild=True)
+
+        # A sessão conta no dia em que foi criada e, como ativa, na hora da última atividade
+        self.assertEqual(
+            dict(DailyTrafficRollup.objects.values_list('day', 'sessions')),
+            {created.date(): 1, self.today: 0}
+        )
+        self.assertEqual(
+            list(HourlyTrafficRollup.objects.filter(active_sessions__gt=0).values_list('hour', 'active_sessions')),
+            [(last_activity, 1)]
+        )
+        self.assertEqual(active_sessions_since(timezone.now() - timedelta(hours=24)), 1)
+        self.assertEqual(active_sessions_since(self.noon), 0)
+
+    def test_incremental_run_starts_at_the_last_rollup_day(self):
+        self.add_visits()
+        self.assertEqual(self.aggregate()[0], (self.noon - timedelta(days=40)).date())
+
+        # Registros em dias já resumidos (antes de ontem) ficam de fora da execução incremental
+        self.visit('f' * 32, self.noon - timedelta(days=3), pages=['/'])
+        self.visit('g' * 32, self.noon - timedelta(days=1), pages=['/'])
+        self.visit('h' * 32, self.noon, pages=['/', '/'])
+
+        start_day, day_count, _ = self.aggregate()
+
+        self.assertEqual((start_day, day_count), (self.today - timedelta(days=1), 2))
+        expected = self.live_totals()
+        expected['sessions'] -= 1
+        expected['pageviews'] -= 1
+        totals = traffic_totals()
+        self.assertEqual({name: totals[name] for name in expected}, expected)
+
+        # --days recalcula a janela pedida e alcança o registro atrasado
+        self.aggregate(days=4)
+        totals = traffic_totals()
+        self.assertEqual({name: totals[name] for name in expected}, self.live_totals())
+
+    def test_command_reports_an_empty_database(self):
+        out = StringIO()
+
+        call_command('aggregate_analytics', stdout=out)
+
+        self.assertIn('Nenhum dado', out.getvalue())
+        self.assertFalse(has_rollups())
+
+
+class DashboardRollupTests(RollupTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_visits()
+        self.client.force_login(User.objects.create_user('staff', password='senha', is_staff=True))
+
+    def admin_dashboard(self):
+        response = self.client.get(reverse('core_admin:admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return {name: response.context[name] for name in (
+            'total_sessions', 'total_pageviews', 'total_cookies', 'active_sessions'
+        )}
+
+    def dashboard_view(self):
+        view = AdminDashboardView()
+        view.setup(RequestFactory().get('/'))
+        context = view.get_context_data()
+        return {name: context[name] for name in ('session_count', 'pageview_count', 'cookie_count')}
+
+    def test_admin_dashboard_switches_to_rollups(self):
+        live = self.admin_dashboard()
+
+        self.aggregate(rebuild=True)
+        self.assertEqual(self.admin_dashboard(), live)
+
+        # Com resumos, registros novos só aparecem após o próximo aggregate_analytics
+        self.visit('z' * 32, self.noon, pages=['/'])
+        self.assertEqual(self.admin_dashboard(), live)
+        self.aggregate()
+        self.assertEqual(self.admin_dashboard()['total_sessions'], live['total_sessions'] + 1)
+
+    def test_dashboard_view_switches_to_rollups(self):
+        live = self.dashboard_view()
+
+        self.aggregate(rebuild=True)
+        self.assertEqual(self.dashboard_view(), live)
+
+        self.visit('z' * 32, self.noon, pages=['/'])
+        self.assertEqual(self.dashboard_view(), live)
@@ -0,0 +1,64 @@
+"""
+Templates pré-compilados: mesmo resultado do render_content original
+"""
+
+from django.test import TestCase
+
+from core.models import WhatsAppTemplate
+from core.template_renderer import CompiledTemplate, compile_template
+
+
+def baseline_render(content, context_data=None):
+    """render_content antes da compilação: um str.replace por variável do contexto"""
+    if not context_data:
+        return content
+    for key, value in context_data.items():
+        content = content.replace(f"{{{key}}}", str(value))
+    return content
+
+
+CONTEXT = {'contact_name': 'Ana', 'current_step': 2, 'session_id': 'sessao-1', 'vazio': ''}
+
+
+class CompiledTemplateTests(TestCase):
+
+    def test_render_matches_the_baseline(self):
+        contents = [
+            'Sem variáveis',
+            'Olá {contact_name}!',
+            '{contact_name}, passo {current_step} ({contact_name})',
+            'Desconhecida {telefone} fica como está',
+            'Chaves {} e {{contact_name}} e {contact_name',
+            '{vazio}fim',
+            '',
+        ]
+        for content in contents:
+            for context_data in (None, {}, CONTEXT):
+                with self.subTest(content=content, context_data=context_data):
+                    self.assertEqual(CompiledTemplate(content).render(context_data),
+                                     baseline_render(content, context_data))
+
+    def test_variables(self):
+        self.assertEqual(CompiledTemplate('{a} e {b} e {a}').variables, ['a', 'b', 'a'])
+
+    def test_render_content_uses_the_compiled_template(self):
+        template = WhatsAppTemplate.objects.create(name='boas-vindas', content='Olá {contact_name}!')
+
+        self.assertIs(compile_template(template), compile_template(template))
+        self.assertEqual(template.render_content(CONTEXT), baseline_render(template.content, CONTEXT))
+
+    def test_edit_compiles_a_new_version(self):
+        template = WhatsAppTemplate.objects.create(name='boas-vindas', content='Olá {contact_name}!')
+        compiled = compile_template(template)
+
+        template.content = 'Oi {contact_name}'
+        template.save()
+
+        self.assertIsNot(compile_template(template), compiled)
+        self.assertEqual(template.render_content(CONTEXT), 'Oi Ana')
+
+    def test_unsaved_templates_are_not_cached(self):
+        template = WhatsAppTemplate(name='rascunho', content='Olá {contact_name}!')
+
+        self.assertIsNot(compile_template(template), compile_template(template))
+        self.assertEqual(template.render_content(CONTEXT), 'Olá Ana!')
@@ -0,0 +1,114 @@
+"""
+Rastreamento de acessos: cookie da visita e gravação em lote dos acessos
+"""
+
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core import tracking_service
+from core.models import Cookie, PageView, Session
+from core.tracking_service import (
+    TRACKING_COOKIE_NAME, TRACKING_COOKIE_REFRESH_AFTER, TRACKING_SESSION_TIMEOUT, PageHit,
+    parse_visit_cookie, visit_cookie_value, write_hits
+)
+
+
+def page_hit(session_key, timestamp, url='http://testserver/', cookies=()):
+    return PageHit(
+        session_key=session_key, ip_address='127.0.0.1', user_agent='teste', referrer=None,
+        user_id=None, url=url, title='home', timestamp=timestamp, cookies=list(cookies),
+    )
+
+
+class WriteHitsTests(TestCase):
+
+    def test_rows_keep_the_time_of_the_hit(self):
+        # Lote gravado bem depois dos acessos (flush atrasado ou reenvio após falha)
+        first = timezone.now() - timedelta(hours=2)
+        second = first + timedelta(minutes=3)
+        cookie = {'name': 'tema', 'value': 'escuro', 'domain': '', 'path': '/',
+                  'secure': False, 'httponly': False, 'samesite': None}
+
+        self.assertEqual(write_hits([
+            page_hit('a' * 32, first, cookies=[cookie]),
+            page_hit('a' * 32, second, url='http://testserver/servicos/'),
+        ]), (2, 1))
+
+        session = Session.objects.get(session_key='a' * 32)
+        self.assertEqual(session.created_at, first)
+        self.assertEqual(
+            list(PageView.objects.order_by('created_at').values_list('url', 'created_at')),
+            [('http://testserver/', first), ('http://testserver/servicos/', second)]
+        )
+        self.assertEqual(Cookie.objects.get(name='tema').created_at, first)
+
+    def test_existing_session_moves_last_activity_to_the_last_hit(self):
+        created = timezone.now() - timedelta(hours=1)
+        write_hits([page_hit('b' * 32, created)])
+        later = created + timedelta(minutes=10)
+
+        write_hits([page_hit('b' * 32, created + timedelta(minutes=5)), page_hit('b' * 32, later)])
+
+        session = Session.objects.get(session_key='b' * 32)
+        self.assertEqual((session.created_at, session.last_activity), (created, later))
+
+
+class VisitCookieTests(TestCase):
+
+    def setUp(self):
+        # Só o cookie importa aqui: os acessos não vão para o buffer
+        patcher = mock.patch.object(tracking_service.pageview_buffer, 'record')
+        self.record = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def visit(self, cookie=None):
+        if cookie is not None:
+            self.client.cookies[TRACKING_COOKIE_NAME] = cookie
+        with self.assertLogs('core', 'INFO'):  # log da view home
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def recorded_key(self):
+        return self.record.call_args.args[0].session_key
+
+    def test_new_visit_gets_a_cookie(self):
+        response = self.visit()
+
+        morsel = response.cookies[TRACKING_COOKIE_NAME]
+        session_key, issued_at = parse_visit_cookie(morsel.value)
+        self.assertEqual(session_key, self.recorded_key())
+        self.assertAlmostEqual(issued_at, time.time(), delta=5)
+        self.assertEqual(int(morsel['max-age']), TRACKING_SESSION_TIMEOUT)
+
+    def test_recent_cookie_is_not_sent_again(self):
+        response = self.visit(visit_cookie_value('a' * 32, int(time.time()) - 10))
+
+        self.assertNotIn(TRACKING_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.recorded_key(), 'a' * 32)
+
+    def test_cookie_near_expiry_is_renewed_with_the_same_key(self):
+        issued_at = int(time.time()) - TRACKING_COOKIE_REFRESH_AFTER - 1
+
+        response = self.visit(visit_cookie_value('a' * 32, issued_at))
+
+        session_key, renewed_at = parse_visit_cookie(response.cookies[TRACKING_COOKIE_NAME].value)
+        self.assertEqual((session_key, self.recorded_key()), ('a' * 32, 'a' * 32))
+        self.assertGreater(renewed_at, issued_at)
+
+    def test_cookie_without_issue_time_is_renewed(self):
+        # Formato anterior: só a chave
+        response = self.visit('a' * 32)
+
+        self.assertEqual(parse_visit_cookie(response.cookies[TRACKING_COOKIE_NAME].value)[0], 'a' * 32)
+
+    def test_invalid_cookie_starts_a_new_visit(self):
+        response = self.visit('nao-e-uma-chave')
+
+        self.assertNotEqual(self.recorded_key(), 'nao-e-uma-chave')
+        self.assertEqual(parse_visit_cookie(response.cookies[TRACKING_COOKIE_NAME].value)[0],
+                         self.recorded_key())
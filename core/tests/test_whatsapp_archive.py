@@ -0,0 +1,80 @@
+"""
+Arquivo frio do WhatsApp: segmentos por dia, reidratação e rollback
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from core import whatsapp_archive
+from core.models import WhatsAppArchiveSegment, WhatsAppContact, WhatsAppMessage, WhatsAppSession
+from core.whatsapp_archive import archive_queryset, session_history
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = mock.patch.object(whatsapp_archive, 'ARCHIVE_ROOT', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        self.session = WhatsAppSession.objects.create(contact=contact, session_id='sessao-1')
+        # Duas mensagens em um dia e uma no dia seguinte (10h locais: nenhuma vira o dia)
+        start = timezone.localtime(timezone.now() - timedelta(days=60)).replace(
+            hour=10, minute=0, second=0, microsecond=0
+        )
+        for index, offset in enumerate((0, 1, 25)):
+            WhatsAppMessage.objects.create(
+                session=self.session, message_id=f'wamid.{index}', direction='incoming',
+                content=f'mensagem {index}', timestamp=start + timedelta(hours=offset),
+            )
+        WhatsAppSession.objects.filter(pk=self.session.pk).update(
+            started_at=start, last_activity=start + timedelta(hours=25)
+        )
+
+    def archived_files(self):
+        return [name for _, _, files in os.walk(self.root) for name in files]
+
+    def test_archive_moves_rows_to_daily_segments(self):
+        with transaction.atomic():
+            self.assertEqual(archive_queryset(WhatsAppMessage.objects.all()), 3)
+
+        self.assertFalse(WhatsAppMessage.objects.exists())
+        segments = list(WhatsAppArchiveSegment.objects.order_by('day'))
+        self.assertEqual([segment.record_count for segment in segments], [2, 1])
+        self.assertTrue(all(segment.session_ids == [self.session.pk] for segment in segments))
+        self.assertEqual(len(self.archived_files()), 2)
+
+        history = session_history(self.session.pk)
+        self.assertEqual([message['content'] for message in history['messages']],
+                         ['mensagem 0', 'mensagem 1', 'mensagem 2'])
+        self.assertTrue(all(message['archived'] for message in history['messages']))
+
+    def test_failed_archive_removes_written_segments(self):
+        create = WhatsAppArchiveSegment.objects.create
+        calls = []
+
+        def create_then_fail(**kwargs):
+            calls.append(kwargs['path'])
+            if len(calls) == 2:
+                raise IntegrityError('segmento duplicado')
+            return create(**kwargs)
+
+        with mock.patch.object(WhatsAppArchiveSegment.objects, 'create', side_effect=create_then_fail):
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    archive_queryset(WhatsAppMessage.objects.all())
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.archived_files(), [])
+        self.assertFalse(WhatsAppArchiveSegment.objects.exists())
+        self.assertEqual(WhatsAppMessage.objects.count(), 3)
@@ -0,0 +1,102 @@
+"""
+Webhooks com várias mensagens: lote único, duplicadas e remetentes filtrados
+"""
+
+import time
+from unittest import mock
+
+from django.db import transaction
+
+from core import whatsapp_service
+from core.models import WhatsAppContact, WhatsAppMessage, WhatsAppOutboundMessage, WhatsAppSession, WhatsAppTemplate
+from core.tests.test_whatsapp_queue import WhatsAppQueueTestCase
+from core.whatsapp_service import webhook_handler
+
+
+def text_message(message_id, phone_number, body='oi'):
+    return {
+        'id': message_id, 'from': phone_number, 'timestamp': str(int(time.time())),
+        'type': 'text', 'text': {'body': body},
+    }
+
+
+def batch_payload():
+    """Dois entries: a mensagem wamid.1 chega repetida e há remetentes filtrados"""
+    return {'entry': [
+        {'changes': [{'value': {
+            'contacts': [{'wa_id': '5511900000001', 'profile': {'name': 'Ana'}}],
+            'messages': [
+                text_message('wamid.1', '5511900000001'),
+                text_message('wamid.2', '5511900000002'),
+            ],
+        }}]},
+        {'changes': [{'value': {
+            'messages': [
+                text_message('wamid.1', '5511900000001'),
+                text_message('wamid.3', '5511900000003'),
+                text_message('wamid.4', '5511900000001', body='tudo bem?'),
+            ],
+        }}]},
+    ]}
+
+
+class WebhookBatchTests(WhatsAppQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        WhatsAppContact.objects.create(phone_number='5511900000002', is_blocked=True)
+        WhatsAppContact.objects.create(phone_number='5511900000003', is_my_contact=True)
+        WhatsAppTemplate.objects.create(name='boas-vindas', content='Olá {contact_name}!', step_number=0)
+        WhatsAppTemplate.objects.create(name='segundo', content='Passo {current_step}', step_number=1)
+
+    def handle(self, payload, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return webhook_handler.handle_webhook(payload, **kwargs)
+
+    def test_batch_stores_each_accepted_message_once(self):
+        result = self.handle(batch_payload())
+
+        self.assertEqual((result['status'], result['received']), ('success', 5))
+        self.assertEqual([response['body'] for response in result['responses']], ['Olá Ana!', 'Passo 1'])
+        incoming = WhatsAppMessage.objects.filter(direction='incoming').order_by('message_id')
+        self.assertEqual([message.message_id for message in incoming], ['wamid.1', 'wamid.4'])
+        self.assertEqual(WhatsAppMessage.objects.filter(direction='outgoing').count(), 2)
+        self.assertEqual(WhatsAppOutboundMessage.objects.count(), 2)
+
+        session = WhatsAppSession.objects.get(contact__phone_number='5511900000001')
+        self.assertEqual((session.contact.name, session.current_step), ('Ana', 2))
+        self.assertFalse(WhatsAppSession.objects.exclude(pk=session.pk).exists())
+
+    def test_resent_batch_is_not_processed_again(self):
+        self.handle(batch_payload())
+
+        self.assertEqual(self.handle(batch_payload())['status'], 'duplicate')
+        # Sem o cache de ids, o índice de message_id descarta as já gravadas
+        self.assertEqual(self.handle(batch_payload(), dedupe=False)['status'], 'filtered')
+        self.assertEqual(WhatsAppMessage.objects.filter(direction='incoming').count(), 2)
+        self.assertEqual(WhatsAppOutboundMessage.objects.count(), 2)
+
+    def test_known_filtered_senders_are_dropped_before_the_batch(self):
+        # Contatos já no LRU do processo: o lote nem chega a consultar o banco por eles
+        whatsapp_service.contact_resolver.remember(WhatsAppContact.objects.filter(is_blocked=True))
+
+        with mock.patch.object(whatsapp_service.WhatsAppChatbotService, '_process_batch',
+                               return_value=[]) as process_batch:
+            self.handle({'entry': [{'changes': [{'value': {
+                'messages': [text_message('wamid.2', '5511900000002'), text_message('wamid.1', '5511900000001')],
+            }}]}]})
+
+        self.assertEqual([message['id'] for message in process_batch.call_args.args[0]], ['wamid.1'])
+
+    def test_error_rolls_back_the_whole_batch(self):
+        with mock.patch.object(whatsapp_service, 'schedule_responses', side_effect=RuntimeError('falhou')), \
+                self.assertLogs('core.whatsapp_service', 'ERROR'):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                whatsapp_service.whatsapp_service.process_incoming_batch(
+                    webhook_handler._extract_messages(batch_payload())
+                )
+
+        self.assertFalse(WhatsAppMessage.objects.exists())
+        self.assertFalse(WhatsAppContact.objects.filter(phone_number='5511900000001').exists())
+        # Os ids não ficam marcados: o reenvio do webhook processa o lote
+        self.assertEqual(self.handle(batch_payload())['status'], 'success')
@@ -0,0 +1,198 @@
+"""
+Broadcast do WhatsApp: pool limitado, ritmo máximo e gravação dos resultados
+"""
+
+import json
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+
+from core import whatsapp_broadcast
+from core.models import WhatsAppConfig, WhatsAppContact, WhatsAppMessage, WhatsAppSession
+from core.tests.test_whatsapp_queue import WhatsAppQueueTestCase, api_response
+from core.whatsapp_broadcast import RatePacer, broadcast, broadcast_recipients
+
+
+class FakeGraphApi:
+    """whatsapp_http.post falso: conta as chamadas simultâneas e devolve um wamid por telefone"""
+
+    def __init__(self, delay=0.0, failing=()):
+        self.delay = delay
+        self.failing = set(failing)
+        self.calls = []
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path, access_token, payload, max_wait=None):
+        with self._lock:
+            self.calls.append(payload['to'])
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if payload['to'] in self.failing:
+                return api_response(500, '{"error": "falhou"}')
+            return api_response(200, json.dumps({'messages': [{'id': f"wamid.{payload['to']}"}]}))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class BroadcastTestCase(WhatsAppQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        WhatsAppConfig.objects.create(key='whatsapp_access_token', value='token')
+        WhatsAppConfig.objects.create(key='whatsapp_phone_number_id', value='123')
+        WhatsAppConfig.invalidate_cache()
+        self.contacts = [
+            WhatsAppContact.objects.create(phone_number=f'55119000000{index:02d}') for index in range(12)
+        ]
+
+    def run_broadcast(self, api, **kwargs):
+        kwargs.setdefault('rate', 0)
+        with mock.patch.object(whatsapp_broadcast.whatsapp_http, 'post', side_effect=api), \
+                self.captureOnCommitCallbacks(execute=True), \
+                self.assertLogs('core.whatsapp_broadcast', 'INFO') as logs:
+            result = broadcast(broadcast_recipients(), **kwargs)
+        self.logs = logs.output
+        return result
+
+
+class BroadcastTests(BroadcastTestCase):
+
+    def test_pool_never_exceeds_the_workers(self):
+        api = FakeGraphApi(delay=0.02)
+
+        result = self.run_broadcast(api, message='Novidades!', workers=3)
+
+        self.assertEqual((result.total, result.sent, result.failed), (12, 12, 0))
+        self.assertLessEqual(api.max_active, 3)
+        self.assertEqual(sorted(api.calls), [contact.phone_number for contact in self.contacts])
+
+    def test_pending_requests_are_bounded(self):
+        api = FakeGraphApi(delay=0.01)
+        submit = whatsapp_broadcast.ThreadPoolExecutor.submit
+        futures, pending = [], []
+
+        def counting_submit(pool, *args, **kwargs):
+            pending.append(sum(1 for future in futures if not future.done()))
+            futures.append(submit(pool, *args, **kwargs))
+            return futures[-1]
+
+        with mock.patch.object(whatsapp_broadcast.ThreadPoolExecutor, 'submit', counting_submit):
+            self.run_broadcast(api, message='Novidades!', workers=2)
+
+        # Nunca mais que 2x workers requisições pendentes (na fila ou em execução)
+        self.assertLessEqual(max(pending), 2 * 2)
+
+    def test_results_are_written_in_one_batch(self):
+        api = FakeGraphApi(failing={self.contacts[0].phone_number})
+
+        with mock.patch.object(whatsapp_broadcast, 'BROADCAST_WRITE_BATCH', 100), \
+                mock.patch.object(WhatsAppMessage.objects, 'bulk_create',
+                                  wraps=WhatsAppMessage.objects.bulk_create) as bulk_create:
+            result = self.run_broadcast(api, message='Novidades!', workers=4)
+
+        self.assertEqual((result.sent, result.failed), (11, 1))
+        self.assertIn('Erro na API: 500', result.errors[self.contacts[0].phone_number])
+        bulk_create.assert_called_once()
+        self.assertEqual(bulk_create.call_args.kwargs, {'ignore_conflicts': True})
+        messages = WhatsAppMessage.objects.filter(direction='outgoing')
+        self.assertEqual(messages.count(), 11)
+        self.assertEqual(set(messages.values_list('content', flat=True)), {'Novidades!'})
+        self.assertEqual(WhatsAppSession.objects.count(), 11)
+
+    def test_resumed_broadcast_skips_messages_already_stored(self):
+        # Reexecução após uma interrupção: parte dos wamids já foi gravada
+        api = FakeGraphApi()
+        self.run_broadcast(api, message='Novidades!')
+        WhatsAppMessage.objects.filter(message_id__in=[f'wamid.{c.phone_number}' for c in self.contacts[6:]]).delete()
+
+        result = self.run_broadcast(api, message='Novidades!')
+
+        self.assertEqual((result.sent, result.failed), (12, 0))
+        self.assertEqual(WhatsAppMessage.objects.filter(direction='outgoing').count(), 12)
+
+    def test_write_error_does_not_stop_the_broadcast(self):
+        with mock.patch.object(whatsapp_broadcast, '_write_results', side_effect=RuntimeError('banco')):
+            result = self.run_broadcast(FakeGraphApi(), message='Novidades!')
+
+        self.assertEqual(result.sent, 12)
+        self.assertTrue(any('erro ao gravar 12 resultado(s)' in line for line in self.logs))
+
+    def test_rate_spaces_the_requests(self):
+        started = time.monotonic()
+
+        self.run_broadcast(FakeGraphApi(), message='Novidades!', rate=200, workers=4)
+
+        # 12 envios a 200/s: ao menos 11 intervalos de 5 ms
+        self.assertGreaterEqual(time.monotonic() - started, 11 / 200)
+
+    def test_message_or_template_is_required(self):
+        with self.assertRaises(ValueError):
+            broadcast(broadcast_recipients())
+
+
+class RatePacerTests(BroadcastTestCase):
+
+    def test_wait_sleeps_until_the_next_slot(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(round(seconds, 6))
+            clock[0] += seconds
+
+        with mock.patch.object(whatsapp_broadcast.time, 'monotonic', side_effect=lambda: clock[0]), \
+                mock.patch.object(whatsapp_broadcast.time, 'sleep', side_effect=sleep):
+            pacer = RatePacer(4)
+            for _ in range(3):
+                pacer.wait()
+            clock[0] += 1  # Pausa longa: o próximo envio sai na hora
+            pacer.wait()
+
+        self.assertEqual(sleeps, [0.25, 0.25])
+
+    def test_zero_rate_does_not_wait(self):
+        with mock.patch.object(whatsapp_broadcast.time, 'sleep') as sleep:
+            pacer = RatePacer(0)
+            for _ in range(5):
+                pacer.wait()
+
+        sleep.assert_not_called()
+
+
+class BroadcastCommandTests(BroadcastTestCase):
+
+    def call(self, *args, api=None):
+        out = StringIO()
+        with mock.patch.object(whatsapp_broadcast.whatsapp_http, 'post', side_effect=api or FakeGraphApi()), \
+                self.captureOnCommitCallbacks(execute=True):
+            if '--dry-run' in args:
+                call_command('broadcast_whatsapp', *args, stdout=out)
+            else:
+                with self.assertLogs('core.whatsapp_broadcast', 'INFO'):
+                    call_command('broadcast_whatsapp', *args, stdout=out)
+        return out.getvalue()
+
+    def test_command_sends_to_the_recipients(self):
+        self.contacts[0].is_blocked = True
+        self.contacts[0].save()
+        api = FakeGraphApi()
+
+        output = self.call('--message', 'Novidades!', '--rate', '0', '--workers', '2', api=api)
+
+        self.assertIn('11 enviada(s), 0 com erro', output)
+        self.assertNotIn(self.contacts[0].phone_number, api.calls)
+
+    def test_dry_run_does_not_send(self):
+        api = FakeGraphApi()
+
+        output = self.call('--message', 'Novidades!', '--dry-run', api=api)
+
+        self.assertIn('12 contato(s) receberiam', output)
+        self.assertEqual(api.calls, [])
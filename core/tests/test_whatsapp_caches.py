@@ -0,0 +1,134 @@
+"""
+Caches por processo do WhatsApp: invalidação pelo cache compartilhado
+"""
+
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core import whatsapp_service
+from core.config_cache import ConfigCache, is_process_local, shared_cache
+from core.models import WhatsAppConfig, WhatsAppContact, WhatsAppMessage, WhatsAppSession, whatsapp_config_cache
+from core.whatsapp_service import SESSION_STATS_CACHE_KEY, ContactInfo, ContactResolver
+
+SHARED_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    # Outro backend no lugar do Redis: o que importa é o alias usado para as versões
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class FakeContact:
+
+    def __init__(self, pk, phone_number, is_blocked=False):
+        self.pk = pk
+        self.phone_number = phone_number
+        self.name = ''
+        self.is_my_contact = False
+        self.is_blocked = is_blocked
+        self.is_active = True
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SharedVersionTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+
+    def test_shared_alias_is_preferred(self):
+        self.assertIs(shared_cache(), caches['shared'])
+        self.assertTrue(is_process_local('default'))
+
+    def test_contact_invalidation_reaches_other_resolvers(self):
+        # Dois resolvers simulam dois workers com LRUs separados
+        saving, other = ContactResolver(check_interval=0), ContactResolver(check_interval=0)
+        other.remember([FakeContact(1, '5511900000001')])
+        self.assertEqual(other.lookup(['5511900000001']), {
+            '5511900000001': ContactInfo(1, '', False, False, True)
+        })
+
+        saving.invalidate()
+
+        self.assertIsNotNone(caches['shared'].get(saving.version_key))
+        self.assertIsNone(caches['default'].get(saving.version_key))
+        self.assertEqual(other.lookup(['5511900000001']), {})
+
+    def test_config_cache_reloads_after_shared_invalidation(self):
+        values = {'token': 'antigo'}
+        saving = ConfigCache(lambda: values.items(), 'teste:version', check_interval=0)
+        other = ConfigCache(lambda: values.items(), 'teste:version', check_interval=0)
+        self.assertEqual(other.get('token'), 'antigo')
+
+        values['token'] = 'novo'
+        saving.invalidate()
+
+        self.assertEqual(other.get('token'), 'novo')
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class WhatsAppConfigCacheTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_saving_a_config_bumps_the_shared_version(self):
+        config = WhatsAppConfig.objects.create(key='whatsapp_access_token', value='antigo')
+        self.assertEqual(WhatsAppConfig.get_value('whatsapp_access_token'), 'antigo')
+        version = caches['shared'].get(whatsapp_config_cache.version_key)
+
+        config.value = 'novo'
+        config.save()
+
+        self.assertNotEqual(caches['shared'].get(whatsapp_config_cache.version_key), version)
+        self.assertEqual(WhatsAppConfig.get_value('whatsapp_access_token'), 'novo')
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SessionStatsCacheTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        self.session = WhatsAppSession.objects.create(contact=contact, session_id='sessao-1')
+
+    def create_message(self, message_id):
+        return WhatsAppMessage.objects.create(
+            session=self.session, message_id=message_id, direction='incoming',
+            content='oi', timestamp=timezone.now(),
+        )
+
+    def test_stats_live_in_the_shared_cache(self):
+        stats = whatsapp_service.whatsapp_service.get_session_stats()
+
+        self.assertEqual(caches['shared'].get(SESSION_STATS_CACHE_KEY), stats)
+        self.assertIsNone(caches['default'].get(SESSION_STATS_CACHE_KEY))
+
+    def test_new_messages_invalidate_once_per_transaction(self):
+        self.assertEqual(whatsapp_service.whatsapp_service.get_session_stats()['messages_today'], 0)
+
+        with mock.patch.object(whatsapp_service, 'invalidate_session_stats',
+                               wraps=whatsapp_service.invalidate_session_stats) as invalidate, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks, transaction.atomic():
+            self.create_message('wamid.1')
+            self.create_message('wamid.2')
+            # Ainda dentro da transação: o cache continua valendo
+            self.assertIsNotNone(caches['shared'].get(SESSION_STATS_CACHE_KEY))
+
+        self.assertEqual(len(callbacks), 1)
+        invalidate.assert_called_once_with()
+        self.assertEqual(whatsapp_service.whatsapp_service.get_session_stats()['messages_today'], 2)
+
+    def test_updating_a_message_keeps_the_stats(self):
+        message = self.create_message('wamid.1')
+        whatsapp_service.whatsapp_service.get_session_stats()
+
+        message.content = 'editada'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            message.save()
+
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(caches['shared'].get(SESSION_STATS_CACHE_KEY))
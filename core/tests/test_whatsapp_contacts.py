@@ -0,0 +1,104 @@
+"""
+Contatos do WhatsApp: cursor da paginação e limites entre páginas
+"""
+
+import base64
+import json
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import WhatsAppContact
+from core.whatsapp_contacts import contact_page, decode_cursor, encode_cursor, search_contacts
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+class ContactCursorTests(TestCase):
+
+    def create_contacts(self, count, updated_at=None):
+        contacts = [
+            WhatsAppContact.objects.create(phone_number=f'55119{index:08d}')
+            for index in range(count)
+        ]
+        if updated_at is not None:
+            WhatsAppContact.objects.update(updated_at=updated_at)
+        return contacts
+
+    def walk(self, per_page):
+        """IDs de todas as páginas, seguindo next_cursor"""
+        pages, cursor = [], None
+        while True:
+            page, cursor = contact_page(WhatsAppContact.objects.all(), cursor, per_page)
+            pages.append([contact.pk for contact in page])
+            if cursor is None:
+                return pages
+
+    def test_cursor_round_trip(self):
+        contact = self.create_contacts(1)[0]
+        cursor = encode_cursor(contact)
+
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), (contact.updated_at, contact.pk))
+
+    def test_invalid_cursor(self):
+        for cursor in ('', 'não-é-base64', raw_cursor({}), raw_cursor([1]), raw_cursor(['ontem', 1]),
+                       raw_cursor([None, 1]), raw_cursor([timezone.now().isoformat(), 'x'])):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_split_rows_with_the_same_updated_at(self):
+        contacts = self.create_contacts(5, updated_at=timezone.now())
+        ids = sorted((contact.pk for contact in contacts), reverse=True)
+
+        self.assertEqual(self.walk(per_page=2), [ids[:2], ids[2:4], ids[4:]])
+
+    def test_last_full_page_has_no_next_cursor(self):
+        now = timezone.now()
+        contacts = self.create_contacts(4)
+        for offset, contact in enumerate(contacts):
+            WhatsAppContact.objects.filter(pk=contact.pk).update(updated_at=now - timedelta(minutes=offset))
+
+        self.assertEqual(self.walk(per_page=2), [[contacts[0].pk, contacts[1].pk], [contacts[2].pk, contacts[3].pk]])
+
+    def test_phone_search_uses_digit_prefix(self):
+        self.create_contacts(3)
+
+        found = search_contacts(WhatsAppContact.objects.all(), '(11) 9000-0000')
+        self.assertEqual(sorted(contact.phone_number for contact in found),
+                         ['5511900000000', '5511900000001', '5511900000002'])
+        self.assertFalse(search_contacts(WhatsAppContact.objects.all(), '+55 21').exists())
+
+    def test_phone_search_falls_back_to_substring(self):
+        self.create_contacts(3)
+        WhatsAppContact.objects.create(phone_number='+55 11 98888-0002')
+
+        found = search_contacts(WhatsAppContact.objects.all(), '0000001')
+        self.assertEqual([contact.phone_number for contact in found], ['5511900000001'])
+        found = search_contacts(WhatsAppContact.objects.all(), '98888-0002')
+        self.assertEqual([contact.phone_number for contact in found], ['+55 11 98888-0002'])
+
+    def test_text_search_matches_the_name(self):
+        WhatsAppContact.objects.create(phone_number='5511900000001', name='Maria')
+        WhatsAppContact.objects.create(phone_number='5511900000002', name='João')
+
+        self.assertEqual(search_contacts(WhatsAppContact.objects.all(), 'mar').get().name, 'Maria')
+
+    def test_view_follows_cursor_and_rejects_invalid_one(self):
+        self.client.force_login(User.objects.create_user('staff', password='senha', is_staff=True))
+        self.create_contacts(3)
+
+        response = self.client.get('/chatbot/contacts/', {'per_page': 2})
+        self.assertEqual(response.status_code, 200)
+        next_cursor = response.json()['pagination']['next_cursor']
+        response = self.client.get('/chatbot/contacts/', {'per_page': 2, 'cursor': next_cursor})
+        self.assertEqual(len(response.json()['contacts']), 1)
+        self.assertTrue(response.json()['pagination']['has_previous'])
+
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get('/chatbot/contacts/', {'cursor': 'inválido'})
+        self.assertEqual(response.status_code, 400)
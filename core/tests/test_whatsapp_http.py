@@ -0,0 +1,153 @@
+"""
+Cliente HTTP da Graph API contra um servidor stub local
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from core import whatsapp_http
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive: o cliente pode reaproveitar a conexão
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append({
+            'path': self.path,
+            'client': self.client_address,
+            'authorization': self.headers.get('Authorization'),
+            'payload': json.loads(body or b'null'),
+        })
+        status, headers, delay = self.server.responses.pop(0) if self.server.responses else (200, {}, 0)
+        if delay:
+            time.sleep(delay)
+        content = json.dumps({'messages': [{'id': f'wamid.{len(self.server.requests)}'}]}).encode()
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente desistiu (timeout de leitura)
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerTestCase(SimpleTestCase):
+    """Stub da Graph API em uma porta livre; WHATSAPP_API_BASE_URL aponta para ele"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests, self.server.responses = [], []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        base_url = f'http://127.0.0.1:{self.server.server_address[1]}/v18.0'
+        for patcher in (
+            mock.patch.object(whatsapp_http, 'API_BASE_URL', base_url),
+            # Sessão nova a cada teste, fechada no fim
+            mock.patch.object(whatsapp_http, '_session', None),
+            # O limitador tem testes próprios (test_rate_limiter)
+            mock.patch.object(whatsapp_http.rate_limiter, 'acquire', return_value=0.0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: whatsapp_http._session and whatsapp_http._session.close())
+
+    def respond(self, *responses):
+        self.server.responses.extend(responses)
+
+    def post(self, **kwargs):
+        return whatsapp_http.post('123/messages', 'token', {'to': '5511900000001'}, **kwargs)
+
+
+class WhatsAppHttpTests(StubServerTestCase):
+
+    def test_session_and_connection_are_reused(self):
+        first, second = self.post(), self.post()
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertIs(whatsapp_http.get_session(), whatsapp_http.get_session())
+        self.assertEqual(len(self.server.requests), 2)
+        # Mesma porta de origem: a segunda chamada usou a conexão keep-alive da primeira
+        self.assertEqual(self.server.requests[0]['client'], self.server.requests[1]['client'])
+        self.assertEqual(self.server.requests[0]['path'], '/v18.0/123/messages')
+        self.assertEqual(self.server.requests[0]['authorization'], 'Bearer token')
+        self.assertEqual(self.server.requests[0]['payload'], {'to': '5511900000001'})
+
+    def test_429_is_retried_after_retry_after(self):
+        self.respond((429, {'Retry-After': '0.05'}, 0))
+
+        with mock.patch.object(whatsapp_http.time, 'sleep', wraps=time.sleep) as sleep:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 2)
+        sleep.assert_called_once_with(0.05)
+
+    def test_429_stops_after_max_retries(self):
+        self.respond(*[(429, {'Retry-After': '0'}, 0)] * (whatsapp_http.API_MAX_RETRIES + 1))
+
+        self.assertEqual(self.post().status_code, 429)
+        self.assertEqual(len(self.server.requests), whatsapp_http.API_MAX_RETRIES + 1)
+
+    def test_server_error_is_not_retried(self):
+        self.respond((503, {'Retry-After': '0'}, 0))
+
+        self.assertEqual(self.post().status_code, 503)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_is_applied_and_not_retried(self):
+        self.respond((200, {}, 0.5))
+
+        with mock.patch.object(whatsapp_http, 'API_TIMEOUT', (1, 0.1)), \
+                self.assertRaises(requests.exceptions.ReadTimeout):
+            self.post()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_pause_beyond_max_wait_returns_the_429(self):
+        self.respond((429, {'Retry-After': '5'}, 0))
+
+        with mock.patch.object(whatsapp_http.time, 'sleep') as sleep:
+            response = self.post(max_wait=2)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.server.requests), 1)
+        sleep.assert_not_called()
+
+    def test_limiter_wait_counts_against_max_wait(self):
+        self.respond((429, {'Retry-After': '1'}, 0))
+        whatsapp_http.rate_limiter.acquire.return_value = 1.5
+
+        with mock.patch.object(whatsapp_http.time, 'sleep') as sleep:
+            response = self.post(max_wait=2)
+
+        self.assertEqual(response.status_code, 429)
+        sleep.assert_not_called()
+        whatsapp_http.rate_limiter.acquire.assert_called_once_with(2)
+
+    def test_limiter_gets_only_what_is_left_of_max_wait(self):
+        self.respond((429, {'Retry-After': '0.5'}, 0))
+        whatsapp_http.rate_limiter.acquire.side_effect = [0.5, None]
+
+        with mock.patch.object(whatsapp_http.time, 'sleep') as sleep, \
+                self.assertRaises(whatsapp_http.ApiRateLimited):
+            self.post(max_wait=2)
+
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual([call.args[0] for call in whatsapp_http.rate_limiter.acquire.call_args_list], [2, 1.0])
@@ -0,0 +1,60 @@
+"""
+Logs do chatbot: enfileirados no log_buffer e gravados em lote
+"""
+
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+
+from core import whatsapp_service
+from core.models import WhatsAppContact, WhatsAppLog, WhatsAppSession
+from core.whatsapp_service import log_buffer, write_logs
+
+
+class WhatsAppLogBufferTests(TestCase):
+
+    def setUp(self):
+        # Sem a thread de fundo: o teste decide quando gravar
+        patcher = mock.patch.object(log_buffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        log_buffer.drain()
+        self.addCleanup(log_buffer.drain)
+        self.contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+
+    def test_logs_are_written_on_flush(self):
+        service = whatsapp_service.whatsapp_service
+        with mock.patch.object(whatsapp_service, 'LOG_DB_LEVEL', whatsapp_service.LOG_LEVELS['info']):
+            service._log('debug', 'abaixo do nível')
+            service._log('info', 'primeiro', contact=self.contact)
+            service._log('error', 'segundo', metadata={'erro': 'x'})
+
+        self.assertFalse(WhatsAppLog.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(log_buffer.flush(), 2)
+
+        logs = list(WhatsAppLog.objects.order_by('pk').values_list('level', 'message', 'contact_id', 'metadata'))
+        self.assertEqual(logs, [('info', 'primeiro', self.contact.pk, {}), ('error', 'segundo', None, {'erro': 'x'})])
+
+
+class WriteLogsTests(TransactionTestCase):
+
+    def test_logs_of_rolled_back_rows_lose_the_reference(self):
+        # Sessão/contato de uma transação desfeita: a FK quebrada não derruba o lote
+        contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        session = WhatsAppSession.objects.create(contact=contact, session_id='sessao-1')
+
+        with mock.patch.object(WhatsAppLog.objects, 'bulk_create',
+                               wraps=WhatsAppLog.objects.bulk_create) as bulk_create:
+            write_logs([
+                WhatsAppLog(level='info', message='válido', session_id=session.pk, contact_id=contact.pk),
+                WhatsAppLog(level='info', message='órfão', session_id=session.pk + 100, contact_id=contact.pk + 100),
+            ])
+
+        # A primeira tentativa falha na FK e o lote é regravado sem as referências
+        self.assertEqual(bulk_create.call_count, 2)
+
+        self.assertEqual(
+            list(WhatsAppLog.objects.order_by('pk').values_list('message', 'session_id', 'contact_id')),
+            [('válido', session.pk, contact.pk), ('órfão', None, None)]
+        )
@@ -0,0 +1,241 @@
+"""
+Filas do WhatsApp: reserva, novas tentativas e liberação de itens presos
+"""
+
+import time
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase
+from django.utils import timezone
+
+from core import whatsapp_service
+from core.models import (
+    WhatsAppConfig, WhatsAppContact, WhatsAppMessage, WhatsAppOutboundMessage, WhatsAppSession,
+    WhatsAppWebhookEvent,
+)
+from core.whatsapp_service import (
+    OUTBOUND_LOCK_TIMEOUT, WEBHOOK_LOCK_TIMEOUT, WEBHOOK_MAX_ATTEMPTS, WhatsAppChatbotService,
+    claim_due_outbound, claim_webhook_events, dispatch_outbound, enqueue_webhook, process_webhook_event,
+    release_stale_outbound, release_stale_webhooks, schedule_message,
+)
+
+
+def webhook_payload(message_id, phone_number='5511900000001', body='oi'):
+    return {'entry': [{'changes': [{'value': {
+        'contacts': [{'wa_id': phone_number, 'profile': {'name': 'Ana'}}],
+        'messages': [{
+            'id': message_id, 'from': phone_number, 'timestamp': str(int(time.time())),
+            'type': 'text', 'text': {'body': body},
+        }],
+    }}]}]}
+
+
+def api_response(status_code, body='{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body.encode()
+    return response
+
+
+class WhatsAppQueueTestCase(TestCase):
+    """Caches do processo zerados e logs do chatbot fora do banco (a thread do buffer usa outra conexão)"""
+
+    def setUp(self):
+        cache.clear()
+        whatsapp_service.seen_message_ids._local.clear()
+        whatsapp_service.contact_resolver.invalidate()
+        WhatsAppConfig.objects.create(key='chatbot_active', value='true')
+        WhatsAppConfig.invalidate_cache()
+        patcher = mock.patch.object(whatsapp_service.log_buffer, 'record')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class WebhookQueueTests(WhatsAppQueueTestCase):
+
+    def test_claim_reserves_pending_events_once(self):
+        first = enqueue_webhook(webhook_payload('wamid.1'))
+        second = enqueue_webhook(webhook_payload('wamid.2'))
+
+        claimed = claim_webhook_events()
+
+        self.assertEqual([event.pk for event in claimed], [first.pk, second.pk])
+        self.assertTrue(all(event.status == 'processing' and event.locked_at for event in claimed))
+        self.assertEqual(len({event.claim_token for event in claimed}), 1)
+        self.assertEqual(claim_webhook_events(), [])
+
+    def test_processed_event_is_done(self):
+        enqueue_webhook(webhook_payload('wamid.1'))
+
+        event = process_webhook_event(claim_webhook_events()[0])
+
+        self.assertEqual((event.status, event.attempts, event.claim_token), ('done', 1, ''))
+        self.assertTrue(WhatsAppMessage.objects.filter(message_id='wamid.1').exists())
+
+    def test_failed_batch_returns_event_to_pending(self):
+        enqueue_webhook(webhook_payload('wamid.1'))
+
+        with mock.patch.object(WhatsAppChatbotService, '_process_batch',
+                               side_effect=OperationalError('database is locked')), \
+                self.assertLogs('core.whatsapp_service', 'ERROR'):
+            event = process_webhook_event(claim_webhook_events()[0])
+
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertIn('database is locked', event.error_message)
+        self.assertFalse(WhatsAppMessage.objects.filter(message_id='wamid.1').exists())
+
+        # A nova tentativa grava a mensagem
+        event = process_webhook_event(claim_webhook_events()[0])
+        self.assertEqual((event.status, event.attempts), ('done', 2))
+        self.assertTrue(WhatsAppMessage.objects.filter(message_id='wamid.1').exists())
+
+    def test_event_fails_after_max_attempts(self):
+        event = enqueue_webhook(webhook_payload('wamid.1'))
+        WhatsAppWebhookEvent.objects.filter(pk=event.pk).update(attempts=WEBHOOK_MAX_ATTEMPTS - 1)
+
+        with mock.patch.object(WhatsAppChatbotService, '_process_batch', side_effect=RuntimeError('erro')), \
+                self.assertLogs('core.whatsapp_service', 'ERROR'):
+            event = process_webhook_event(claim_webhook_events()[0])
+
+        self.assertEqual((event.status, event.attempts), ('failed', WEBHOOK_MAX_ATTEMPTS))
+        self.assertEqual(claim_webhook_events(), [])
+
+    def test_release_stale_webhooks(self):
+        stale = enqueue_webhook(webhook_payload('wamid.1'))
+        fresh = enqueue_webhook(webhook_payload('wamid.2'))
+        claim_webhook_events()
+        WhatsAppWebhookEvent.objects.filter(pk=stale.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=WEBHOOK_LOCK_TIMEOUT + 1)
+        )
+
+        self.assertEqual(release_stale_webhooks(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.claim_token), ('pending', ''))
+        self.assertEqual(fresh.status, 'processing')
+        self.assertEqual([event.pk for event in claim_webhook_events()], [stale.pk])
+
+
+class OutboundQueueTests(WhatsAppQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        WhatsAppConfig.objects.create(key='whatsapp_access_token', value='token')
+        WhatsAppConfig.objects.create(key='whatsapp_phone_number_id', value='123')
+        WhatsAppConfig.invalidate_cache()
+        contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        self.session = WhatsAppSession.objects.create(contact=contact, session_id='sessao-1')
+
+    def schedule(self, delay=0):
+        message = WhatsAppMessage.objects.create(
+            session=self.session, message_id=f'auto_{WhatsAppMessage.objects.count()}', direction='outgoing',
+            content='Olá', timestamp=timezone.now(), is_automated=True, metadata={'template': 't0'},
+        )
+        payload = WhatsAppChatbotService.text_payload('5511900000001', 'Olá')
+        return schedule_message('5511900000001', payload, delay, message=message)
+
+    def dispatch(self, response):
+        with mock.patch.object(whatsapp_service.whatsapp_http, 'post', side_effect=[response]):
+            return dispatch_outbound(claim_due_outbound())
+
+    def test_claim_reserves_only_due_deliveries(self):
+        due = self.schedule()
+        self.schedule(delay=60)
+
+        claimed = claim_due_outbound()
+
+        self.assertEqual([delivery.pk for delivery in claimed], [due.pk])
+        self.assertEqual(claimed[0].status, 'sending')
+        self.assertEqual(claim_due_outbound(), [])
+
+    def test_sent_delivery_records_api_message_id(self):
+        delivery = self.schedule()
+
+        self.assertEqual(self.dispatch(api_response(200, '{"messages": [{"id": "wamid.9"}]}')), (1, 0))
+
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.claim_token), ('sent', 1, ''))
+        self.assertEqual(delivery.message.metadata['api_message_id'], 'wamid.9')
+        self.assertEqual(delivery.message.metadata['template'], 't0')
+
+    def test_unparseable_success_still_counts_as_sent(self):
+        delivery = self.schedule()
+
+        self.assertEqual(self.dispatch(api_response(200, '<html>ok</html>')), (1, 0))
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'sent')
+        self.assertIsNone(delivery.message.metadata['api_message_id'])
+
+    def test_server_error_is_retried_later(self):
+        delivery = self.schedule()
+
+        self.assertEqual(self.dispatch(api_response(500)), (0, 0))
+
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.claim_token), ('pending', 1, ''))
+        self.assertGreater(delivery.due_at, timezone.now())
+        self.assertEqual(claim_due_outbound(), [])
+
+    def test_client_error_fails_without_retry(self):
+        delivery = self.schedule()
+
+        self.assertEqual(self.dispatch(api_response(400, '{"error": "bad number"}')), (0, 1))
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'failed')
+        self.assertIn('400', delivery.error_message)
+
+    def test_unexpected_error_keeps_the_batch(self):
+        first = self.schedule()
+        second = self.schedule()
+        responses = [RuntimeError('limitador indisponível'), api_response(200)]
+
+        with mock.patch.object(whatsapp_service.whatsapp_http, 'post', side_effect=responses), \
+                self.assertLogs('core.whatsapp_service', 'ERROR'):
+            self.assertEqual(dispatch_outbound(claim_due_outbound()), (1, 0))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.claim_token), ('pending', ''))
+        self.assertEqual(second.status, 'sent')
+
+    def test_each_delivery_is_saved_as_soon_as_it_is_sent(self):
+        first = self.schedule()
+        second = self.schedule()
+        stale = timezone.now() - timedelta(seconds=OUTBOUND_LOCK_TIMEOUT + 1)
+        states = []
+
+        def post(*args, **kwargs):
+            # Segundo envio: o primeiro já está gravado e o lote segue reservado
+            if not states:
+                WhatsAppOutboundMessage.objects.filter(pk=second.pk).update(locked_at=stale)
+            else:
+                states.append(WhatsAppOutboundMessage.objects.get(pk=first.pk).status)
+                states.append(release_stale_outbound())
+            states.append('posted')
+            return api_response(200, '{"messages": [{"id": "wamid.1"}]}')
+
+        with mock.patch.object(whatsapp_service.whatsapp_http, 'post', side_effect=post):
+            self.assertEqual(dispatch_outbound(claim_due_outbound()), (2, 0))
+
+        self.assertEqual(states, ['posted', 'sent', 0, 'posted'])
+        first.refresh_from_db()
+        self.assertEqual(first.message.metadata['api_message_id'], 'wamid.1')
+
+    def test_release_stale_outbound(self):
+        delivery = self.schedule()
+        claim_due_outbound()
+        WhatsAppOutboundMessage.objects.filter(pk=delivery.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=OUTBOUND_LOCK_TIMEOUT + 1)
+        )
+
+        self.assertEqual(release_stale_outbound(), 1)
+
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.claim_token), ('pending', ''))
@@ -0,0 +1,70 @@
+"""
+Retenção do WhatsApp: lotes por chave primária e políticas executadas por padrão
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import whatsapp_retention, whatsapp_service
+from core.models import WhatsAppContact, WhatsAppLog, WhatsAppSession
+from core.whatsapp_retention import POLICIES_BY_NAME, purge, run_retention
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(whatsapp_service.log_buffer, 'record')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.old = timezone.now() - timedelta(days=400)
+
+    def create_logs(self, count, old=True):
+        logs = WhatsAppLog.objects.bulk_create(
+            [WhatsAppLog(level='info', message=f'log {index}') for index in range(count)]
+        )
+        if old:
+            WhatsAppLog.objects.filter(pk__in=[log.pk for log in logs]).update(timestamp=self.old)
+        return logs
+
+    def test_purge_processes_expired_rows_in_chunks(self):
+        self.create_logs(7)
+        self.create_logs(2, old=False)
+        progress = []
+
+        with self.assertLogs('core', 'INFO') as logs:
+            total = purge(POLICIES_BY_NAME['logs'], chunk_size=3, pause=0,
+                          progress=lambda policy, done: progress.append(done))
+
+        self.assertEqual(total, 7)
+        self.assertIn('(logs, 30 dias): 7 linhas', logs.output[-1])
+        self.assertEqual(progress, [3, 6, 7])
+        self.assertEqual(WhatsAppLog.objects.count(), 2)
+
+    def test_default_run_only_deactivates_sessions(self):
+        contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        session = WhatsAppSession.objects.create(contact=contact, session_id='sessao-1')
+        WhatsAppSession.objects.filter(pk=session.pk).update(last_activity=self.old)
+        self.create_logs(3)
+
+        with self.assertLogs('core', 'INFO'):
+            self.assertEqual(run_retention(), {'sessions': 1})
+        self.assertEqual(WhatsAppLog.objects.count(), 3)
+        session.refresh_from_db()
+        self.assertFalse(session.is_active)
+
+        with mock.patch.object(whatsapp_retention, 'RETENTION_DELETE_ENABLED', True), self.assertLogs('core', 'INFO'):
+            results = run_retention()
+        self.assertEqual(results['logs'], 3)
+        self.assertEqual(results['inactive_sessions'], 1)
+
+    def test_cleanup_failure_raises_command_error(self):
+        self.create_logs(1)
+
+        with mock.patch.object(whatsapp_retention, '_apply', side_effect=RuntimeError('disco cheio')):
+            with self.assertRaisesMessage(CommandError, 'disco cheio'):
+                call_command('whatsapp_chatbot', 'cleanup', '--only', 'logs')
+        self.assertEqual(WhatsAppLog.objects.count(), 1)
@@ -0,0 +1,78 @@
+"""
+Cache das sessões ativas do WhatsApp: sessões encerradas ou expiradas saem do cache
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from core import whatsapp_service
+from core.models import WhatsAppContact, WhatsAppSession
+from core.tests.test_whatsapp_queue import WhatsAppQueueTestCase
+from core.whatsapp_service import ACTIVE_SESSION_CACHE_PREFIX, remember_active_sessions
+
+
+class ActiveSessionCacheTests(WhatsAppQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.service = whatsapp_service.whatsapp_service
+        self.contact = WhatsAppContact.objects.create(phone_number='5511900000001')
+        self.key = f'{ACTIVE_SESSION_CACHE_PREFIX}{self.contact.pk}'
+
+    def resolve(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.service._resolve_sessions({self.contact.pk: self.contact})[self.contact.pk]
+
+    def test_new_session_is_cached_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            session = self.service._resolve_sessions({self.contact.pk: self.contact})[self.contact.pk]
+            # Ainda não confirmada: outro worker não pode recebê-la do cache
+            self.assertIsNone(cache.get(self.key))
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(self.key), session.pk)
+
+    def test_cached_session_is_reused(self):
+        session = self.resolve()
+
+        # Pelo cache: uma consulta pela chave primária, sem busca pelo índice de sessões
+        with self.assertNumQueries(1):
+            self.assertEqual(self.resolve().pk, session.pk)
+
+    def test_closed_session_is_replaced(self):
+        session = self.resolve()
+        # Encerrada sem passar pelo serviço (admin, outro worker): o cache ainda aponta para ela
+        WhatsAppSession.objects.filter(pk=session.pk).update(status='completed')
+        self.assertEqual(cache.get(self.key), session.pk)
+
+        replacement = self.resolve()
+
+        self.assertNotEqual(replacement.pk, session.pk)
+        self.assertEqual(replacement.status, 'active')
+        self.assertEqual(cache.get(self.key), replacement.pk)
+
+    def test_expired_session_is_replaced(self):
+        session = self.resolve()
+        expired = timezone.now() - timedelta(seconds=self.service.max_session_duration + 60)
+        WhatsAppSession.objects.filter(pk=session.pk).update(last_activity=expired)
+
+        replacement = self.resolve()
+
+        self.assertNotEqual(replacement.pk, session.pk)
+        self.assertEqual(cache.get(self.key), replacement.pk)
+
+    def test_closed_or_inactive_session_drops_out_of_the_cache(self):
+        for field, value in (('status', 'completed'), ('is_active', False)):
+            with self.subTest(field=field):
+                session = self.resolve()
+                self.assertEqual(cache.get(self.key), session.pk)
+
+                # Lido no commit do lote que encerrou a sessão
+                setattr(session, field, value)
+                session.save()
+                remember_active_sessions([session], timeout=60)
+
+                self.assertIsNone(cache.get(self.key))
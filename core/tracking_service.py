@@ -0,0 +1,232 @@
+"""
+Serviço de rastreamento de acessos (Session, PageView e Cookie)
+Os acessos ficam em memória no worker e são gravados em lote por uma thread
+de fundo, fora do caminho da resposta
+"""
+
+import ipaddress
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .batch_buffer import BatchBuffer
+from .models import Cookie, PageView, Session
+
+TRACKING_ENABLED = getattr(settings, 'ANALYTICS_TRACKING_ENABLED', True)
+
+# Gravação em lote: por tamanho do buffer ou por tempo desde o último flush
+TRACKING_FLUSH_SIZE = getattr(settings, 'ANALYTICS_TRACKING_FLUSH_SIZE', 200)
+TRACKING_FLUSH_INTERVAL = getattr(settings, 'ANALYTICS_TRACKING_FLUSH_INTERVAL', 5.0)
+
+# Limite do buffer se o banco ficar indisponível (os acessos mais antigos são descartados)
+TRACKING_MAX_BUFFER = getattr(settings, 'ANALYTICS_TRACKING_MAX_BUFFER', 10000)
+
+# Cookie próprio que identifica a visita ("<chave>.<emitido em>"); reenviado só quando
+# falta, ou quando foi emitido há mais de TRACKING_COOKIE_REFRESH_AFTER s. A visita
+# termina entre TIMEOUT - REFRESH_AFTER e TIMEOUT sem acessos
+TRACKING_COOKIE_NAME = getattr(settings, 'ANALYTICS_TRACKING_COOKIE_NAME', 'hz_visit')
+TRACKING_SESSION_TIMEOUT = getattr(settings, 'ANALYTICS_TRACKING_SESSION_TIMEOUT', 30 * 60)
+TRACKING_COOKIE_REFRESH_AFTER = getattr(settings, 'ANALYTICS_TRACKING_COOKIE_REFRESH_AFTER', 5 * 60)
+
+TRACKING_IGNORED_PREFIXES = tuple(getattr(settings, 'ANALYTICS_TRACKING_IGNORED_PREFIXES', (
+    '/admin/', '/core_admin/', '/static/', '/media/', '/health/', '/chatbot/', '/webhook/',
+    '/favicon.ico', '/robots.txt', '/sitemap.xml',
+)))
+
+# Cookies de autenticação nunca são registrados
+TRACKING_IGNORED_COOKIES = frozenset(getattr(settings, 'ANALYTICS_TRACKING_IGNORED_COOKIES', (
+    settings.SESSION_COOKIE_NAME, settings.CSRF_COOKIE_NAME,
+)))
+
+# Limites de tamanho dos campos dos modelos
+URL_MAX_LENGTH = 200
+TITLE_MAX_LENGTH = 255
+
+
+@dataclass
+class PageHit:
+    """Um acesso capturado pelo middleware, ainda não gravado"""
+    session_key: str
+    ip_address: str
+    user_agent: str
+    referrer: Optional[str]
+    user_id: Optional[int]
+    url: str
+    title: str
+    timestamp: datetime
+    cookies: List[dict] = field(default_factory=list)
+
+
+# Cookies antigos trazem só a chave: são reenviados no próximo acesso
+VISIT_COOKIE_RE = re.compile(r'^([0-9a-f]{32})(?:\.(\d{1,12}))?$')
+
+
+def new_visit_key() -> str:
+    """Identificador de visita (cabe em Session.session_key)"""
+    return uuid.uuid4().hex
+
+
+def parse_visit_cookie(value: str) -> Tuple[Optional[str], int]:
+    """Chave da visita e horário de emissão (epoch) do cookie; (None, 0) se inválido"""
+    match = VISIT_COOKIE_RE.match(value or '')
+    if not match:
+        return None, 0
+    return match.group(1), int(match.group(2) or 0)
+
+
+def visit_cookie_value(session_key: str, issued_at: int) -> str:
+    return f'{session_key}.{issued_at}'
+
+
+def visit_cookie_expiring(issued_at: int, now: int) -> bool:
+    """Cookie emitido há mais de TRACKING_COOKIE_REFRESH_AFTER s (ou com horário no futuro)"""
+    return not 0 <= now - issued_at < TRACKING_COOKIE_REFRESH_AFTER
+
+
+def get_client_ip(request) -> str:
+    """IP do cliente (primeiro de X-Forwarded-For), validado"""
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    value = forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR', '')
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return '0.0.0.0'
+
+
+def should_track(request, response) -> bool:
+    """Apenas páginas HTML servidas com sucesso via GET"""
+    if request.method != 'GET' or response.status_code != 200:
+        return False
+    if request.path.startswith(TRACKING_IGNORED_PREFIXES):
+        return False
+    return response.get('Content-Type', '').startswith('text/html')
+
+
+def response_cookies(response) -> List[dict]:
+    """Cookies definidos pela resposta, no formato do modelo Cookie"""
+    cookies = []
+    for name, morsel in response.cookies.items():
+        if name in TRACKING_IGNORED_COOKIES or name == TRACKING_COOKIE_NAME:
+            continue
+        cookies.append({
+            'name': name,
+            'value': morsel.value,
+            'domain': morsel['domain'] or '',
+            'path': morsel['path'] or '/',
+            'secure': bool(morsel['secure']),
+            'httponly': bool(morsel['httponly']),
+            'samesite': morsel['samesite'] or None,
+        })
+    return cookies
+
+
+def _session_ids(hits: List[PageHit]) -> Dict[str, int]:
+    """Criar as sessões novas e atualizar last_activity das existentes"""
+    first_seen: Dict[str, PageHit] = {}
+    last_seen: Dict[str, PageHit] = {}
+    for hit in hits:
+        first_seen.setdefault(hit.session_key, hit)
+        last_seen[hit.session_key] = hit
+
+    keys = list(last_seen)
+    existing = set(Session.objects.filter(session_key__in=keys).values_list('session_key', flat=True))
+    Session.objects.bulk_create(
+        [
+            Session(
+                session_key=key,
+                ip_address=hit.ip_address,
+                user_agent=hit.user_agent,
+                referrer=hit.referrer,
+                user_id=hit.user_id,
+                created_at=first_seen[key].timestamp,
+            )
+            for key, hit in last_seen.items()
+            if key not in existing
+        ],
+        ignore_conflicts=True
+    )
+
+    if existing:
+        Session.objects.filter(session_key__in=existing).update(
+            last_activity=Case(
+                *[When(session_key=key, then=Value(last_seen[key].timestamp)) for key in existing],
+                output_field=DateTimeField()
+            )
+        )
+
+    return dict(Session.objects.filter(session_key__in=keys).values_list('session_key', 'id'))
+
+
+def write_hits(hits: List[PageHit]) -> Tuple[int, int]:
+    """
+    Gravar um lote de acessos: poucas consultas, independente do tamanho do lote.
+    created_at vem do horário do acesso, não do flush (que pode ocorrer
+    segundos depois, ou bem mais tarde após uma falha do banco)
+    """
+    with transaction.atomic():
+        session_ids = _session_ids(hits)
+
+        page_views = PageView.objects.bulk_create([
+            PageView(
+                session_id=session_ids[hit.session_key],
+                url=hit.url,
+                title=hit.title,
+                created_at=hit.timestamp,
+            )
+            for hit in hits
+            if hit.session_key in session_ids
+        ])
+
+        cookies = Cookie.objects.bulk_create([
+            Cookie(session_id=session_ids[hit.session_key], created_at=hit.timestamp, **cookie)
+            for hit in hits
+            if hit.session_key in session_ids
+            for cookie in hit.cookies
+        ])
+
+    return len(page_views), len(cookies)
+
+
+def build_hit(request, response, session_key: str, new_session: bool) -> PageHit:
+    """Capturar os dados do acesso (apenas leitura do request/response)"""
+    user = getattr(request, 'user', None)
+    cookies = response_cookies(response)
+    if new_session:
+        cookies.append({
+            'name': TRACKING_COOKIE_NAME,
+            'value': session_key,
+            'domain': '',
+            'path': '/',
+            'secure': request.is_secure(),
+            'httponly': True,
+            'samesite': 'Lax',
+        })
+
+    match = getattr(request, 'resolver_match', None)
+    return PageHit(
+        session_key=session_key,
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        referrer=(request.META.get('HTTP_REFERER') or '')[:URL_MAX_LENGTH] or None,
+        user_id=user.pk if user is not None and user.is_authenticated else None,
+        url=request.build_absolute_uri()[:URL_MAX_LENGTH],
+        title=((match.view_name if match else '') or request.path)[:TITLE_MAX_LENGTH],
+        timestamp=timezone.now(),
+        cookies=cookies,
+    )
+
+
+pageview_buffer = BatchBuffer(
+    write_hits,
+    name='pageview',
+    flush_size=TRACKING_FLUSH_SIZE,
+    flush_interval=TRACKING_FLUSH_INTERVAL,
+    max_buffer=TRACKING_MAX_BUFFER,
+)
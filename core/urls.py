@@ -5,7 +5,7 @@
 from .whatsapp_views import (
     WhatsAppWebhookView, WhatsAppDashboardView, WhatsAppContactsView,
     WhatsAppTemplatesView, WhatsAppConfigView, WhatsAppSendMessageView,
-    WhatsAppSendMessagePageView, whatsapp_cleanup, whatsapp_health
+    WhatsAppSendMessagePageView, whatsapp_cleanup, whatsapp_health, whatsapp_session_history
 )
 
 app_name = 'core'
@@ -53,6 +53,7 @@
     path('chatbot/send-message/', WhatsAppSendMessageView.as_view(), name='whatsapp_send_message'),
     path('chatbot/send/', WhatsAppSendMessagePageView.as_view(), name='whatsapp_send_page'),
     path('chatbot/cleanup/', whatsapp_cleanup, name='whatsapp_cleanup'),
+    path('chatbot/sessions/<int:session_id>/history/', whatsapp_session_history, name='whatsapp_session_history'),
     path('chatbot/health/', whatsapp_health, name='whatsapp_health'),
 
     # Mercado Pago 
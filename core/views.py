@@ -10,7 +10,7 @@
 import logging
 from typing import Tuple, Dict, Any, Optional
 from dataclasses import dataclass
-from functools import wraps
+from functools import partial, wraps
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
@@ -23,11 +23,13 @@
 from django.utils import timezone
 from datetime import timedelta
 from .models import Cookie, Session, PageView, SEOMetrics, AnalyticsExport
+from .rollup_service import has_rollups, traffic_totals
+from .export_service import (
+    COOKIES_DATASET, SESSIONS_DATASET, SEO_DATASET, EXPORT_CHUNK_SIZE, ExportRange,
+    PYARROW_AVAILABLE, datasets_parquet_response, get_datasets, on_complete, parquet_file_response,
+    start_of_day, stream_csv_response, stream_zip_response, xlsx_file_response
+)
 import json
-import csv
-import xlsxwriter
-from io import BytesIO
-import zipfile
 import redis
 from django.urls import reverse
 from django.db import connection
@@ -671,206 +673,160 @@ class AnalyticsExportListView(ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        return super().get_queryset().filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user, is_active=True)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['has_running'] = any(
+            export.status in ('pending', 'processing') for export in context['exports']
+        )
+        context['parquet_available'] = PYARROW_AVAILABLE
+        return context
+
+COOKIE_EXPORT_HEADERS = ['Name', 'Domain', 'Value', 'Expires', 'Secure', 'HttpOnly', 'SameSite', 'Created At']
+COOKIE_EXPORT_FIELDS = ('name', 'domain', 'value', 'expires', 'secure', 'httponly', 'samesite', 'created_at')
+
+SESSION_EXPORT_HEADERS = ['IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'Is Active']
+SESSION_EXPORT_FIELDS = ('ip_address', 'user_agent', 'referrer', 'created_at', 'last_activity', 'is_active')
+
+SEO_EXPORT_HEADERS = [
+    'URL', 'Title', 'Meta Description', 'H1 Count', 'H2 Count', 'H3 Count',
+    'Image Count', 'Word Count', 'Internal Links', 'External Links',
+    'Page Speed Score', 'Mobile Friendly Score', 'Last Checked'
+]
+SEO_EXPORT_FIELDS = (
+    'url', 'title', 'meta_description', 'h1_count', 'h2_count', 'h3_count',
+    'image_count', 'word_count', 'internal_links', 'external_links',
+    'page_speed_score', 'mobile_friendly_score', 'last_checked'
+)
+
+def _export_rows(export_range, dataset, queryset, fields):
+    """Linhas em blocos via values_list(); avança o checkpoint ao terminar"""
+    return on_complete(
+        export_range.filter(dataset, queryset).values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE),
+        lambda: export_range.commit([dataset])
+    )
 
 @staff_member_required
 def export_cookies(request):
     """Export cookies data"""
     format = request.GET.get('format', 'csv')
-    queryset = Cookie.objects.all()
+    try:
+        export_range = ExportRange.from_request(request)
+        queryset = export_range.filter(COOKIES_DATASET, Cookie.objects.all())
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     
     if format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="cookies.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Name', 'Domain', 'Value', 'Expires', 'Secure', 'HttpOnly', 'SameSite', 'Created At'])
-        
-        for cookie in queryset:
-            writer.writerow([
-                cookie.name,
-                cookie.domain,
-                cookie.value,
-                cookie.expires,
-                cookie.secure,
-                cookie.httponly,
-                cookie.samesite,
-                cookie.created_at
-            ])
-        return response
+        return stream_csv_response(
+            'cookies.csv',
+            COOKIE_EXPORT_HEADERS,
+            _export_rows(export_range, COOKIES_DATASET, Cookie.objects.all(), COOKIE_EXPORT_FIELDS)
+        )
     
     elif format == 'excel':
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet()
-        
-        # Write headers
-        headers = ['Name', 'Domain', 'Value', 'Expires', 'Secure', 'HttpOnly', 'SameSite', 'Created At']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Write data
-        for row, cookie in enumerate(queryset, start=1):
-            worksheet.write(row, 0, cookie.name)
-            worksheet.write(row, 1, cookie.domain)
-            worksheet.write(row, 2, cookie.value)
-            worksheet.write(row, 3, str(cookie.expires))
-            worksheet.write(row, 4, cookie.secure)
-            worksheet.write(row, 5, cookie.httponly)
-            worksheet.write(row, 6, cookie.samesite)
-            worksheet.write(row, 7, str(cookie.created_at))
-        
-        workbook.close()
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        rows = (
+            (name, domain, value, str(expires), secure, httponly, samesite, str(created_at))
+            for name, domain, value, expires, secure, httponly, samesite, created_at
+            in queryset.values_list(*COOKIE_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
         )
-        response['Content-Disposition'] = 'attachment; filename="cookies.xlsx"'
+        response = xlsx_file_response('cookies.xlsx', [('Sheet1', COOKIE_EXPORT_HEADERS, rows)])
+        export_range.commit([COOKIES_DATASET])
         return response
     
     elif format == 'json':
         data = list(queryset.values())
+        export_range.commit([COOKIES_DATASET])
         return JsonResponse(data, safe=False)
     
+    elif format == 'parquet':
+        if not PYARROW_AVAILABLE:
+            return HttpResponse('pyarrow not installed', status=503)
+        response = parquet_file_response('cookies.parquet', queryset, COOKIE_EXPORT_FIELDS)
+        export_range.commit([COOKIES_DATASET])
+        return response
+    
     return HttpResponse('Invalid format', status=400)
 
 @staff_member_required
 def export_sessions(request):
     """Export sessions data"""
     format = request.GET.get('format', 'csv')
-    queryset = Session.objects.all()
+    try:
+        export_range = ExportRange.from_request(request)
+        queryset = export_range.filter(SESSIONS_DATASET, Session.objects.all())
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     
     if format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="sessions.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'Is Active'])
-        
-        for session in queryset:
-            writer.writerow([
-                session.ip_address,
-                session.user_agent,
-                session.referrer,
-                session.created_at,
-                session.last_activity,
-                session.is_active
-            ])
-        return response
+        return stream_csv_response(
+            'sessions.csv',
+            SESSION_EXPORT_HEADERS,
+            _export_rows(export_range, SESSIONS_DATASET, Session.objects.all(), SESSION_EXPORT_FIELDS)
+        )
     
     elif format == 'excel':
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet()
-        
-        # Write headers
-        headers = ['IP Address', 'User Agent', 'Referrer', 'Created At', 'Last Activity', 'Is Active']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Write data
-        for row, session in enumerate(queryset, start=1):
-            worksheet.write(row, 0, session.ip_address)
-            worksheet.write(row, 1, session.user_agent)
-            worksheet.write(row, 2, session.referrer)
-            worksheet.write(row, 3, str(session.created_at))
-            worksheet.write(row, 4, str(session.last_activity))
-            worksheet.write(row, 5, session.is_active)
-        
-        workbook.close()
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        rows = (
+            (ip_address, user_agent, referrer, str(created_at), str(last_activity), is_active)
+            for ip_address, user_agent, referrer, created_at, last_activity, is_active
+            in queryset.values_list(*SESSION_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
         )
-        response['Content-Disposition'] = 'attachment; filename="sessions.xlsx"'
+        response = xlsx_file_response('sessions.xlsx', [('Sheet1', SESSION_EXPORT_HEADERS, rows)])
+        export_range.commit([SESSIONS_DATASET])
         return response
     
     elif format == 'json':
         data = list(queryset.values())
+        export_range.commit([SESSIONS_DATASET])
         return JsonResponse(data, safe=False)
     
+    elif format == 'parquet':
+        if not PYARROW_AVAILABLE:
+            return HttpResponse('pyarrow not installed', status=503)
+        response = parquet_file_response('sessions.parquet', queryset, SESSION_EXPORT_FIELDS)
+        export_range.commit([SESSIONS_DATASET])
+        return response
+    
     return HttpResponse('Invalid format', status=400)
 
 @staff_member_required
 def export_seo(request):
     """Export SEO metrics data"""
     format = request.GET.get('format', 'csv')
-    queryset = SEOMetrics.objects.all()
+    try:
+        export_range = ExportRange.from_request(request)
+        queryset = export_range.filter(SEO_DATASET, SEOMetrics.objects.all())
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
     
     if format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="seo_metrics.csv"'
-        writer = csv.writer(response)
-        writer.writerow([
-            'URL', 'Title', 'Meta Description', 'H1 Count', 'H2 Count', 'H3 Count',
-            'Image Count', 'Word Count', 'Internal Links', 'External Links',
-            'Page Speed Score', 'Mobile Friendly Score', 'Last Checked'
-        ])
-        
-        for metric in queryset:
-            writer.writerow([
-                metric.url,
-                metric.title,
-                metric.meta_description,
-                metric.h1_count,
-                metric.h2_count,
-                metric.h3_count,
-                metric.image_count,
-                metric.word_count,
-                metric.internal_links,
-                metric.external_links,
-                metric.page_speed_score,
-                metric.mobile_friendly_score,
-                metric.last_checked
-            ])
-        return response
+        return stream_csv_response(
+            'seo_metrics.csv',
+            SEO_EXPORT_HEADERS,
+            _export_rows(export_range, SEO_DATASET, SEOMetrics.objects.all(), SEO_EXPORT_FIELDS)
+        )
     
     elif format == 'excel':
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet()
-        
-        # Write headers
-        headers = [
-            'URL', 'Title', 'Meta Description', 'H1 Count', 'H2 Count', 'H3 Count',
-            'Image Count', 'Word Count', 'Internal Links', 'External Links',
-            'Page Speed Score', 'Mobile Friendly Score', 'Last Checked'
-        ]
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Write data
-        for row, metric in enumerate(queryset, start=1):
-            worksheet.write(row, 0, metric.url)
-            worksheet.write(row, 1, metric.title)
-            worksheet.write(row, 2, metric.meta_description)
-            worksheet.write(row, 3, metric.h1_count)
-            worksheet.write(row, 4, metric.h2_count)
-            worksheet.write(row, 5, metric.h3_count)
-            worksheet.write(row, 6, metric.image_count)
-            worksheet.write(row, 7, metric.word_count)
-            worksheet.write(row, 8, metric.internal_links)
-            worksheet.write(row, 9, metric.external_links)
-            worksheet.write(row, 10, metric.page_speed_score)
-            worksheet.write(row, 11, metric.mobile_friendly_score)
-            worksheet.write(row, 12, str(metric.last_checked))
-        
-        workbook.close()
-        output.seek(0)
-        
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        rows = (
+            (*values[:-1], str(values[-1]))
+            for values in queryset.values_list(*SEO_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
         )
-        response['Content-Disposition'] = 'attachment; filename="seo_metrics.xlsx"'
+        response = xlsx_file_response('seo_metrics.xlsx', [('Sheet1', SEO_EXPORT_HEADERS, rows)])
+        export_range.commit([SEO_DATASET])
         return response
     
     elif format == 'json':
         data = list(queryset.values())
+        export_range.commit([SEO_DATASET])
         return JsonResponse(data, safe=False)
     
+    elif format == 'parquet':
+        if not PYARROW_AVAILABLE:
+            return HttpResponse('pyarrow not installed', status=503)
+        response = parquet_file_response('seo_metrics.parquet', queryset, SEO_EXPORT_FIELDS)
+        export_range.commit([SEO_DATASET])
+        return response
+    
     return HttpResponse('Invalid format', status=400)
 
 @staff_member_required
@@ -886,28 +842,33 @@ def export_data(request):
     elif data_type == 'seo':
         return export_seo(request)
     elif data_type == 'all':
-        # Create a zip file containing all exports
-        output = BytesIO()
-        with zipfile.ZipFile(output, 'w') as zip_file:
-            # Export cookies
-            cookies_response = export_cookies(request)
-            zip_file.writestr('cookies.csv', cookies_response.content)
+        if format == 'parquet' and not PYARROW_AVAILABLE:
+            return HttpResponse('pyarrow not installed', status=503)
+        
+        try:
+            export_range = ExportRange.from_request(request)
             
-            # Export sessions
-            sessions_response = export_sessions(request)
-            zip_file.writestr('sessions.csv', sessions_response.content)
+            # Mesmas tabelas do export do admin e dos jobs (inclui PageView)
+            datasets = get_datasets('all')
+            if format == 'parquet':
+                return datasets_parquet_response('analytics_data.zip', datasets, export_range)
             
-            # Export SEO metrics
-            seo_response = export_seo(request)
-            zip_file.writestr('seo_metrics.csv', seo_response.content)
+            members = [
+                (dataset.filename, dataset.headers, on_complete(
+                    dataset.iter_rows(export_range.filter(dataset)),
+                    partial(export_range.commit, [dataset])
+                ))
+                for dataset in datasets
+            ]
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
         
-        output.seek(0)
-        response = HttpResponse(
-            output.read(),
-            content_type='application/zip'
+        # Zip gerado em streaming: cada CSV é comprimido e enviado enquanto é lido
+        return stream_zip_response(
+            'analytics_data.zip',
+            members,
+            parallel=request.GET.get('parallel', '').lower() in ('1', 'true') or None
         )
-        response['Content-Disposition'] = 'attachment; filename="analytics_data.zip"'
-        return response
     
     return HttpResponse('Invalid data type', status=400)
 
@@ -922,10 +883,26 @@ def get_context_data(self, **kwargs):
         # Get counts for the last 30 days
         thirty_days_ago = timezone.now() - timedelta(days=30)
         
+        # Whole days, active rows only: the same window the daily rollups cover
+        since = timezone.localdate() - timedelta(days=30)
+        if has_rollups():
+            # Pre-aggregated daily rollups (python manage.py aggregate_analytics)
+            totals = traffic_totals(since=since)
+            counts = {
+                'cookie_count': totals['cookies'],
+                'session_count': totals['sessions'],
+                'pageview_count': totals['pageviews'],
+            }
+        else:
+            recent = {'created_at__gte': start_of_day(since), 'is_active': True}
+            counts = {
+                'cookie_count': Cookie.objects.filter(**recent).count(),
+                'session_count': Session.objects.filter(**recent).count(),
+                'pageview_count': PageView.objects.filter(**recent).count(),
+            }
+        
+        context.update(counts)
         context.update({
-            'cookie_count': Cookie.objects.filter(created_at__gte=thirty_days_ago).count(),
-            'session_count': Session.objects.filter(created_at__gte=thirty_days_ago).count(),
-            'pageview_count': PageView.objects.filter(created_at__gte=thirty_days_ago).count(),
             'seo_metrics_count': SEOMetrics.objects.filter(last_checked__gte=thirty_days_ago).count(),
             'recent_cookies': Cookie.objects.order_by('-created_at')[:5],
             'recent_sessions': Session.objects.order_by('-created_at')[:5],
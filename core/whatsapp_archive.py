@@ -0,0 +1,189 @@
+"""
+Arquivo frio das conversas do WhatsApp
+Mensagens e logs antigos saem das tabelas e vão para segmentos JSONL
+compactados (gzip), particionados por dia:
+
+    <WHATSAPP_ARCHIVE_ROOT>/messages/2025/01/2025-01-31-<primeiro id>-<último id>.jsonl.gz
+
+Cada segmento é registrado em WhatsAppArchiveSegment (dia, faixa de ids e
+sessões contidas), o índice usado para reidratar o histórico de uma sessão
+sem abrir os demais arquivos. O arquivo é gravado antes de criar o índice e
+apagar as linhas (na mesma transação): um segmento sem índice é ignorado.
+"""
+
+import gzip
+import json
+import logging
+import os
+from datetime import timedelta
+from itertools import groupby
+from typing import Any, Dict, Iterator, List
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import WhatsAppArchiveSegment, WhatsAppLog, WhatsAppMessage, WhatsAppSession
+
+logger = logging.getLogger('core')
+
+ARCHIVE_ENABLED = getattr(settings, 'WHATSAPP_ARCHIVE_ENABLED', False)
+ARCHIVE_ROOT = getattr(
+    settings, 'WHATSAPP_ARCHIVE_ROOT', os.path.join(settings.BASE_DIR, 'archive', 'whatsapp')
+)
+# Linhas lidas por lote de arquivamento (um segmento por dia presente no lote)
+ARCHIVE_CHUNK_SIZE = getattr(settings, 'WHATSAPP_ARCHIVE_CHUNK_SIZE', 5000)
+
+# Campos gravados por tipo (ids das relações + dados da sessão, que pode ser excluída depois)
+ARCHIVE_FIELDS = {
+    'messages': (
+        'id', 'session_id', 'session__session_id', 'session__contact__phone_number', 'message_id',
+        'direction', 'message_type', 'content', 'media_url', 'timestamp', 'is_automated',
+        'metadata', 'created_at', 'is_active',
+    ),
+    'logs': ('id', 'level', 'message', 'session_id', 'contact_id', 'metadata', 'timestamp', 'is_active'),
+}
+ARCHIVE_MODELS = {WhatsAppMessage: 'messages', WhatsAppLog: 'logs'}
+DATETIME_FIELDS = ('timestamp', 'created_at')
+
+
+def segment_path(kind: str, day, first_pk: int, last_pk: int) -> str:
+    """Caminho relativo a ARCHIVE_ROOT (a faixa de ids torna o nome único)"""
+    return os.path.join(
+        kind, f'{day:%Y}', f'{day:%m}', f'{day.isoformat()}-{first_pk:010d}-{last_pk:010d}.jsonl.gz'
+    )
+
+
+def _write_segment(relative_path: str, records: List[Dict[str, Any]]) -> int:
+    """Gravar o segmento (arquivo temporário + rename atômico); devolve o tamanho em bytes"""
+    path = os.path.join(ARCHIVE_ROOT, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as segment:
+        for record in records:
+            segment.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+            segment.write('\n')
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def archive_queryset(queryset) -> int:
+    """
+    Mover as linhas do queryset (mensagens ou logs) para segmentos por dia e
+    apagá-las; devolve quantas foram arquivadas
+    """
+    kind = ARCHIVE_MODELS[queryset.model]
+    records = list(queryset.order_by('timestamp', 'pk').values(*ARCHIVE_FIELDS[kind]))
+    if not records:
+        return 0
+
+    written = []
+    try:
+        for day, day_records in groupby(records, key=lambda record: timezone.localdate(record['timestamp'])):
+            day_records = list(day_records)
+            pks = [record['id'] for record in day_records]
+            relative_path = segment_path(kind, day, min(pks), max(pks))
+            size = _write_segment(relative_path, day_records)
+            written.append(relative_path)
+            sessions = sorted({record['session_id'] for record in day_records if record['session_id']})
+            WhatsAppArchiveSegment.objects.create(
+                kind=kind,
+                day=day,
+                path=relative_path,
+                record_count=len(day_records),
+                first_pk=min(pks),
+                last_pk=max(pks),
+                size_bytes=size,
+                session_ids=sessions,
+            )
+        # delete() do queryset (os modelos só sobrescrevem o delete da instância)
+        queryset.model.objects.filter(pk__in=[record['id'] for record in records]).delete()
+    except Exception:
+        # Sem índice o arquivo seria órfão; a transação do chamador desfaz o resto
+        for relative_path in written:
+            try:
+                os.remove(os.path.join(ARCHIVE_ROOT, relative_path))
+            except OSError:
+                pass
+        raise
+    return len(records)
+
+
+def read_segment(segment: WhatsAppArchiveSegment) -> Iterator[Dict[str, Any]]:
+    """Registros de um segmento, com as datas convertidas de volta para datetime"""
+    with gzip.open(os.path.join(ARCHIVE_ROOT, segment.path), 'rt', encoding='utf-8') as lines:
+        for line in lines:
+            record = json.loads(line)
+            for field in DATETIME_FIELDS:
+                if record.get(field):
+                    record[field] = parse_datetime(record[field])
+            yield record
+
+
+def session_segments(kind: str, session_id: int) -> List[WhatsAppArchiveSegment]:
+    """
+    Segmentos com registros da sessão. Se a sessão ainda existe, só os dias
+    entre o início e a última atividade são consultados
+    """
+    segments = WhatsAppArchiveSegment.objects.filter(kind=kind)
+    session = WhatsAppSession.objects.filter(pk=session_id).values('started_at', 'last_activity').first()
+    if session:
+        # Margem de um dia: o timestamp da mensagem vem do WhatsApp, não do servidor
+        segments = segments.filter(
+            day__gte=timezone.localdate(session['started_at']) - timedelta(days=1),
+            day__lte=timezone.localdate(session['last_activity']) + timedelta(days=1),
+        )
+    return [
+        segment for segment in segments.order_by('day', 'first_pk')
+        if session_id in segment.session_ids
+    ]
+
+
+def archived_records(kind: str, session_id: int) -> List[Dict[str, Any]]:
+    records = []
+    for segment in session_segments(kind, session_id):
+        try:
+            records.extend(record for record in read_segment(segment) if record['session_id'] == session_id)
+        except OSError as e:
+            logger.error(f"Segmento de arquivo WhatsApp ilegível ({segment.path}): {e}")
+    return records
+
+
+def session_history(session_id: int, include_logs: bool = False) -> Dict[str, Any]:
+    """
+    Histórico completo da sessão: mensagens ainda no banco e as arquivadas,
+    em ordem cronológica (`archived` indica a origem de cada uma)
+    """
+    live = [
+        dict(record, archived=False)
+        for record in WhatsAppMessage.objects.filter(session_id=session_id).values(*ARCHIVE_FIELDS['messages'])
+    ]
+    live_ids = {record['id'] for record in live}
+    archived = [
+        dict(record, archived=True)
+        for record in archived_records('messages', session_id)
+        if record['id'] not in live_ids
+    ]
+    history = {'session_id': session_id, 'messages': sorted(live + archived, key=lambda record: record['timestamp'])}
+
+    if include_logs:
+        live_logs = [
+            dict(record, archived=False)
+            for record in WhatsAppLog.objects.filter(session_id=session_id).values(*ARCHIVE_FIELDS['logs'])
+        ]
+        archived_logs = [dict(record, archived=True) for record in archived_records('logs', session_id)]
+        history['logs'] = sorted(live_logs + archived_logs, key=lambda record: record['timestamp'])
+    return history
+
+
+def archive_stats() -> Dict[str, Dict[str, int]]:
+    """Segmentos, registros e bytes arquivados por tipo"""
+    rows = WhatsAppArchiveSegment.objects.values('kind').annotate(
+        segments=Count('id'), records=Sum('record_count'), size_bytes=Sum('size_bytes')
+    )
+    stats = {kind: {'segments': 0, 'records': 0, 'size_bytes': 0} for kind in ARCHIVE_FIELDS}
+    for row in rows:
+        stats[row.pop('kind')] = row
+    return stats
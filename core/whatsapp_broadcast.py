@@ -0,0 +1,206 @@
+"""
+Envio em massa (broadcast) de mensagens WhatsApp
+As requisições à Graph API saem de um pool limitado de threads, no ritmo máximo
+configurado; os resultados são gravados em lote pela thread principal (as
+threads do pool não acessam o banco)
+"""
+
+import logging
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from . import whatsapp_http
+from .models import WhatsAppContact, WhatsAppMessage
+from .whatsapp_service import invalidate_session_stats_on_commit, whatsapp_service
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_WORKERS = getattr(settings, 'WHATSAPP_BROADCAST_WORKERS', 8)
+BROADCAST_RATE = getattr(settings, 'WHATSAPP_BROADCAST_RATE', 20)  # mensagens por segundo
+BROADCAST_WRITE_BATCH = getattr(settings, 'WHATSAPP_BROADCAST_WRITE_BATCH', 200)
+
+
+@dataclass
+class BroadcastResult:
+    broadcast_id: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)  # telefone -> erro
+
+
+class RatePacer:
+    """Espaça as chamadas para no máximo `rate` por segundo (usado por uma única thread)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def broadcast_recipients(phone_numbers: Iterable[str] = None, include_my_contacts: bool = False,
+                         include_blocked: bool = False):
+    """Contatos do broadcast; por padrão os mesmos que o chatbot atende"""
+    queryset = WhatsAppContact.objects.filter(is_active=True)
+    if phone_numbers is not None:
+        queryset = queryset.filter(phone_number__in=list(phone_numbers))
+    if not include_my_contacts:
+        queryset = queryset.filter(is_my_contact=False)
+    if not include_blocked:
+        queryset = queryset.filter(is_blocked=False)
+    return queryset.order_by('pk')
+
+
+def _post(phone_number_id: str, access_token: str, payload: Dict[str, Any]) -> Tuple[Optional[dict], Optional[str]]:
+    """Executado nas threads do pool: apenas HTTP"""
+    try:
+        response = whatsapp_http.post(f"{phone_number_id}/messages", access_token, payload)
+    except requests.exceptions.RequestException as e:
+        return None, f"Erro de conexão: {str(e)}"
+    if response.status_code == 200:
+        # A mensagem foi aceita mesmo que o corpo não seja JSON válido
+        try:
+            return response.json(), None
+        except ValueError:
+            return {}, None
+    return None, f"Erro na API: {response.status_code} - {response.text}"
+
+
+def _sent_message_id(response_data: Any) -> Optional[str]:
+    """wamid devolvido pela Graph API (None se a resposta não tiver o formato esperado)"""
+    try:
+        return response_data['messages'][0]['id']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _write_results(results: List[Tuple[WhatsAppContact, Optional[dict], Optional[str]]],
+                   message_type: str, content: str, metadata: Dict[str, Any]) -> None:
+    """Gravar as mensagens enviadas (um bulk_create) e registrar as falhas"""
+    sent = {contact.pk: contact for contact, _, error in results if error is None}
+    sessions = whatsapp_service._resolve_sessions(sent) if sent else {}
+    now = timezone.now()
+
+    WhatsAppMessage.objects.bulk_create([
+        WhatsAppMessage(
+            session=sessions[contact.pk],
+            message_id=_sent_message_id(response_data) or f"broadcast_{uuid.uuid4().hex}",
+            direction='outgoing',
+            message_type=message_type,
+            content=content,
+            timestamp=now,
+            is_automated=False,
+            metadata={**metadata, 'api_response': response_data}
+        )
+        for contact, response_data, error in results
+        if error is None
+    ], ignore_conflicts=True)
+    if sent:
+        # bulk_create não dispara post_save
+        invalidate_session_stats_on_commit()
+
+    for contact, _, error in results:
+        if error is not None:
+            whatsapp_service._log('error', error, contact=contact,
+                                  metadata={**metadata, 'phone_number': contact.phone_number})
+
+
+def broadcast(contacts: Iterable[WhatsAppContact], message: str = None, template_name: str = None,
+              language_code: str = 'pt_BR', parameters: List[str] = None, rate: float = None,
+              workers: int = None, progress: Callable[[BroadcastResult], Any] = None) -> BroadcastResult:
+    """
+    Enviar `message` (texto) ou `template_name` para todos os `contacts`.
+    No máximo `workers` requisições simultâneas e `rate` por segundo; os
+    resultados são gravados a cada WHATSAPP_BROADCAST_WRITE_BATCH envios.
+    """
+    if not message and not template_name:
+        raise ValueError('Informe a mensagem ou o template')
+
+    access_token = whatsapp_service._get_config('whatsapp_access_token')
+    phone_number_id = whatsapp_service._get_config('whatsapp_phone_number_id')
+    if not access_token or not phone_number_id:
+        raise ValueError('Configurações da API não encontradas')
+
+    if template_name:
+        build_payload = lambda phone: whatsapp_service.template_payload(phone, template_name, language_code, parameters)
+        message_type, content = 'template', f"Template: {template_name}"
+    else:
+        build_payload = lambda phone: whatsapp_service.text_payload(phone, message)
+        message_type, content = 'text', message
+
+    workers = workers or BROADCAST_WORKERS
+    result = BroadcastResult(broadcast_id=uuid.uuid4().hex[:12])
+    metadata = {'broadcast_id': result.broadcast_id}
+    if template_name:
+        metadata.update(template_name=template_name, parameters=parameters)
+    pacer = RatePacer(rate if rate is not None else BROADCAST_RATE)
+    finished: List[Tuple[WhatsAppContact, Optional[dict], Optional[str]]] = []
+
+    def collect(futures) -> None:
+        for future in futures:
+            contact = in_flight.pop(future)
+            try:
+                response_data, error = future.result()
+            except Exception as e:
+                response_data, error = None, f"Erro inesperado: {str(e)}"
+            finished.append((contact, response_data, error))
+            if error is None:
+                result.sent += 1
+            else:
+                result.failed += 1
+                result.errors[contact.phone_number] = error
+        if len(finished) >= BROADCAST_WRITE_BATCH:
+            flush()
+
+    def flush() -> None:
+        if finished:
+            try:
+                _write_results(finished, message_type, content, metadata)
+            except Exception as e:
+                # As mensagens já saíram: registrar a falha e seguir com o envio
+                logger.error(f"Broadcast {result.broadcast_id}: erro ao gravar {len(finished)} resultado(s): {e}")
+            finished.clear()
+            if progress:
+                progress(result)
+
+    # Lista materializada: o banco é gravado durante o envio
+    contacts = list(contacts)
+    result.total = len(contacts)
+    logger.info(f"Broadcast {result.broadcast_id}: {result.total} contatos")
+
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='whatsapp-broadcast') as pool:
+            for contact in contacts:
+                # Fila limitada: nunca mais que 2x workers requisições pendentes
+                if len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pacer.wait()
+                future = pool.submit(_post, phone_number_id, access_token, build_payload(contact.phone_number))
+                in_flight[future] = contact
+            collect(list(wait(in_flight).done))
+    finally:
+        # Interrompido no meio (erro ou Ctrl+C): o pool já esperou as requisições
+        # pendentes, então o que foi enviado ainda é gravado
+        collect([future for future in in_flight if future.done()])
+        flush()
+
+    whatsapp_service._log('info', f'Broadcast {result.broadcast_id} concluído: '
+                                  f'{result.sent} enviadas, {result.failed} com erro', metadata=metadata)
+    return result
@@ -0,0 +1,100 @@
+"""
+Listagem paginada de contatos do WhatsApp
+Paginação por cursor em (updated_at, id): cada página é uma leitura do índice
+(updated_at, id) a partir da última linha da página anterior, sem COUNT nem
+OFFSET, então a página 500 custa o mesmo que a primeira. Buscas por
+número usam a faixa de prefixo em phone_digits (também indexada) e só
+caem no icontains (varredura) quando o prefixo não encontra nada.
+"""
+
+import base64
+import hashlib
+import json
+import re
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import WhatsAppContact, digits_only
+
+CONTACTS_COUNT_CACHE_TIMEOUT = getattr(settings, 'WHATSAPP_CONTACTS_COUNT_CACHE_TIMEOUT', 60)
+# Código do país acrescentado às buscas por número sem DDI ('11999' também encontra '5511999...')
+DEFAULT_COUNTRY_CODE = getattr(settings, 'WHATSAPP_DEFAULT_COUNTRY_CODE', '55')
+
+ORDERING = ('-updated_at', '-id')
+
+PHONE_SEARCH_RE = re.compile(r'^[\d\s()+.-]+$')
+
+
+def encode_cursor(contact: WhatsAppContact) -> str:
+    raw = json.dumps([contact.updated_at.isoformat(), contact.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """(updated_at, id) do cursor; ValueError se for inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        updated_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        updated_at = parse_datetime(updated_at)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Cursor inválido')
+    if updated_at is None:
+        raise ValueError('Cursor inválido')
+    return updated_at, pk
+
+
+def _prefix_range(digits: str) -> Q:
+    # ':' vem logo depois de '9': a faixa [prefixo, prefixo + ':') usa o índice em qualquer banco
+    return Q(phone_digits__gte=digits, phone_digits__lt=digits + ':')
+
+
+def search_contacts(contacts, search: str):
+    """
+    Números (com ou sem +, espaços, traços e parênteses) buscam primeiro por
+    prefixo do telefone; sem resultado, por trecho do telefone em qualquer
+    posição ou do nome (como antes da paginação por cursor). Textos buscam no
+    nome e no telefone
+    """
+    search = search.strip()
+    if not search:
+        return contacts
+    substring = Q(phone_number__icontains=search) | Q(name__icontains=search)
+    digits = digits_only(search)
+    if digits and PHONE_SEARCH_RE.match(search):
+        condition = _prefix_range(digits)
+        if DEFAULT_COUNTRY_CODE and not digits.startswith(DEFAULT_COUNTRY_CODE):
+            condition |= _prefix_range(DEFAULT_COUNTRY_CODE + digits)
+        by_prefix = contacts.filter(condition)
+        if by_prefix.exists():
+            return by_prefix
+        return contacts.filter(substring | Q(phone_digits__contains=digits))
+    return contacts.filter(substring)
+
+
+def contact_page(contacts, cursor: Optional[str], per_page: int) -> Tuple[List[WhatsAppContact], Optional[str]]:
+    """Página após o cursor e o cursor da próxima (None na última)"""
+    if cursor:
+        updated_at, pk = decode_cursor(cursor)
+        # updated_at <= x AND NOT (updated_at = x AND id >= y): faixa simples no índice
+        contacts = contacts.filter(updated_at__lte=updated_at).exclude(updated_at=updated_at, pk__gte=pk)
+    page = list(contacts.order_by(*ORDERING)[:per_page + 1])
+    if len(page) <= per_page:
+        return page, None
+    page = page[:per_page]
+    return page, encode_cursor(page[-1])
+
+
+def approximate_count(contacts, *key_parts) -> int:
+    """COUNT em cache por alguns segundos (total aproximado para a interface)"""
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    key = f'whatsapp:contacts:count:{digest}'
+    total = cache.get(key)
+    if total is None:
+        total = contacts.count()
+        cache.set(key, total, CONTACTS_COUNT_CACHE_TIMEOUT)
+    return total
@@ -0,0 +1,158 @@
+"""
+Cliente HTTP da WhatsApp Business API (Graph API)
+Uma requests.Session por processo: conexões keep-alive reaproveitadas, pool
+limitado, timeouts curtos e novas tentativas com backoff exponencial e jitter.
+Todo envio (inclusive cada nova tentativa) passa antes pelo limitador de taxa
+compartilhado entre os workers
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Dict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .rate_limiter import RateLimiter
+
+# Base configurável: permite apontar para um servidor stub local nos testes
+API_BASE_URL = getattr(settings, 'WHATSAPP_API_BASE_URL', 'https://graph.facebook.com/v18.0').rstrip('/')
+
+# (conexão, leitura) em segundos
+API_TIMEOUT = (
+    getattr(settings, 'WHATSAPP_API_CONNECT_TIMEOUT', 3.05),
+    getattr(settings, 'WHATSAPP_API_READ_TIMEOUT', 10),
+)
+
+API_POOL_SIZE = getattr(settings, 'WHATSAPP_API_POOL_SIZE', 10)
+API_MAX_RETRIES = getattr(settings, 'WHATSAPP_API_MAX_RETRIES', 3)
+API_BACKOFF_FACTOR = getattr(settings, 'WHATSAPP_API_BACKOFF_FACTOR', 0.5)
+API_BACKOFF_JITTER = getattr(settings, 'WHATSAPP_API_BACKOFF_JITTER', 0.5)
+API_BACKOFF_MAX = getattr(settings, 'WHATSAPP_API_BACKOFF_MAX', 10)
+API_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Requisições por segundo somando todos os processos (0 = sem limite)
+API_RATE_LIMIT = getattr(settings, 'WHATSAPP_API_RATE_LIMIT', 50)
+API_RATE_BURST = getattr(settings, 'WHATSAPP_API_RATE_BURST', API_RATE_LIMIT)
+API_RATE_MAX_WAIT = getattr(settings, 'WHATSAPP_API_RATE_MAX_WAIT', 30)  # segundos
+# Espera máxima em requisições web: melhor recusar do que prender a thread do worker
+API_RATE_WEB_MAX_WAIT = getattr(settings, 'WHATSAPP_API_RATE_WEB_MAX_WAIT', 2)
+# Processos que enviam em paralelo: sem cache compartilhado cada um usa rate / processes
+API_RATE_PROCESSES = getattr(settings, 'WHATSAPP_API_RATE_PROCESSES', 1)
+
+
+class ApiRateLimited(requests.exceptions.RequestException):
+    """A espera pelo limitador passaria de WHATSAPP_API_RATE_MAX_WAIT"""
+
+
+rate_limiter = RateLimiter(
+    'whatsapp-api',
+    rate=API_RATE_LIMIT,
+    burst=API_RATE_BURST,
+    max_wait=API_RATE_MAX_WAIT,
+    shared=getattr(settings, 'WHATSAPP_API_RATE_SHARED', None),
+    processes=API_RATE_PROCESSES,
+)
+
+
+def build_retry() -> Retry:
+    """
+    Novas tentativas em erros de conexão (a requisição não chegou a sair) e,
+    só para GET/DELETE, nas respostas 429/5xx (respeitando Retry-After).
+    Timeouts de leitura e respostas 5xx de POST não são repetidos: a mensagem
+    pode ter sido entregue e o envio seria duplicado. O 429 de POST é
+    repetido por post(), passando de novo pelo limitador.
+    """
+    return Retry(
+        total=API_MAX_RETRIES,
+        connect=API_MAX_RETRIES,
+        read=0,
+        status=API_MAX_RETRIES,
+        backoff_factor=API_BACKOFF_FACTOR,
+        backoff_jitter=API_BACKOFF_JITTER,
+        backoff_max=API_BACKOFF_MAX,
+        status_forcelist=API_RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'DELETE'}),
+        respect_retry_after_header=True,
+        # Após a última tentativa a resposta de erro é devolvida para o chamador tratar
+        raise_on_status=False,
+    )
+
+
+def build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=API_POOL_SIZE,
+        pool_block=True,
+        max_retries=build_retry(),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Sessão compartilhada do processo (recriada após o fork do gunicorn)"""
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def api_url(path: str) -> str:
+    return f"{API_BASE_URL}/{path.lstrip('/')}"
+
+
+def retry_delay(response: requests.Response, attempt: int) -> float:
+    """Retry-After da resposta ou backoff exponencial com jitter (até WHATSAPP_API_BACKOFF_MAX)"""
+    try:
+        delay = float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        delay = API_BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, API_BACKOFF_JITTER)
+    return min(max(delay, 0.0), API_BACKOFF_MAX)
+
+
+def post(path: str, access_token: str, payload: Dict[str, Any], max_wait: float = None) -> requests.Response:
+    """
+    POST JSON autenticado na Graph API.
+    `max_wait` (padrão WHATSAPP_API_RATE_MAX_WAIT) é o total de espera da
+    chamada: a vez no limitador e as pausas entre novas tentativas somam
+    contra ele. Só o 429 é repetido aqui (a API recusou sem processar); se a
+    próxima pausa passar do limite o 429 volta ao chamador, assim como os 5xx
+    """
+    budget = API_RATE_MAX_WAIT if max_wait is None else max_wait
+    for attempt in range(API_MAX_RETRIES + 1):
+        waited = rate_limiter.acquire(budget)
+        if waited is None:
+            raise ApiRateLimited(f"Limite de {API_RATE_LIMIT} requisições/s: espera acima de {budget:.1f}s")
+        budget -= waited
+        response = get_session().post(
+            api_url(path),
+            headers={
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            },
+            json=payload,
+            timeout=API_TIMEOUT,
+        )
+        if response.status_code != 429 or attempt == API_MAX_RETRIES:
+            return response
+        delay = retry_delay(response, attempt)
+        if delay > budget:
+            return response
+        budget -= delay
+        time.sleep(delay)
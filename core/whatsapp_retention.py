@@ -0,0 +1,161 @@
+"""
+Retenção dos dados do chatbot WhatsApp
+Cada política seleciona as linhas vencidas de um modelo e as processa em lotes
+por chave primária, uma transação curta por lote (o SQLite fica livre para os
+demais escritores entre os lotes). As políticas de arquivo movem mensagens e
+logs para o arquivo frio (core.whatsapp_archive) antes de qualquer exclusão.
+Por padrão só as sessões sem atividade são inativadas; as exclusões exigem
+WHATSAPP_RETENTION_DELETE_ENABLED (ou serem pedidas pelo nome)
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    WhatsAppLog, WhatsAppMessage, WhatsAppOutboundMessage, WhatsAppSession, WhatsAppWebhookEvent
+)
+from .whatsapp_archive import ARCHIVE_CHUNK_SIZE, ARCHIVE_ENABLED, archive_queryset
+
+logger = logging.getLogger('core')
+
+RETENTION_CHUNK_SIZE = getattr(settings, 'WHATSAPP_RETENTION_CHUNK_SIZE', 500)
+# Pausa entre lotes (s) para não monopolizar o banco
+RETENTION_CHUNK_PAUSE = getattr(settings, 'WHATSAPP_RETENTION_CHUNK_PAUSE', 0.05)
+# Dias de retenção por política, sobrescrevendo os padrões abaixo ({'logs': 15, ...})
+RETENTION_DAYS = getattr(settings, 'WHATSAPP_RETENTION_DAYS', {})
+# Políticas que excluem linhas só rodam por padrão se habilitadas
+RETENTION_DELETE_ENABLED = getattr(settings, 'WHATSAPP_RETENTION_DELETE_ENABLED', False)
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    name: str
+    label: str
+    days: int
+    action: str  # 'delete', 'deactivate' ou 'archive'
+    expired: Callable[[datetime], object]  # cutoff -> queryset das linhas vencidas
+    chunk_size: Optional[int] = None
+
+    @property
+    def retention_days(self) -> int:
+        return RETENTION_DAYS.get(self.name, self.days)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Executada sem pedir pelo nome? Arquivo só com WHATSAPP_ARCHIVE_ENABLED,
+        exclusão só com WHATSAPP_RETENTION_DELETE_ENABLED
+        """
+        if self.action == 'archive':
+            return ARCHIVE_ENABLED
+        if self.action == 'delete':
+            return RETENTION_DELETE_ENABLED
+        return True
+
+
+# Ordem de execução: arquivo antes das exclusões, mensagens antes das sessões que as contêm
+RETENTION_POLICIES = (
+    RetentionPolicy(
+        'archive_logs', 'logs arquivados', 14, 'archive',
+        lambda cutoff: WhatsAppLog.objects.filter(timestamp__lt=cutoff),
+        chunk_size=ARCHIVE_CHUNK_SIZE,
+    ),
+    RetentionPolicy(
+        'archive_messages', 'mensagens arquivadas', 30, 'archive',
+        lambda cutoff: WhatsAppMessage.objects.filter(timestamp__lt=cutoff),
+        chunk_size=ARCHIVE_CHUNK_SIZE,
+    ),
+    RetentionPolicy(
+        'sessions', 'sessões sem atividade (inativadas)', 7, 'deactivate',
+        lambda cutoff: WhatsAppSession.objects.filter(is_active=True, last_activity__lt=cutoff),
+    ),
+    RetentionPolicy(
+        'webhook_events', 'webhooks processados', 7, 'delete',
+        lambda cutoff: WhatsAppWebhookEvent.objects.filter(status='done', received_at__lt=cutoff),
+    ),
+    RetentionPolicy(
+        'outbound', 'envios concluídos', 30, 'delete',
+        lambda cutoff: WhatsAppOutboundMessage.objects.filter(status__in=('sent', 'failed'), due_at__lt=cutoff),
+    ),
+    RetentionPolicy(
+        'logs', 'logs', 30, 'delete',
+        lambda cutoff: WhatsAppLog.objects.filter(timestamp__lt=cutoff),
+    ),
+    RetentionPolicy(
+        'messages', 'mensagens', 90, 'delete',
+        lambda cutoff: WhatsAppMessage.objects.filter(timestamp__lt=cutoff),
+    ),
+    RetentionPolicy(
+        'inactive_sessions', 'sessões inativas (excluídas)', 180, 'delete',
+        lambda cutoff: WhatsAppSession.objects.filter(is_active=False, last_activity__lt=cutoff),
+    ),
+)
+
+POLICIES_BY_NAME = {policy.name: policy for policy in RETENTION_POLICIES}
+
+
+def _apply(policy: RetentionPolicy, queryset) -> int:
+    if policy.action == 'deactivate':
+        return queryset.update(is_active=False)
+    if policy.action == 'archive':
+        return archive_queryset(queryset)
+    # delete() do queryset (os modelos só sobrescrevem o delete da instância)
+    return queryset.delete()[1].get(queryset.model._meta.label, 0)
+
+
+def purge(policy: RetentionPolicy, days: int = None, chunk_size: int = None, pause: float = None,
+          progress: Callable[[RetentionPolicy, int], None] = None) -> int:
+    """Processar as linhas vencidas de uma política em lotes; devolve o total processado"""
+    days = policy.retention_days if days is None else days
+    chunk_size = chunk_size or policy.chunk_size or RETENTION_CHUNK_SIZE
+    pause = RETENTION_CHUNK_PAUSE if pause is None else pause
+    expired = policy.expired(timezone.now() - timedelta(days=days))
+
+    total = 0
+    last_pk = 0
+    while True:
+        # As linhas antigas ficam no início da chave primária: cada lote lê poucas páginas do índice
+        pks = list(
+            expired.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not pks:
+            break
+        last_pk = pks[-1]
+        with transaction.atomic():
+            total += _apply(policy, expired.filter(pk__in=pks))
+        if progress:
+            progress(policy, total)
+        if len(pks) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if total:
+        logger.info(f"Retenção WhatsApp ({policy.name}, {days} dias): {total} linhas")
+    return total
+
+
+def count_expired(policy: RetentionPolicy, days: int = None) -> int:
+    days = policy.retention_days if days is None else days
+    return policy.expired(timezone.now() - timedelta(days=days)).count()
+
+
+def run_retention(names: Iterable[str] = None, days: Dict[str, int] = None, chunk_size: int = None,
+                  progress: Callable[[RetentionPolicy, int], None] = None) -> Dict[str, int]:
+    """Executar as políticas (as habilitadas ou `names`, na ordem de RETENTION_POLICIES)"""
+    names = set(names) if names else None
+    days = days or {}
+    results = {}
+    for policy in RETENTION_POLICIES:
+        selected = policy.name in names if names is not None else policy.enabled
+        if not selected:
+            continue
+        results[policy.name] = purge(policy, days.get(policy.name), chunk_size, progress=progress)
+    return results
@@ -7,183 +7,604 @@
 import time
 import uuid
 import logging
+import threading
 import requests
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Any
 from django.utils import timezone
 from django.conf import settings
-from django.db import transaction
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from django.core.exceptions import ValidationError
 
+from . import whatsapp_http
+from .batch_buffer import BatchBuffer
+from .chatbot_flow import FlowStep, build_flow, next_step_for
+from .config_cache import ConfigCache, shared_cache
 from .models import (
     WhatsAppContact, WhatsAppSession, WhatsAppMessage, 
-    WhatsAppTemplate, WhatsAppConfig, WhatsAppLog
+    WhatsAppTemplate, WhatsAppConfig, WhatsAppLog, WhatsAppWebhookEvent, WhatsAppOutboundMessage,
+    digits_only
 )
+from .whatsapp_retention import run_retention
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Cache das estatísticas no cache 'shared' (invalidado por core.signals ao alterar sessões,
+# mensagens ou contatos, em todos os workers); sem REDIS_URL vale o TTL nos demais processos
+SESSION_STATS_CACHE_KEY = 'whatsapp:session_stats'
+SESSION_STATS_CACHE_TIMEOUT = getattr(settings, 'WHATSAPP_STATS_CACHE_TIMEOUT', 15)
+
+# Fila de webhooks: o POST apenas grava o payload e o worker processa
+WEBHOOK_ASYNC = getattr(settings, 'WHATSAPP_WEBHOOK_ASYNC', False)
+WEBHOOK_BATCH_SIZE = getattr(settings, 'WHATSAPP_WEBHOOK_BATCH_SIZE', 50)
+WEBHOOK_MAX_ATTEMPTS = getattr(settings, 'WHATSAPP_WEBHOOK_MAX_ATTEMPTS', 5)
+WEBHOOK_LOCK_TIMEOUT = getattr(settings, 'WHATSAPP_WEBHOOK_LOCK_TIMEOUT', 300)  # segundos
+
+# Fila de envios agendados (delay_seconds dos templates), enviada por send_scheduled_whatsapp
+OUTBOUND_BATCH_SIZE = getattr(settings, 'WHATSAPP_OUTBOUND_BATCH_SIZE', 50)
+OUTBOUND_MAX_ATTEMPTS = getattr(settings, 'WHATSAPP_OUTBOUND_MAX_ATTEMPTS', 5)
+OUTBOUND_LOCK_TIMEOUT = getattr(settings, 'WHATSAPP_OUTBOUND_LOCK_TIMEOUT', 300)  # segundos
+OUTBOUND_RETRY_DELAY = getattr(settings, 'WHATSAPP_OUTBOUND_RETRY_DELAY', 60)  # segundos, dobra a cada tentativa
+
+# Deduplicação de reenvios do WhatsApp por message_id (por processo com LocMemCache;
+# a garantia entre workers é o índice único de WhatsAppMessage.message_id)
+DEDUPE_LOCAL_SIZE = getattr(settings, 'WHATSAPP_DEDUPE_LOCAL_SIZE', 10000)
+DEDUPE_CACHE_TIMEOUT = getattr(settings, 'WHATSAPP_DEDUPE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+# Cache de contatos por processo (telefone -> id e filtros); a invalidação chega aos
+# outros workers pelo cache 'shared' (REDIS_URL); sem ele, só após o TTL
+CONTACT_CACHE_SIZE = getattr(settings, 'WHATSAPP_CONTACT_CACHE_SIZE', 10000)
+CONTACT_CACHE_TTL = getattr(settings, 'WHATSAPP_CONTACT_CACHE_TTL', 300)  # segundos
+CONTACT_CACHE_CHECK_INTERVAL = getattr(settings, 'WHATSAPP_CONTACT_CACHE_CHECK_INTERVAL', 5)  # segundos
+
+# Sessão ativa de cada contato no cache do Django (TTL renovado a cada atividade)
+ACTIVE_SESSION_CACHE_PREFIX = 'whatsapp:active_session:'
+
+# Fluxo do chatbot compilado em memória (recarregado ao salvar um template; nos outros
+# workers só com o cache 'shared', senão após o TTL)
+TEMPLATE_CACHE_TTL = getattr(settings, 'WHATSAPP_TEMPLATE_CACHE_TTL', 300)  # segundos
+
+
+def invalidate_session_stats():
+    """Descartar as estatísticas em cache"""
+    shared_cache().delete(SESSION_STATS_CACHE_KEY)
+
+
+def invalidate_session_stats_on_commit():
+    """Descartar as estatísticas após o commit, uma vez por transação (lotes de mensagens)"""
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        callback is invalidate_session_stats for _, callback, *_ in connection.run_on_commit
+    ):
+        return
+    transaction.on_commit(invalidate_session_stats)
+
+
+# Logs do chatbot gravados em lote; níveis abaixo de WHATSAPP_LOG_LEVEL não vão para o banco
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'critical': 50}
+LOG_DB_LEVEL = LOG_LEVELS[getattr(settings, 'WHATSAPP_LOG_LEVEL', 'debug' if settings.DEBUG else 'info')]
+LOG_FLUSH_SIZE = getattr(settings, 'WHATSAPP_LOG_FLUSH_SIZE', 100)
+LOG_FLUSH_INTERVAL = getattr(settings, 'WHATSAPP_LOG_FLUSH_INTERVAL', 2.0)
+
+
+def write_logs(records: List[WhatsAppLog]) -> None:
+    """Gravar um lote de WhatsAppLog com um bulk_create"""
+    try:
+        WhatsAppLog.objects.bulk_create(records)
+    except IntegrityError:
+        # Sessão/contato criados em uma transação desfeita: gravar o log sem a referência
+        session_ids = set(WhatsAppSession.objects.filter(
+            pk__in={record.session_id for record in records if record.session_id}
+        ).values_list('pk', flat=True))
+        contact_ids = set(WhatsAppContact.objects.filter(
+            pk__in={record.contact_id for record in records if record.contact_id}
+        ).values_list('pk', flat=True))
+        for record in records:
+            if record.session_id not in session_ids:
+                record.session_id = None
+            if record.contact_id not in contact_ids:
+                record.contact_id = None
+        WhatsAppLog.objects.bulk_create(records)
+
+
+log_buffer = BatchBuffer(
+    write_logs,
+    name='whatsapp-log',
+    flush_size=LOG_FLUSH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+)
+
+
+class SeenMessageIds:
+    """
+    Conjunto de message_ids já processados: LRU limitado no processo e chaves
+    no cache do Django. É só um atalho para descartar reenvios sem consultar o
+    banco: com o LocMemCache (padrão do projeto) o cache também é por processo,
+    então outro worker do gunicorn não enxerga os ids marcados aqui.
+    A garantia real é o índice único de WhatsAppMessage.message_id: o lote
+    consulta os ids já gravados antes de inserir e, se outro processo gravar o
+    mesmo id no meio, o IntegrityError desfaz o lote, que é reprocessado.
+    """
+    
+    def __init__(self, max_size: int = None, timeout: int = None, prefix: str = 'whatsapp:seen:'):
+        self.max_size = max_size or DEDUPE_LOCAL_SIZE
+        self.timeout = timeout or DEDUPE_CACHE_TIMEOUT
+        self.prefix = prefix
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _remember(self, message_ids):
+        with self._lock:
+            for message_id in message_ids:
+                self._local[message_id] = True
+                self._local.move_to_end(message_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+    
+    def filter_new(self, message_ids: List[str]) -> List[str]:
+        """IDs ainda não vistos (uma consulta ao cache para os que não estão no processo)"""
+        with self._lock:
+            unknown = [message_id for message_id in message_ids if message_id not in self._local]
+        if not unknown:
+            return []
+        
+        cached = cache.get_many([self.prefix + message_id for message_id in unknown])
+        if cached:
+            self._remember(key[len(self.prefix):] for key in cached)
+        return [message_id for message_id in unknown if self.prefix + message_id not in cached]
+    
+    def mark(self, message_ids: List[str]) -> None:
+        message_ids = [message_id for message_id in message_ids if message_id]
+        if not message_ids:
+            return
+        self._remember(message_ids)
+        cache.set_many({self.prefix + message_id: 1 for message_id in message_ids}, self.timeout)
+    
+    def mark_on_commit(self, message_ids: List[str]) -> None:
+        """Marcar apenas se a transação atual confirmar"""
+        message_ids = list(message_ids)
+        transaction.on_commit(lambda: self.mark(message_ids))
+
+
+seen_message_ids = SeenMessageIds()
+
+
+class ContactInfo(NamedTuple):
+    """Dados do contato mantidos em memória"""
+    id: int
+    name: str
+    is_my_contact: bool
+    is_blocked: bool
+    is_active: bool
+    
+    @property
+    def is_filtered(self) -> bool:
+        """Contatos da sua lista ou bloqueados não recebem respostas automáticas"""
+        return self.is_active and (self.is_my_contact or self.is_blocked)
+    
+    def as_contact(self, phone_number: str) -> WhatsAppContact:
+        """Instância montada sem consulta (para FKs e templates; não deve ser salva)"""
+        return WhatsAppContact(
+            pk=self.id, phone_number=phone_number, name=self.name,
+            is_my_contact=self.is_my_contact, is_blocked=self.is_blocked, is_active=self.is_active
+        )
+
+
+class ContactResolver:
+    """
+    LRU do processo: phone_number -> ContactInfo.
+    Salvar ou excluir um contato (core.signals) limpa o LRU deste processo e
+    muda a versão no cache compartilhado (alias 'shared', REDIS_URL); os
+    demais processos limpam o seu na próxima conferência (a cada
+    `check_interval` s). Sem cache compartilhado a versão só é vista por este
+    processo: nos outros workers um contato bloqueado ou marcado como
+    is_my_contact continua valendo como antes por até `ttl` s.
+    """
+    
+    def __init__(self, max_size: int = None, ttl: float = None, check_interval: float = None,
+                 version_key: str = 'whatsapp:contacts:version'):
+        self.max_size = max_size or CONTACT_CACHE_SIZE
+        self.ttl = ttl or CONTACT_CACHE_TTL
+        self.check_interval = check_interval if check_interval is not None else CONTACT_CACHE_CHECK_INTERVAL
+        self.version_key = version_key
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+    
+    def _check_version(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = shared_cache().get(self.version_key)
+        if version != self._version:
+            with self._lock:
+                self._local.clear()
+                self._version = version
+    
+    def lookup(self, phone_numbers: Iterable[str]) -> Dict[str, ContactInfo]:
+        """Contatos conhecidos pelo processo (sem acesso ao banco)"""
+        self._check_version()
+        expired_before = time.monotonic() - self.ttl
+        found = {}
+        with self._lock:
+            for phone_number in phone_numbers:
+                entry = self._local.get(phone_number)
+                if entry is None:
+                    continue
+                info, loaded_at = entry
+                if loaded_at < expired_before:
+                    del self._local[phone_number]
+                    continue
+                self._local.move_to_end(phone_number)
+                found[phone_number] = info
+        return found
+    
+    def remember(self, contacts: Iterable[WhatsAppContact]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for contact in contacts:
+                self._local[contact.phone_number] = (ContactInfo(
+                    contact.pk, contact.name, contact.is_my_contact, contact.is_blocked, contact.is_active
+                ), now)
+                self._local.move_to_end(contact.phone_number)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+    
+    def invalidate(self) -> None:
+        """Descartar o LRU local e sinalizar os demais processos"""
+        version = uuid.uuid4().hex
+        shared_cache().set(self.version_key, version, None)
+        with self._lock:
+            self._local.clear()
+            self._version = version
+
+
+contact_resolver = ContactResolver()
+
+
+def _load_flow():
+    """Grafo do fluxo: primeiro template ativo de cada passo (como em .filter().first())"""
+    return build_flow(WhatsAppTemplate.objects.filter(is_active=True)).items()
+
+
+template_cache = ConfigCache(
+    _load_flow,
+    version_key='whatsapp:templates:version',
+    ttl=TEMPLATE_CACHE_TTL,
+)
+
+
+def new_session_id(contact_id: int) -> str:
+    """session_id único mesmo para sessões criadas no mesmo segundo"""
+    return f"session_{contact_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+
+def remember_active_sessions(sessions: Iterable[WhatsAppSession], timeout: int) -> None:
+    """Renovar no cache as sessões ativas e descartar as encerradas"""
+    active, closed = {}, []
+    for session in sessions:
+        key = f'{ACTIVE_SESSION_CACHE_PREFIX}{session.contact_id}'
+        if session.status == 'active' and session.is_active:
+            active[key] = session.pk
+        else:
+            closed.append(key)
+    if active:
+        cache.set_many(active, timeout)
+    if closed:
+        cache.delete_many(closed)
+
 
 class WhatsAppChatbotService:
     """Serviço principal do chatbot WhatsApp"""
     
-    def __init__(self):
-        self._is_active = None
-        self._auto_response_delay = None
-        self._max_session_duration = None
-    
     @property
     def is_active(self):
-        """Verificar se o chatbot está ativo"""
-        if self._is_active is None:
-            self._is_active = self._get_config('chatbot_active', 'false').lower() == 'true'
-        return self._is_active
+        """Verificar se o chatbot está ativo (lido a cada uso; o cache de configurações evita o banco)"""
+        return self._get_config('chatbot_active', 'false').lower() == 'true'
     
     @property
     def auto_response_delay(self):
         """Obter delay de resposta automática"""
-        if self._auto_response_delay is None:
-            self._auto_response_delay = int(self._get_config('auto_response_delay', '5'))
-        return self._auto_response_delay
+        return int(self._get_config('auto_response_delay', '5'))
     
     @property
     def max_session_duration(self):
         """Obter duração máxima da sessão"""
-        if self._max_session_duration is None:
-            self._max_session_duration = int(self._get_config('max_session_duration', '3600'))  # 1 hora
-        return self._max_session_duration
+        return int(self._get_config('max_session_duration', '3600'))  # 1 hora
         
     def _get_config(self, key: str, default: str = '') -> str:
         """Obter configuração do sistema"""
         return WhatsAppConfig.get_value(key, default)
     
     def _log(self, level: str, message: str, session=None, contact=None, metadata=None):
-        """Registrar log de atividade"""
+        """Registrar log de atividade (enfileirado; gravado em lote pelo log_buffer)"""
+        if LOG_LEVELS.get(level, 0) < LOG_DB_LEVEL:
+            return
         try:
-            WhatsAppLog.objects.create(
+            log_buffer.record(WhatsAppLog(
                 level=level,
                 message=message,
-                session=session,
-                contact=contact,
+                session_id=session.pk if session else None,
+                contact_id=contact.pk if contact else None,
                 metadata=metadata or {}
-            )
+            ))
         except Exception as e:
             logger.error(f"Erro ao registrar log: {e}")
     
     def is_contact_filtered(self, phone_number: str) -> bool:
-        """Verificar se o contato deve ser filtrado (ignorado)"""
-        try:
-            contact = WhatsAppContact.objects.get(
-                phone_number=phone_number,
-                is_active=True
-            )
-            
-            # Filtrar se for da sua lista de contatos ou estiver bloqueado
-            if contact.is_my_contact or contact.is_blocked:
-                self._log('info', f'Contato filtrado: {phone_number}', contact=contact)
-                return True
-                
-            return False
-            
-        except WhatsAppContact.DoesNotExist:
-            # Contato não existe, criar como novo contato não filtrado
-            contact = WhatsAppContact.objects.create(
-                phone_number=phone_number,
-                is_my_contact=False,
-                is_blocked=False
-            )
-            self._log('info', f'Novo contato criado: {phone_number}', contact=contact)
-            return False
+        """Verificar se o contato deve ser filtrado (ignorado); contatos novos são criados"""
+        contact = self._resolve_contacts({phone_number: ''})[phone_number]
+        if contact.is_active and (contact.is_my_contact or contact.is_blocked):
+            self._log('info', f'Contato filtrado: {phone_number}', contact=contact)
+            return True
+        return False
     
     def process_incoming_message(self, message_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Processar mensagem recebida do WhatsApp"""
+        responses = self.process_incoming_batch([message_data])
+        return responses[0] if responses else None
+    
+    def process_incoming_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Processar todas as mensagens de um webhook em uma transação.
+        Contatos, sessões e mensagens são lidos com um IN por tabela e gravados
+        com bulk_create/bulk_update; devolve as respostas automáticas geradas.
+        Erros são registrados e propagados: o lote é desfeito e o webhook deve
+        ser reprocessado (a fila devolve o evento para 'pending').
+        """
         if not self.is_active:
             self._log('debug', 'Chatbot inativo, ignorando mensagem')
-            return None
+            return []
+        
+        # Remetentes filtrados já conhecidos pelo processo são descartados sem acessar o banco
+        messages = self._drop_filtered(messages)
+        if not messages:
+            return []
         
         try:
-            phone_number = message_data.get('from')
-            message_content = message_data.get('body', '')
-            message_id = message_data.get('id', str(uuid.uuid4()))
-            timestamp = datetime.fromtimestamp(message_data.get('timestamp', time.time()))
-            
-            # Verificar se o contato deve ser filtrado
-            if self.is_contact_filtered(phone_number):
-                return None
-            
-            # Obter ou criar contato
-            contact, created = WhatsAppContact.objects.get_or_create(
-                phone_number=phone_number,
-                defaults={'is_my_contact': False, 'is_blocked': False}
-            )
-            
-            # Obter ou criar sessão ativa
-            session = self._get_or_create_session(contact)
-            
-            # Registrar mensagem recebida
-            incoming_message = WhatsAppMessage.objects.create(
-                session=session,
+            with transaction.atomic():
+                responses = self._process_batch(messages)
+                seen_message_ids.mark_on_commit(message_data.get('id') for message_data in messages)
+                return responses
+        except Exception as e:
+            self._log('error', f'Erro ao processar mensagem: {str(e)}',
+                     metadata={'error': str(e), 'messages': len(messages)})
+            logger.error(f"Erro ao processar mensagem: {e}")
+            raise
+    
+    def _drop_filtered(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        known = contact_resolver.lookup({m['from'] for m in messages if m.get('from')})
+        accepted, filtered_ids = [], []
+        for message_data in messages:
+            info = known.get(message_data.get('from'))
+            if info is not None and info.is_filtered:
+                self._log('info', f'Contato filtrado: {message_data["from"]}', contact=info.as_contact(message_data['from']))
+                filtered_ids.append(message_data.get('id'))
+            else:
+                accepted.append(message_data)
+        seen_message_ids.mark(filtered_ids)
+        return accepted
+    
+    def _process_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Ignorar mensagens repetidas no lote e já registradas
+        unique_messages = {}
+        for message_data in messages:
+            message_id = message_data.get('id') or str(uuid.uuid4())
+            unique_messages.setdefault(message_id, message_data)
+        
+        existing_ids = set(WhatsAppMessage.objects.filter(
+            message_id__in=list(unique_messages)
+        ).values_list('message_id', flat=True))
+        pending = [
+            (message_id, message_data) for message_id, message_data in unique_messages.items()
+            if message_id not in existing_ids and message_data.get('from')
+        ]
+        if not pending:
+            return []
+        
+        names = {}
+        for _, message_data in pending:
+            names[message_data['from']] = names.get(message_data['from']) or message_data.get('profile_name', '')
+        contacts = self._resolve_contacts(names)
+        
+        # Filtrar contatos da sua lista ou bloqueados
+        accepted = []
+        for message_id, message_data in pending:
+            contact = contacts[message_data['from']]
+            if contact.is_active and (contact.is_my_contact or contact.is_blocked):
+                self._log('info', f'Contato filtrado: {contact.phone_number}', contact=contact)
+                continue
+            accepted.append((message_id, message_data, contact))
+        if not accepted:
+            return []
+        
+        sessions = self._resolve_sessions({contact.pk: contact for _, _, contact in accepted})
+        
+        incoming_messages = WhatsAppMessage.objects.bulk_create([
+            WhatsAppMessage(
+                session=sessions[contact.pk],
                 message_id=message_id,
                 direction='incoming',
                 message_type=message_data.get('type', 'text'),
-                content=message_content,
-                timestamp=timestamp,
+                content=message_data.get('body', ''),
+                timestamp=self._message_timestamp(message_data),
                 is_automated=False,
                 metadata=message_data
             )
-            
-            self._log('info', f'Mensagem recebida de {phone_number}: {message_content[:50]}...', 
-                     session=session, contact=contact)
-            
-            # Processar resposta automática
-            response = self._generate_automated_response(session, incoming_message)
-            
-            return response
-            
-        except Exception as e:
-            self._log('error', f'Erro ao processar mensagem: {str(e)}', metadata={'error': str(e)})
-            logger.error(f"Erro ao processar mensagem: {e}")
-            return None
-    
-    def _get_or_create_session(self, contact: WhatsAppContact) -> WhatsAppSession:
-        """Obter sessão ativa ou criar nova"""
-        # Verificar se existe sessão ativa recente
-        recent_session = WhatsAppSession.objects.filter(
-            contact=contact,
-            status='active',
-            last_activity__gte=timezone.now() - timedelta(seconds=self.max_session_duration),
-            is_active=True
-        ).first()
+            for message_id, message_data, contact in accepted
+        ])
+        
+        for message in incoming_messages:
+            self._log('info', f'Mensagem recebida de {message.session.contact.phone_number}: {message.content[:50]}...',
+                     session=message.session, contact=message.session.contact)
         
-        if recent_session:
-            return recent_session
+        # Respostas automáticas na ordem de chegada (cada uma avança o passo da sessão)
+        flow = self._flow()
+        now = timezone.now()
+        outgoing_messages = []
+        responses = []
+        for message in incoming_messages:
+            session = message.session
+            session.last_activity = now
+            if session.status != 'active':
+                continue
+            result = self._build_automated_response(session, flow, now, message.content)
+            if result:
+                outgoing_message, response_data = result
+                outgoing_messages.append(outgoing_message)
+                responses.append(response_data)
         
-        # Criar nova sessão
-        session = WhatsAppSession.objects.create(
-            contact=contact,
-            session_id=f"session_{contact.id}_{int(time.time())}",
-            status='active',
-            current_step=0,
-            context_data={}
+        WhatsAppMessage.objects.bulk_create(outgoing_messages)
+        # O envio respeita o delay do template sem bloquear a requisição
+        schedule_responses(outgoing_messages, responses, now)
+        WhatsAppSession.objects.bulk_update(
+            list({session.pk: session for session in sessions.values()}.values()),
+            ['status', 'current_step', 'context_data', 'last_activity', 'completed_at', 'error_message']
         )
+        # Mensagens do dia e sessões concluídas mudam as contagens
+        invalidate_session_stats_on_commit()
         
-        self._log('info', f'Nova sessão criada: {session.session_id}', session=session, contact=contact)
-        return session
+        return responses
     
-    def _generate_automated_response(self, session: WhatsAppSession, incoming_message: WhatsAppMessage) -> Optional[Dict[str, Any]]:
-        """Gerar resposta automatizada baseada no template"""
+    def _message_timestamp(self, message_data: Dict[str, Any]) -> datetime:
+        """Timestamp Unix do WhatsApp (string ou número) como datetime com fuso"""
         try:
-            # Obter template para o passo atual
-            template = WhatsAppTemplate.objects.filter(
-                step_number=session.current_step,
-                is_active=True
-            ).first()
+            return datetime.fromtimestamp(int(message_data.get('timestamp')), tz=dt_timezone.utc)
+        except (TypeError, ValueError):
+            return timezone.now()
+    
+    def _resolve_contacts(self, names: Dict[str, str]) -> Dict[str, WhatsAppContact]:
+        """
+        Obter ou criar contatos (telefone -> nome do perfil).
+        Os conhecidos vêm do contact_resolver; os demais são lidos com um IN e
+        os inexistentes criados com um bulk_create.
+        """
+        contacts = {
+            phone: info.as_contact(phone)
+            for phone, info in contact_resolver.lookup(names).items()
+        }
+        unknown = [phone for phone in names if phone not in contacts]
+        if not unknown:
+            return contacts
+        
+        loaded = list(WhatsAppContact.objects.filter(phone_number__in=unknown))
+        missing = set(unknown) - {contact.phone_number for contact in loaded}
+        if missing:
+            WhatsAppContact.objects.bulk_create(
+                [
+                    WhatsAppContact(phone_number=phone, phone_digits=digits_only(phone),
+                                    name=names[phone] or '', is_my_contact=False, is_blocked=False)
+                    for phone in missing
+                ],
+                ignore_conflicts=True
+            )
+            created = list(WhatsAppContact.objects.filter(phone_number__in=missing))
+            for contact in created:
+                self._log('info', f'Novo contato criado: {contact.phone_number}', contact=contact)
+            loaded.extend(created)
+            invalidate_session_stats_on_commit()
+        
+        # Contatos criados em uma transação desfeita não podem ficar no cache
+        transaction.on_commit(lambda: contact_resolver.remember(loaded))
+        contacts.update((contact.phone_number, contact) for contact in loaded)
+        return contacts
+    
+    def _resolve_sessions(self, contacts: Dict[int, WhatsAppContact]) -> Dict[int, WhatsAppSession]:
+        """
+        Sessão ativa recente de cada contato; cria as que faltam em um bulk_create.
+        O cache aponta a sessão de cada contato (busca pela chave primária); a
+        sessão é conferida e, se tiver sido encerrada, a busca usa o índice
+        (contact, status, is_active, last_activity).
+        """
+        sessions = {}
+        window_start = timezone.now() - timedelta(seconds=self.max_session_duration)
+        
+        cached = cache.get_many([f'{ACTIVE_SESSION_CACHE_PREFIX}{contact_id}' for contact_id in contacts])
+        if cached:
+            for session in WhatsAppSession.objects.filter(pk__in=list(cached.values())).order_by():
+                if (session.contact_id in contacts and session.status == 'active'
+                        and session.is_active and session.last_activity >= window_start):
+                    session.contact = contacts[session.contact_id]
+                    sessions[session.contact_id] = session
+        
+        uncached = [contact_id for contact_id in contacts if contact_id not in sessions]
+        if uncached:
+            recent_sessions = WhatsAppSession.objects.filter(
+                contact_id__in=uncached,
+                status='active',
+                is_active=True,
+                last_activity__gte=window_start
+            ).order_by('last_activity')
+            for session in recent_sessions:
+                # A mais recente prevalece
+                session.contact = contacts[session.contact_id]
+                sessions[session.contact_id] = session
+        
+        missing = [contact for contact_id, contact in contacts.items() if contact_id not in sessions]
+        if missing:
+            new_sessions = [
+                WhatsAppSession(
+                    contact=contact,
+                    session_id=new_session_id(contact.id),
+                    status='active',
+                    current_step=0,
+                    context_data={}
+                )
+                for contact in missing
+            ]
+            WhatsAppSession.objects.bulk_create(new_sessions)
+            if any(session.pk is None for session in new_sessions):
+                # Bancos sem RETURNING: recuperar as chaves pelo session_id
+                ids = dict(WhatsAppSession.objects.filter(
+                    session_id__in=[session.session_id for session in new_sessions]
+                ).values_list('session_id', 'id'))
+                for session in new_sessions:
+                    session.pk = ids[session.session_id]
+            for session in new_sessions:
+                sessions[session.contact.pk] = session
+                self._log('info', f'Nova sessão criada: {session.session_id}', session=session, contact=session.contact)
+            invalidate_session_stats_on_commit()
+        
+        self._remember_sessions(sessions.values())
+        return sessions
+    
+    def _remember_sessions(self, sessions: Iterable[WhatsAppSession]) -> None:
+        """
+        Atualizar o cache de sessões ativas após o commit (TTL = max_session_duration).
+        Lido no commit: sessões encerradas depois no mesmo lote saem do cache.
+        """
+        sessions = list(sessions)
+        timeout = self.max_session_duration
+        transaction.on_commit(lambda: remember_active_sessions(sessions, timeout))
+
+    def _get_or_create_session(self, contact: WhatsAppContact) -> WhatsAppSession:
+        """Obter sessão ativa ou criar nova"""
+        return self._resolve_sessions({contact.pk: contact})[contact.pk]
+
+    def _flow(self) -> Dict[int, FlowStep]:
+        """Grafo do fluxo, do template_cache (sem consulta em regime)"""
+        return template_cache.get_all()
+    
+    def _build_automated_response(self, session: WhatsAppSession, flow: Dict[int, FlowStep],
+                                  now: datetime, text: str = '') -> Optional[Tuple[WhatsAppMessage, Dict[str, Any]]]:
+        """Gerar resposta automatizada pelo fluxo (sessão alterada apenas em memória)"""
+        try:
+            # Passo a responder: desvio pela resposta do contato ou o passo atual
+            session.current_step = next_step_for(
+                flow, session.current_step, session.context_data.get('last_step'), text
+            )
+            flow_step = flow.get(session.current_step)
             
-            if not template:
+            if not flow_step:
                 # Não há template para este passo, finalizar sessão
                 session.status = 'completed'
-                session.completed_at = timezone.now()
-                session.save()
+                session.completed_at = now
                 self._log('info', f'Sessão finalizada - sem template para passo {session.current_step}', 
                          session=session)
                 return None
@@ -198,24 +619,24 @@ def _generate_automated_response(self, session: WhatsAppSession, incoming_messag
             }
             
             # Renderizar conteúdo do template
+            template = flow_step.template
             response_content = template.render_content(context_data)
             
-            # Criar mensagem de resposta
-            response_message = WhatsAppMessage.objects.create(
+            # Mensagem de resposta (gravada em lote); fluxos com desvios podem repetir um passo
+            response_message = WhatsAppMessage(
                 session=session,
-                message_id=f"auto_{session.session_id}_{int(time.time())}",
+                message_id=f"auto_{session.session_id}_{int(now.timestamp())}_{session.current_step}_{uuid.uuid4().hex[:6]}",
                 direction='outgoing',
                 message_type='text',
                 content=response_content,
-                timestamp=timezone.now(),
+                timestamp=now,
                 is_automated=True,
                 metadata={'template_id': template.id, 'template_name': template.name}
             )
             
-            # Atualizar sessão
-            session.current_step += 1
-            session.last_activity = timezone.now()
-            session.save()
+            # Avançar no fluxo; o passo enviado decide os desvios da próxima resposta
+            session.current_step = flow_step.next_step
+            session.context_data = {**session.context_data, 'last_step': flow_step.step}
             
             self._log('info', f'Resposta automática gerada: {template.name}', 
                      session=session, contact=session.contact)
@@ -228,12 +649,11 @@ def _generate_automated_response(self, session: WhatsAppSession, incoming_messag
                 'message_id': response_message.message_id
             }
             
-            return response_data
+            return response_message, response_data
             
         except Exception as e:
             session.status = 'error'
             session.error_message = str(e)
-            session.save()
             self._log('error', f'Erro ao gerar resposta automática: {str(e)}', 
                      session=session, metadata={'error': str(e)})
             return None
@@ -276,6 +696,7 @@ def block_contact(self, phone_number: str) -> bool:
                 status='active',
                 is_active=True
             ).update(status='paused')
+            invalidate_session_stats()
             
             self._log('info', f'Contato bloqueado: {phone_number}', contact=contact)
             return True
@@ -288,30 +709,35 @@ def block_contact(self, phone_number: str) -> bool:
                      metadata={'phone_number': phone_number, 'error': str(e)})
             return False
     
-    def get_session_stats(self) -> Dict[str, Any]:
-        """Obter estatísticas das sessões"""
+    def get_session_stats(self, use_cache: bool = True) -> Dict[str, Any]:
+        """Obter estatísticas das sessões (uma consulta agregada por tabela, em cache)"""
+        if use_cache:
+            stats = shared_cache().get(SESSION_STATS_CACHE_KEY)
+            if stats is not None:
+                return stats
+        
         try:
-            stats = {
-                'active_sessions': WhatsAppSession.objects.filter(status='active', is_active=True).count(),
-                'completed_sessions': WhatsAppSession.objects.filter(status='completed', is_active=True).count(),
-                'total_contacts': WhatsAppContact.objects.filter(is_active=True).count(),
-                'filtered_contacts': WhatsAppContact.objects.filter(
-                    is_my_contact=True, is_active=True
-                ).count(),
-                'blocked_contacts': WhatsAppContact.objects.filter(
-                    is_blocked=True, is_active=True
-                ).count(),
-                'messages_today': WhatsAppMessage.objects.filter(
-                    created_at__date=timezone.now().date(),
-                    is_active=True
-                ).count(),
-                'automated_messages_today': WhatsAppMessage.objects.filter(
-                    created_at__date=timezone.now().date(),
-                    is_automated=True,
-                    is_active=True
-                ).count()
-            }
+            today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+            
+            stats = WhatsAppSession.objects.filter(is_active=True).aggregate(
+                active_sessions=Count('id', filter=Q(status='active')),
+                completed_sessions=Count('id', filter=Q(status='completed')),
+            )
+            stats.update(WhatsAppContact.objects.filter(is_active=True).aggregate(
+                total_contacts=Count('id'),
+                filtered_contacts=Count('id', filter=Q(is_my_contact=True)),
+                blocked_contacts=Count('id', filter=Q(is_blocked=True)),
+            ))
+            # Intervalo a partir de 00:00 (usa o índice de created_at, ao contrário de __date)
+            stats.update(WhatsAppMessage.objects.filter(
+                created_at__gte=today_start,
+                is_active=True
+            ).aggregate(
+                messages_today=Count('id'),
+                automated_messages_today=Count('id', filter=Q(is_automated=True)),
+            ))
             
+            shared_cache().set(SESSION_STATS_CACHE_KEY, stats, SESSION_STATS_CACHE_TIMEOUT)
             return stats
             
         except Exception as e:
@@ -319,28 +745,66 @@ def get_session_stats(self) -> Dict[str, Any]:
             return {}
     
     def cleanup_old_sessions(self, days: int = 7) -> int:
-        """Limpar sessões antigas"""
+        """Inativar sessões sem atividade há `days` dias (em lotes)"""
         try:
-            cutoff_date = timezone.now() - timedelta(days=days)
-            
-            # Marcar sessões antigas como inativas
-            old_sessions = WhatsAppSession.objects.filter(
-                last_activity__lt=cutoff_date,
-                is_active=True
-            )
-            
-            count = old_sessions.count()
-            old_sessions.update(is_active=False)
-            
-            self._log('info', f'Limpeza realizada: {count} sessões antigas removidas')
-            return count
-            
-        except Exception as e:
-            self._log('error', f'Erro na limpeza de sessões: {str(e)}')
+            return self.apply_retention(['sessions'], days={'sessions': days}).get('sessions', 0)
+        except Exception:
             return 0
     
-    def send_message_via_api(self, phone_number: str, message: str, message_type: str = 'text') -> Dict[str, Any]:
-        """Enviar mensagem via WhatsApp Business API"""
+    def apply_retention(self, names: List[str] = None, days: Dict[str, int] = None,
+                        chunk_size: int = None, progress=None) -> Dict[str, int]:
+        """Aplicar as políticas de retenção (core.whatsapp_retention); erros são registrados e propagados"""
+        try:
+            results = run_retention(names, days=days, chunk_size=chunk_size, progress=progress)
+        except Exception as e:
+            self._log('error', f'Erro na limpeza de dados: {str(e)}')
+            # Lotes já confirmados mudaram as contagens
+            invalidate_session_stats()
+            raise
+        invalidate_session_stats()
+        
+        summary = ', '.join(f'{name}: {count}' for name, count in results.items())
+        self._log('info', f'Limpeza realizada ({summary})', metadata=results)
+        return results
+    
+    @staticmethod
+    def text_payload(phone_number: str, message: str, message_type: str = 'text') -> Dict[str, Any]:
+        """Payload da Graph API para mensagem de texto"""
+        return {
+            'messaging_product': 'whatsapp',
+            'to': phone_number,
+            'type': message_type,
+            'text': {
+                'body': message
+            }
+        }
+    
+    @staticmethod
+    def template_payload(phone_number: str, template_name: str, language_code: str = 'pt_BR',
+                         parameters: List[str] = None) -> Dict[str, Any]:
+        """Payload da Graph API para mensagem template"""
+        components = []
+        if parameters:
+            components.append({
+                'type': 'body',
+                'parameters': [{'type': 'text', 'text': param} for param in parameters]
+            })
+        return {
+            'messaging_product': 'whatsapp',
+            'to': phone_number,
+            'type': 'template',
+            'template': {
+                'name': template_name,
+                'language': {
+                    'code': language_code
+                },
+                'components': components
+            }
+        }
+    
+    def send_message_via_api(self, phone_number: str, message: str, message_type: str = 'text',
+                             max_wait: float = None) -> Dict[str, Any]:
+        """Enviar mensagem via WhatsApp Business API (`max_wait`: espera máxima no limitador)"""
         try:
             # Obter configurações da API
             access_token = self._get_config('whatsapp_access_token')
@@ -352,37 +816,17 @@ def send_message_via_api(self, phone_number: str, message: str, message_type: st
                     'error': 'Configurações da API não encontradas'
                 }
             
-            # Preparar URL da API
-            url = f"https://graph.facebook.com/v18.0/{phone_number_id}/messages"
-            
-            # Preparar headers
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Preparar payload
-            payload = {
-                'messaging_product': 'whatsapp',
-                'to': phone_number,
-                'type': message_type,
-                'text': {
-                    'body': message
-                }
-            }
+            payload = self.text_payload(phone_number, message, message_type)
             
-            # Fazer requisição
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            # Fazer requisição (sessão compartilhada com keep-alive e novas tentativas)
+            response = whatsapp_http.post(f"{phone_number_id}/messages", access_token, payload, max_wait)
             
             if response.status_code == 200:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id')
                 
                 # Registrar mensagem enviada
-                contact, _ = WhatsAppContact.objects.get_or_create(
-                    phone_number=phone_number,
-                    defaults={'is_my_contact': False, 'is_blocked': False}
-                )
+                contact = self._resolve_contacts({phone_number: ''})[phone_number]
                 
                 session = self._get_or_create_session(contact)
                 
@@ -429,8 +873,9 @@ def send_message_via_api(self, phone_number: str, message: str, message_type: st
                 'error': error_msg
             }
     
-    def send_template_message(self, phone_number: str, template_name: str, language_code: str = 'pt_BR', parameters: List[str] = None) -> Dict[str, Any]:
-        """Enviar mensagem template via WhatsApp Business API"""
+    def send_template_message(self, phone_number: str, template_name: str, language_code: str = 'pt_BR',
+                              parameters: List[str] = None, max_wait: float = None) -> Dict[str, Any]:
+        """Enviar mensagem template via WhatsApp Business API (`max_wait`: espera máxima no limitador)"""
         try:
             # Obter configurações da API
             access_token = self._get_config('whatsapp_access_token')
@@ -442,49 +887,17 @@ def send_template_message(self, phone_number: str, template_name: str, language_
                     'error': 'Configurações da API não encontradas'
                 }
             
-            # Preparar URL da API
-            url = f"https://graph.facebook.com/v18.0/{phone_number_id}/messages"
+            payload = self.template_payload(phone_number, template_name, language_code, parameters)
             
-            # Preparar headers
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Preparar componentes do template
-            components = []
-            if parameters:
-                components.append({
-                    'type': 'body',
-                    'parameters': [{'type': 'text', 'text': param} for param in parameters]
-                })
-            
-            # Preparar payload
-            payload = {
-                'messaging_product': 'whatsapp',
-                'to': phone_number,
-                'type': 'template',
-                'template': {
-                    'name': template_name,
-                    'language': {
-                        'code': language_code
-                    },
-                    'components': components
-                }
-            }
-            
-            # Fazer requisição
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            # Fazer requisição (sessão compartilhada com keep-alive e novas tentativas)
+            response = whatsapp_http.post(f"{phone_number_id}/messages", access_token, payload, max_wait)
             
             if response.status_code == 200:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id')
                 
                 # Registrar mensagem enviada
-                contact, _ = WhatsAppContact.objects.get_or_create(
-                    phone_number=phone_number,
-                    defaults={'is_my_contact': False, 'is_blocked': False}
-                )
+                contact = self._resolve_contacts({phone_number: ''})[phone_number]
                 
                 session = self._get_or_create_session(contact)
                 
@@ -542,31 +955,43 @@ class WhatsAppWebhookHandler:
     def __init__(self):
         self.chatbot_service = WhatsAppChatbotService()
     
-    def handle_webhook(self, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Processar webhook recebido"""
+    def handle_webhook(self, webhook_data: Dict[str, Any], dedupe: bool = True) -> Dict[str, Any]:
+        """
+        Processar webhook recebido (todas as mensagens do lote).
+        `dedupe=False` pula a checagem no cache (payloads já filtrados ao enfileirar).
+        """
         try:
             # Validar estrutura do webhook
             if not self._validate_webhook(webhook_data):
                 return {'status': 'error', 'message': 'Webhook inválido'}
             
-            # Extrair dados da mensagem
-            message_data = self._extract_message_data(webhook_data)
+            # Extrair dados das mensagens
+            messages = self._extract_messages(webhook_data)
             
-            if not message_data:
+            if not messages:
                 return {'status': 'ignored', 'message': 'Nenhuma mensagem para processar'}
             
-            # Processar mensagem
-            response = self.chatbot_service.process_incoming_message(message_data)
+            # Reenvios já processados custam apenas a consulta ao cache
+            if dedupe:
+                messages = self._drop_seen(messages)
+            if not messages:
+                return {'status': 'duplicate', 'message': 'Mensagens já processadas'}
+            
+            # Processar mensagens
+            responses = self.chatbot_service.process_incoming_batch(messages)
             
-            if response:
+            if responses:
                 return {
                     'status': 'success',
-                    'response': response,
-                    'message': 'Mensagem processada com sucesso'
+                    'response': responses[0],
+                    'responses': responses,
+                    'received': len(messages),
+                    'message': 'Mensagens processadas com sucesso'
                 }
             else:
                 return {
                     'status': 'filtered',
+                    'received': len(messages),
                     'message': 'Mensagem filtrada ou chatbot inativo'
                 }
                 
@@ -579,39 +1004,279 @@ def _validate_webhook(self, data: Dict[str, Any]) -> bool:
         required_fields = ['entry']
         return all(field in data for field in required_fields)
     
-    def _extract_message_data(self, webhook_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Extrair dados da mensagem do webhook"""
-        try:
-            entry = webhook_data.get('entry', [])
-            if not entry:
-                return None
-            
-            changes = entry[0].get('changes', [])
-            if not changes:
-                return None
-            
-            value = changes[0].get('value', {})
-            messages = value.get('messages', [])
-            
-            if not messages:
-                return None
-            
-            message = messages[0]
-            
-            return {
-                'id': message.get('id'),
-                'from': message.get('from'),
-                'timestamp': message.get('timestamp'),
-                'type': message.get('type', 'text'),
-                'body': message.get('text', {}).get('body', '') if message.get('type') == 'text' else '',
-                'raw_data': message
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao extrair dados da mensagem: {e}")
-            return None
+    def _drop_seen(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Remover mensagens cujo message_id já foi processado"""
+        new_ids = set(seen_message_ids.filter_new([m['id'] for m in messages if m.get('id')]))
+        return [m for m in messages if not m.get('id') or m['id'] in new_ids]
+    
+    def _extract_messages(self, webhook_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Extrair todas as mensagens de todos os entries/changes do webhook"""
+        messages = []
+        for entry in webhook_data.get('entry', []) or []:
+            for change in entry.get('changes', []) or []:
+                value = change.get('value', {}) or {}
+                
+                # Nome do perfil enviado pelo WhatsApp junto com as mensagens
+                profile_names = {
+                    contact.get('wa_id'): contact.get('profile', {}).get('name', '')
+                    for contact in value.get('contacts', []) or []
+                }
+                
+                for message in value.get('messages', []) or []:
+                    try:
+                        messages.append({
+                            'id': message.get('id'),
+                            'from': message.get('from'),
+                            'timestamp': message.get('timestamp'),
+                            'type': message.get('type', 'text'),
+                            'body': message.get('text', {}).get('body', '') if message.get('type') == 'text' else '',
+                            'profile_name': profile_names.get(message.get('from'), ''),
+                            'raw_data': message
+                        })
+                    except Exception as e:
+                        logger.error(f"Erro ao extrair dados da mensagem: {e}")
+        return messages
 
 
 # Instância global do serviço
 whatsapp_service = WhatsAppChatbotService()
-webhook_handler = WhatsAppWebhookHandler()
\ No newline at end of file
+webhook_handler = WhatsAppWebhookHandler()
+
+
+# ===== FILA DE WEBHOOKS (python manage.py process_whatsapp_webhooks) =====
+
+def enqueue_webhook(webhook_data: Dict[str, Any]) -> Optional[WhatsAppWebhookEvent]:
+    """
+    Gravar o payload recebido para processamento pelo worker.
+    Devolve None para reenvios cujas mensagens já foram recebidas por este
+    processo; reenvios aceitos por outro worker são descartados no processamento.
+    """
+    message_ids = [m['id'] for m in webhook_handler._extract_messages(webhook_data) if m.get('id')]
+    if message_ids and not seen_message_ids.filter_new(message_ids):
+        return None
+    
+    event = WhatsAppWebhookEvent.objects.create(payload=webhook_data)
+    # O payload já está na fila: reenvios do mesmo lote não precisam ser gravados de novo
+    seen_message_ids.mark_on_commit(message_ids)
+    return event
+
+
+def release_stale_webhooks() -> int:
+    """Devolver à fila eventos presos em 'processing' (worker encerrado no meio)"""
+    return WhatsAppWebhookEvent.objects.filter(
+        status='processing',
+        locked_at__lt=timezone.now() - timedelta(seconds=WEBHOOK_LOCK_TIMEOUT)
+    ).update(status='pending', claim_token='')
+
+
+def claim_webhook_events(limit: int = None) -> List[WhatsAppWebhookEvent]:
+    """Reservar um lote de eventos pendentes (seguro com vários workers)"""
+    candidates = list(
+        WhatsAppWebhookEvent.objects.filter(status='pending')
+        .order_by('received_at')
+        .values_list('pk', flat=True)[:limit or WEBHOOK_BATCH_SIZE]
+    )
+    if not candidates:
+        return []
+    
+    token = uuid.uuid4().hex
+    WhatsAppWebhookEvent.objects.filter(pk__in=candidates, status='pending').update(
+        status='processing',
+        claim_token=token,
+        locked_at=timezone.now()
+    )
+    return list(WhatsAppWebhookEvent.objects.filter(claim_token=token).order_by('received_at'))
+
+
+def process_webhook_event(event: WhatsAppWebhookEvent) -> WhatsAppWebhookEvent:
+    """Processar um evento da fila; falhas voltam à fila até WEBHOOK_MAX_ATTEMPTS"""
+    event.attempts += 1
+    try:
+        result = webhook_handler.handle_webhook(event.payload, dedupe=False)
+        if result.get('status') == 'error':
+            raise RuntimeError(result.get('message', 'Erro ao processar webhook'))
+        event.status = 'done'
+        event.error_message = ''
+        event.processed_at = timezone.now()
+    except Exception as e:
+        logger.error(f"Erro ao processar webhook {event.pk}: {e}")
+        event.status = 'failed' if event.attempts >= WEBHOOK_MAX_ATTEMPTS else 'pending'
+        event.error_message = str(e)
+    
+    event.claim_token = ''
+    event.save(update_fields=['status', 'attempts', 'error_message', 'processed_at', 'claim_token'])
+    return event
+
+
+# ===== FILA DE ENVIOS AGENDADOS =====
+
+def schedule_message(phone_number: str, payload: Dict[str, Any], delay: int = 0,
+                     message: WhatsAppMessage = None) -> WhatsAppOutboundMessage:
+    """Agendar um envio para daqui a `delay` segundos"""
+    return WhatsAppOutboundMessage.objects.create(
+        message=message,
+        phone_number=phone_number,
+        payload=payload,
+        due_at=timezone.now() + timedelta(seconds=delay or 0)
+    )
+
+
+def schedule_responses(messages: List[WhatsAppMessage], responses: List[Dict[str, Any]], now: datetime) -> None:
+    """Agendar as respostas automáticas geradas em um lote (um bulk_create)"""
+    if not messages:
+        return
+    if any(message.pk is None for message in messages):
+        # Bancos sem RETURNING: recuperar as chaves pelo message_id
+        ids = dict(WhatsAppMessage.objects.filter(
+            message_id__in=[message.message_id for message in messages]
+        ).values_list('message_id', 'id'))
+        for message in messages:
+            message.pk = ids[message.message_id]
+    
+    WhatsAppOutboundMessage.objects.bulk_create([
+        WhatsAppOutboundMessage(
+            message=message,
+            phone_number=response['to'],
+            payload=WhatsAppChatbotService.text_payload(response['to'], response['body']),
+            due_at=now + timedelta(seconds=response.get('delay') or 0)
+        )
+        for message, response in zip(messages, responses)
+    ])
+
+
+def release_stale_outbound() -> int:
+    """Devolver à fila envios presos em 'sending' (worker encerrado no meio)"""
+    return WhatsAppOutboundMessage.objects.filter(
+        status='sending',
+        locked_at__lt=timezone.now() - timedelta(seconds=OUTBOUND_LOCK_TIMEOUT)
+    ).update(status='pending', claim_token='')
+
+
+def claim_due_outbound(limit: int = None) -> List[WhatsAppOutboundMessage]:
+    """Reservar um lote de envios vencidos (seguro com vários workers)"""
+    now = timezone.now()
+    candidates = list(
+        WhatsAppOutboundMessage.objects.filter(status='pending', due_at__lte=now)
+        .order_by('due_at')
+        .values_list('pk', flat=True)[:limit or OUTBOUND_BATCH_SIZE]
+    )
+    if not candidates:
+        return []
+    
+    token = uuid.uuid4().hex
+    WhatsAppOutboundMessage.objects.filter(pk__in=candidates, status='pending').update(
+        status='sending',
+        claim_token=token,
+        locked_at=now
+    )
+    return list(
+        WhatsAppOutboundMessage.objects.filter(claim_token=token)
+        .select_related('message')
+        .order_by('due_at')
+    )
+
+
+def _retry_or_fail(delivery: WhatsAppOutboundMessage, error: str, retryable: bool, now: datetime) -> None:
+    delivery.error_message = error
+    if retryable and delivery.attempts < OUTBOUND_MAX_ATTEMPTS:
+        delivery.status = 'pending'
+        delivery.due_at = now + timedelta(seconds=OUTBOUND_RETRY_DELAY * 2 ** (delivery.attempts - 1))
+    else:
+        delivery.status = 'failed'
+
+
+def _response_message_id(response) -> Optional[str]:
+    """wamid da resposta da Graph API (None se o corpo não tiver o formato esperado)"""
+    try:
+        return response.json()['messages'][0]['id']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def _deliver(delivery: WhatsAppOutboundMessage, phone_number_id: str, access_token: str,
+             now: datetime) -> Optional[WhatsAppMessage]:
+    """Enviar uma mensagem agendada; devolve a WhatsAppMessage a atualizar quando enviada"""
+    if not access_token or not phone_number_id:
+        _retry_or_fail(delivery, 'Configurações da API não encontradas', True, now)
+        return None
+    try:
+        response = whatsapp_http.post(f"{phone_number_id}/messages", access_token, delivery.payload)
+    except requests.exceptions.RequestException as e:
+        _retry_or_fail(delivery, f"Erro de conexão: {str(e)}", True, now)
+        return None
+    if response.status_code != 200:
+        retryable = response.status_code == 429 or response.status_code >= 500
+        _retry_or_fail(delivery, f"Erro na API: {response.status_code} - {response.text}", retryable, now)
+        return None
+    
+    # Aceita pela API: conta como enviada mesmo que o corpo não seja o esperado
+    delivery.status = 'sent'
+    delivery.error_message = ''
+    delivery.sent_at = now
+    if delivery.message is None:
+        return None
+    delivery.message.metadata = {
+        **(delivery.message.metadata or {}),
+        'api_message_id': _response_message_id(response),
+        'sent_at': now.isoformat(),
+    }
+    return delivery.message
+
+
+def _save_delivery(delivery: WhatsAppOutboundMessage, message: Optional[WhatsAppMessage]) -> None:
+    """
+    Gravar o resultado de um envio assim que ele termina e renovar o
+    heartbeat (locked_at) do restante do lote, para que release_stale_outbound
+    não devolva à fila envios ainda em andamento e uma queda no meio do lote
+    não repita os que já foram entregues.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        WhatsAppOutboundMessage.objects.filter(pk=delivery.pk).update(
+            status=delivery.status,
+            attempts=delivery.attempts,
+            due_at=delivery.due_at,
+            error_message=delivery.error_message,
+            sent_at=delivery.sent_at,
+            claim_token='',
+            locked_at=now
+        )
+        if message is not None:
+            message.save(update_fields=['metadata'])
+    if delivery.claim_token:
+        WhatsAppOutboundMessage.objects.filter(
+            claim_token=delivery.claim_token,
+            status='sending'
+        ).update(locked_at=now)
+    delivery.claim_token = ''
+
+
+def dispatch_outbound(deliveries: List[WhatsAppOutboundMessage]) -> Tuple[int, int]:
+    """
+    Enviar um lote reservado pela Graph API, gravando cada resultado logo
+    após o envio. Erros 4xx (exceto 429) não são repetidos.
+    """
+    access_token = whatsapp_service._get_config('whatsapp_access_token')
+    phone_number_id = whatsapp_service._get_config('whatsapp_phone_number_id')
+    sent = failed = 0
+    
+    for delivery in deliveries:
+        delivery.attempts += 1
+        now = timezone.now()
+        message = None
+        try:
+            message = _deliver(delivery, phone_number_id, access_token, now)
+        except Exception as e:
+            # Falha antes da resposta da API (payload, limitador...): tentar de novo no próximo ciclo
+            logger.error(f"Erro inesperado no envio agendado {delivery.pk}: {e}")
+            _retry_or_fail(delivery, f"Erro inesperado: {str(e)}", True, now)
+        
+        _save_delivery(delivery, message)
+        if delivery.status == 'sent':
+            sent += 1
+        elif delivery.status == 'failed':
+            failed += 1
+            whatsapp_service._log('error', f'Envio agendado {delivery.pk} falhou: {delivery.error_message}',
+                                  metadata={'phone_number': delivery.phone_number})
+    
+    return sent, failed
@@ -15,12 +15,14 @@
 from django.views import View
 from django.views.generic import TemplateView
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db.models import Count
 from django.conf import settings
 
-from .whatsapp_service import whatsapp_service, webhook_handler
+from .whatsapp_archive import session_history
+from .whatsapp_contacts import approximate_count, contact_page, search_contacts
+from .whatsapp_http import API_RATE_WEB_MAX_WAIT, rate_limiter
+from .whatsapp_service import WEBHOOK_ASYNC, enqueue_webhook, whatsapp_service, webhook_handler
 from .models import (
     WhatsAppContact, WhatsAppSession, WhatsAppMessage, 
     WhatsAppTemplate, WhatsAppConfig, WhatsAppLog
@@ -74,6 +76,17 @@ def post(self, request):
             # Parse do JSON
             webhook_data = json.loads(request.body.decode('utf-8'))
             
+            if WEBHOOK_ASYNC:
+                # Modo fila: validar, gravar o payload e responder imediatamente
+                if not webhook_handler._validate_webhook(webhook_data):
+                    return JsonResponse({'status': 'error', 'message': 'Webhook inválido'}, status=400)
+                
+                event = enqueue_webhook(webhook_data)
+                if event is None:
+                    return JsonResponse({'status': 'duplicate'}, status=200)
+                logger.debug(f"Webhook {event.pk} enfileirado")
+                return JsonResponse({'status': 'queued', 'event_id': event.pk}, status=200)
+            
             # Log do webhook recebido
             logger.info(f"Webhook recebido: {json.dumps(webhook_data, indent=2)}")
             
@@ -119,6 +132,7 @@ def get(self, request):
             # Preparar dados para resposta
             dashboard_data = {
                 'stats': stats,
+                'rate_limiter': rate_limiter.stats(),
                 'recent_sessions': [
                     {
                         'id': session.id,
@@ -188,24 +202,24 @@ class WhatsAppContactsView(View):
     """Gerenciamento de contatos"""
     
     def get(self, request):
-        """Listar contatos com filtros"""
+        """
+        Listar contatos com filtros (paginação por cursor: ?cursor=<next_cursor>).
+        ?search com número busca pelo início do telefone (com ou sem DDI) e, se
+        nada for encontrado, por trecho do telefone ou do nome; texto busca no
+        nome e no telefone
+        """
         try:
             # Parâmetros de filtro
-            page = int(request.GET.get('page', 1))
-            per_page = min(int(request.GET.get('per_page', 20)), 100)
+            cursor = request.GET.get('cursor') or None
+            per_page = max(min(int(request.GET.get('per_page', 20)), 100), 1)
             search = request.GET.get('search', '')
             filter_type = request.GET.get('filter', 'all')  # all, my_contacts, blocked, active
+            with_total = request.GET.get('count') in ('1', 'true')
             
             # Query base
             contacts = WhatsAppContact.objects.filter(is_active=True)
             
-            # Aplicar filtros
-            if search:
-                contacts = contacts.filter(
-                    Q(phone_number__icontains=search) | 
-                    Q(name__icontains=search)
-                )
-            
+            # Aplicar filtros (a busca por último: o fallback confere o prefixo já filtrado)
             if filter_type == 'my_contacts':
                 contacts = contacts.filter(is_my_contact=True)
             elif filter_type == 'blocked':
@@ -213,12 +227,13 @@ def get(self, request):
             elif filter_type == 'active':
                 contacts = contacts.filter(is_my_contact=False, is_blocked=False)
             
-            # Ordenar
-            contacts = contacts.order_by('-updated_at')
+            contacts = search_contacts(contacts, search)
             
             # Paginação
-            paginator = Paginator(contacts, per_page)
-            page_obj = paginator.get_page(page)
+            try:
+                page, next_cursor = contact_page(contacts, cursor, per_page)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
             
             # Preparar dados
             contacts_data = [
@@ -231,18 +246,22 @@ def get(self, request):
                     'created_at': contact.created_at.isoformat(),
                     'updated_at': contact.updated_at.isoformat()
                 }
-                for contact in page_obj
+                for contact in page
             ]
             
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None,
+                'has_previous': cursor is not None
+            }
+            if with_total:
+                # Total aproximado (em cache por alguns segundos)
+                pagination['total_items'] = approximate_count(contacts, search.strip(), filter_type)
+            
             return JsonResponse({
                 'contacts': contacts_data,
-                'pagination': {
-                    'current_page': page_obj.number,
-                    'total_pages': paginator.num_pages,
-                    'total_items': paginator.count,
-                    'has_next': page_obj.has_next(),
-                    'has_previous': page_obj.has_previous()
-                }
+                'pagination': pagination
             })
             
         except Exception as e:
@@ -313,6 +332,8 @@ def get(self, request):
                     'step_number': template.step_number,
                     'content': template.content,
                     'delay_seconds': template.delay_seconds,
+                    'next_step': template.next_step,
+                    'transitions': template.transitions,
                     'is_active': template.is_active,
                     'created_at': template.created_at.isoformat()
                 }
@@ -335,6 +356,11 @@ def post(self, request):
             step_number = data.get('step_number', 0)
             content = data.get('content', '').strip()
             delay_seconds = data.get('delay_seconds', 5)
+            next_step = data.get('next_step')
+            transitions = data.get('transitions') or {}
+            
+            if not isinstance(transitions, dict):
+                return JsonResponse({'error': 'transitions deve ser um objeto {"palavra": passo}'}, status=400)
             
             if not name or not content:
                 return JsonResponse({'error': 'Nome e conteúdo são obrigatórios'}, status=400)
@@ -346,6 +372,8 @@ def post(self, request):
                 template.step_number = step_number
                 template.content = content
                 template.delay_seconds = delay_seconds
+                template.next_step = next_step
+                template.transitions = transitions
                 template.save()
                 created = False
             else:
@@ -354,7 +382,9 @@ def post(self, request):
                     name=name,
                     step_number=step_number,
                     content=content,
-                    delay_seconds=delay_seconds
+                    delay_seconds=delay_seconds,
+                    next_step=next_step,
+                    transitions=transitions
                 )
                 created = True
             
@@ -366,6 +396,8 @@ def post(self, request):
                     'step_number': template.step_number,
                     'content': template.content,
                     'delay_seconds': template.delay_seconds,
+                    'next_step': template.next_step,
+                    'transitions': template.transitions,
                     'created': created
                 }
             })
@@ -461,6 +493,21 @@ def whatsapp_cleanup(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@require_http_methods(["GET"])
+@login_required
+def whatsapp_session_history(request, session_id):
+    """Histórico da sessão, incluindo as mensagens do arquivo frio (?logs=1 inclui os logs)"""
+    try:
+        history = session_history(session_id, include_logs=request.GET.get('logs') in ('1', 'true'))
+        if not history['messages'] and not WhatsAppSession.objects.filter(pk=session_id).exists():
+            return JsonResponse({'error': 'Sessão não encontrada'}, status=404)
+        return JsonResponse(history)
+        
+    except Exception as e:
+        logger.error(f"Erro ao obter histórico da sessão {session_id}: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @method_decorator(login_required, name='dispatch')
 class WhatsAppSendMessageView(View):
     """View para envio de mensagens via interface web"""
@@ -491,7 +538,8 @@ def post(self, request):
                 result = whatsapp_service.send_template_message(
                     phone_number=phone_number,
                     template_name=template_name,
-                    parameters=parameters
+                    parameters=parameters,
+                    max_wait=API_RATE_WEB_MAX_WAIT
                 )
             else:
                 # Enviar mensagem de texto
@@ -503,7 +551,8 @@ def post(self, request):
                 
                 result = whatsapp_service.send_message_via_api(
                     phone_number=phone_number,
-                    message=message
+                    message=message,
+                    max_wait=API_RATE_WEB_MAX_WAIT
                 )
             
             return JsonResponse(result)
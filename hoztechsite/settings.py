@@ -119,6 +119,7 @@
     'core.admin_middleware.AdminPerformanceMiddleware', # Middleware de performance do admin
     'core.middleware.AdminLoginErrorMiddleware',      # Middleware para erros de login no admin
     'core.auth_middleware.AdminLoginRedirectMiddleware', # Middleware para redirecionamento após login
+    'core.middleware.AnalyticsTrackingMiddleware',    # Registro de acessos (gravação em lote)
 ]
 
 # Adicionar middleware CSP apenas em produção
@@ -306,6 +307,20 @@ def whitenoise_headers(headers, path, url):
     }
 }
 
+# Cache compartilhado entre workers e comandos (limitador de taxa e versões dos
+# caches do WhatsApp, ver core.config_cache.shared_cache). Sem REDIS_URL esses
+# recursos ficam restritos a cada processo
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -416,11 +431,52 @@ def whitenoise_headers(headers, path, url):
 LOGIN_URL = '/admin/login/'
 
 
+# Analytics - registro de acessos em lote (core.middleware.AnalyticsTrackingMiddleware)
+ANALYTICS_TRACKING_ENABLED = os.getenv('ANALYTICS_TRACKING_ENABLED', 'True').lower() == 'true'
+ANALYTICS_TRACKING_FLUSH_SIZE = int(os.getenv('ANALYTICS_TRACKING_FLUSH_SIZE', '200'))
+ANALYTICS_TRACKING_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_TRACKING_FLUSH_INTERVAL', '5'))
+
+
 # WhatsApp Business API Settings
 WHATSAPP_ACCESS_TOKEN = os.getenv('WHATSAPP_ACCESS_TOKEN')
 WHATSAPP_PHONE_NUMBER_ID = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
 WHATSAPP_BUSINESS_ACCOUNT_ID = os.getenv('WHATSAPP_BUSINESS_ACCOUNT_ID')
 WHATSAPP_APP_SECRET = os.getenv('WHATSAPP_APP_SECRET')
+# Webhooks gravados em fila e processados por python manage.py process_whatsapp_webhooks
+# (a deduplicação de reenvios no cache vale por processo com o LocMemCache acima;
+# entre workers quem garante é o índice único de WhatsAppMessage.message_id)
+WHATSAPP_WEBHOOK_ASYNC = os.getenv('WHATSAPP_WEBHOOK_ASYNC', 'False').lower() == 'true'
+# Cache por processo de WhatsAppConfig.get_value (is_active, access token...): a mudança
+# no admin chega aos outros workers pelo cache 'shared' (REDIS_URL), conferido a cada
+# CHECK_INTERVAL s; sem ele, só quando o TTL vence
+WHATSAPP_CONFIG_CACHE_TTL = int(os.getenv('WHATSAPP_CONFIG_CACHE_TTL', '60'))  # segundos
+WHATSAPP_CONFIG_CACHE_CHECK_INTERVAL = int(os.getenv('WHATSAPP_CONFIG_CACHE_CHECK_INTERVAL', '5'))  # segundos
+# Caches por processo de contatos (bloqueio, is_my_contact) e do fluxo de templates:
+# salvar no painel invalida os outros workers pelo cache 'shared' (REDIS_URL); sem ele
+# a mudança só chega aos outros processos quando o TTL abaixo vence
+WHATSAPP_CONTACT_CACHE_TTL = int(os.getenv('WHATSAPP_CONTACT_CACHE_TTL', '300'))  # segundos
+WHATSAPP_TEMPLATE_CACHE_TTL = int(os.getenv('WHATSAPP_TEMPLATE_CACHE_TTL', '300'))  # segundos
+# Cliente HTTP da Graph API (core.whatsapp_http)
+WHATSAPP_API_BASE_URL = os.getenv('WHATSAPP_API_BASE_URL', 'https://graph.facebook.com/v18.0')
+WHATSAPP_API_CONNECT_TIMEOUT = float(os.getenv('WHATSAPP_API_CONNECT_TIMEOUT', '3.05'))
+WHATSAPP_API_READ_TIMEOUT = float(os.getenv('WHATSAPP_API_READ_TIMEOUT', '10'))
+WHATSAPP_API_MAX_RETRIES = int(os.getenv('WHATSAPP_API_MAX_RETRIES', '3'))
+# req/s somando os workers quando o cache 'shared' (REDIS_URL) existe; sem ele cada
+# processo usa WHATSAPP_API_RATE_LIMIT / WHATSAPP_API_RATE_PROCESSES (workers do
+# gunicorn + comandos broadcast_whatsapp/send_scheduled_whatsapp em paralelo)
+WHATSAPP_API_RATE_LIMIT = float(os.getenv('WHATSAPP_API_RATE_LIMIT', '50'))
+WHATSAPP_API_RATE_PROCESSES = int(os.getenv(
+    'WHATSAPP_API_RATE_PROCESSES', str(int(os.getenv('WEB_CONCURRENCY', '4')) + 2)
+))
+WHATSAPP_API_RATE_WEB_MAX_WAIT = float(os.getenv('WHATSAPP_API_RATE_WEB_MAX_WAIT', '2'))  # s, envio pela interface
+# Broadcast (python manage.py broadcast_whatsapp)
+WHATSAPP_BROADCAST_RATE = float(os.getenv('WHATSAPP_BROADCAST_RATE', '20'))
+WHATSAPP_BROADCAST_WORKERS = int(os.getenv('WHATSAPP_BROADCAST_WORKERS', '8'))
+# Retenção (python manage.py whatsapp_chatbot cleanup): exclusões de linhas antigas são opt-in
+WHATSAPP_RETENTION_DELETE_ENABLED = os.getenv('WHATSAPP_RETENTION_DELETE_ENABLED', 'False').lower() == 'true'
+# Arquivo frio de mensagens e logs antigos (core.whatsapp_archive); use um volume persistente
+WHATSAPP_ARCHIVE_ENABLED = os.getenv('WHATSAPP_ARCHIVE_ENABLED', 'False').lower() == 'true'
+WHATSAPP_ARCHIVE_ROOT = os.getenv('WHATSAPP_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive', 'whatsapp'))
 
 # Stripe Payment Settings
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')